@@ -2,7 +2,9 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from config import Config
+from sqlalchemy import event
+from config import config_by_name
+from app.cache import LRUCache
 import os
 
 # Initialize SQLAlchemy instance for database operations
@@ -14,12 +16,12 @@ bcrypt = Bcrypt()
 # Initialize LoginManager instance for handling user login
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config_class=None):
     # Create an instance of the Flask application
     app = Flask(__name__)
 
-    # Configure the application with settings from the Config class
-    app.config.from_object(Config)
+    # Configure the application with settings from the given config class, or the one named by APP_CONFIG
+    app.config.from_object(config_class or config_by_name[os.environ.get('APP_CONFIG', 'default')])
 
     # Create the instance folder if it does not exist
     os.makedirs(app.instance_path, exist_ok=True)
@@ -27,6 +29,9 @@ def create_app():
     # Initialize the database with the application instance
     db.init_app(app)
 
+    # Apply the config's SQLite pragmas (if any) to every new database connection
+    configure_sqlite_pragmas(app)
+
     # Initialize the Bcrypt instance with the application for password hashing
     bcrypt.init_app(app)
 
@@ -39,6 +44,46 @@ def create_app():
     # Set the message category for flash messages when users are redirected to the login page
     login_manager.login_message_category = 'info'
 
+    # Caches for converted recipe lines and per-user tool lists, shared by all requests to this app
+    app.extensions['recipe_cache'] = LRUCache(maxsize=app.config['RECIPE_CACHE_SIZE'])
+    app.extensions['tool_cache'] = LRUCache(maxsize=app.config['TOOL_CACHE_SIZE'])
+
+    # Per-status counts for the admin list views
+    app.extensions['admin_count_cache'] = LRUCache(maxsize=64)
+
+    # Snapshots of signed-in users served by the user_loader
+    app.extensions['identity_cache'] = LRUCache(maxsize=app.config['IDENTITY_CACHE_SIZE'])
+
+    # Home page context: the site-wide summary plus one entry per recently active user
+    app.extensions['home_cache'] = LRUCache(maxsize=app.config['HOME_CACHE_SIZE'])
+
+    # Admin dashboard charts, redrawn only when the metric rollups change
+    app.extensions['dashboard_chart_cache'] = LRUCache(maxsize=16)
+
+    # In-memory challenge rankings, updated as progress changes
+    from app.leaderboard import LeaderboardService
+    app.extensions['leaderboard'] = LeaderboardService(max_age=app.config['LEADERBOARD_MAX_AGE'])
+
+    # Background thumbnailing of uploaded images on a bounded process pool
+    from app.images import ImagePipeline, image_sources
+    app.extensions['image_pipeline'] = ImagePipeline(app, max_workers=app.config['IMAGE_PIPELINE_WORKERS'],
+                                                     max_pending=app.config['IMAGE_PIPELINE_MAX_PENDING'])
+
+    # Resized variants of each image found on disk, used by templates to build srcset attributes
+    app.extensions['image_variant_cache'] = LRUCache(maxsize=app.config['IMAGE_VARIANT_CACHE_SIZE'])
+    app.add_template_global(image_sources)
+
+    # Fingerprinted static URLs served with immutable caching, and precompressed CSS/JS where built
+    from app.assets import add_static_fingerprint, send_static
+    app.extensions['asset_fingerprints'] = LRUCache(maxsize=app.config['ASSET_FINGERPRINT_CACHE_SIZE'])
+    app.url_defaults(add_static_fingerprint)
+    app.view_functions['static'] = send_static
+
+    # Password hashing on a bounded thread pool, turning requests away when it is saturated
+    from app.passwords import PasswordHasher
+    app.extensions['password_hasher'] = PasswordHasher(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                                       max_pending=app.config['PASSWORD_HASH_MAX_PENDING'])
+
     # Import user and admin blueprints from the respective modules
     from app.user_routes import user  # User-related routes and functionality
     from app.admin_routes import admin  # Admin-related routes and functionality
@@ -49,11 +94,40 @@ def create_app():
     # Register the admin blueprint with a URL prefix of '/admin'
     app.register_blueprint(admin, url_prefix='/admin')
 
+    # Register maintenance commands for the Flask CLI
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Start the in-process challenge settlement scheduler if enabled
+    if app.config['SETTLEMENT_SCHEDULER_ENABLED']:
+        from app.settlement import SettlementScheduler
+        scheduler = SettlementScheduler(app, refresh_interval=app.config['SETTLEMENT_REFRESH_SECONDS'])
+        app.extensions['settlement_scheduler'] = scheduler
+        scheduler.start()
+
     # Return the created application instance
     return app
 
-# User loader function for Flask-Login
+# Register an engine event that runs the configured PRAGMA statements on each new SQLite connection
+def configure_sqlite_pragmas(app):
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+# User loader function for Flask-Login: a short-lived cached snapshot rather than a query per request
 @login_manager.user_loader
 def load_user(user_id):
-    from app.models import User
-    return User.query.get(int(user_id))
+    from app.identity import load_identity
+    return load_identity(int(user_id))
@@ -1,14 +1,50 @@
 from datetime import datetime, timezone
-from flask import Blueprint, render_template, url_for, flash, redirect, request
+from flask import Blueprint, render_template, url_for, flash, redirect, request, abort, current_app, make_response, jsonify
 from flask_login import current_user, login_required  # Flask-Login for managing user authentication
-from app import db, bcrypt  # Importing database instance and bcrypt for password hashing
+from sqlalchemy.orm import joinedload
+from app import db  # Importing database instance
 from app.forms import ResetPasswordForm, AdminAddCreditsForm, CreditApprovalForm # Importing form for resetting passwords
-from app.models import Challenge, ChallengeParticipant, CreditWithdrawRequest, PasswordResetRequest, Post, PostLike, ShoppingList, User, Friendship, CreditRequest, AdminNotification, post_reports  # Importing User model for managing user data
+from app.utils import invalidate_user_tools
+from app.leaderboard import get_leaderboard_service, participant_join_order
+from app.pagination import list_params, keyset_page, cached_counts
+from app.metrics import DASHBOARD_CHARTS, dashboard_chart, recent_totals
+from app.search import search_users, search_limit
+from app.identity import invalidate_identity
+from app.passwords import PasswordHasherBusy, replace_password
+from app.ledger import approve_credit_requests, reject_credit_requests, approve_withdraw_requests, reject_withdraw_requests
+from app.models import Challenge, ChallengeParticipant, CreditWithdrawRequest, PasswordResetRequest, Post, PostLike, ShoppingList, User, Friendship, FriendSuggestion, CreditRequest, AdminNotification, TimelineEntry, post_reports  # Importing User model for managing user data
 
 
 # Create a blueprint for admin-related routes
 admin = Blueprint('admin', __name__)
 
+# Sort options of each admin list view: name -> (column, descending)
+USER_SORTS = {'newest': (User.id, True), 'oldest': (User.id, False), 'username': (User.username, False)}
+POST_SORTS = {'newest': (Post.date_posted, True), 'oldest': (Post.date_posted, False), 'most_reported': (Post.reports, True)}
+CREDIT_REQUEST_SORTS = {'newest': (CreditRequest.date_submitted, True), 'oldest': (CreditRequest.date_submitted, False),
+                        'largest': (CreditRequest.credits_requested, True)}
+WITHDRAW_SORTS = {'newest': (CreditWithdrawRequest.date_requested, True), 'oldest': (CreditWithdrawRequest.date_requested, False),
+                  'largest': (CreditWithdrawRequest.credits_requested, True)}
+RESET_SORTS = {'newest': (PasswordResetRequest.date_requested, True), 'oldest': (PasswordResetRequest.date_requested, False)}
+
+
+# Case-insensitive substring match on a username column
+def search_filter(column, q):
+    return db.func.lower(column).contains(q.lower(), autoescape=True)
+
+
+# One page of an admin list view; a tampered cursor is a bad request
+def fetch_page(query, sort_column, id_column, descending, cursor):
+    try:
+        return keyset_page(query, sort_column, id_column, descending, cursor, current_app.config['ADMIN_PAGE_SIZE'])
+    except ValueError:
+        abort(400)
+
+
+# Count rows per status with a single GROUP BY
+def count_by_status(model):
+    return dict(db.session.query(model.status, db.func.count()).group_by(model.status).all())
+
 
 @admin.route('/dashboard')
 @login_required
@@ -18,21 +54,45 @@ def dashboard():
         flash('You do not have permission to view this page.', 'danger')
         return redirect(url_for('user.index'))
 
-    # Fetch recent activities without sorting
-    recent_credit_requests = CreditRequest.query.limit(5).all()
-    recent_withdraw_requests = CreditWithdrawRequest.query.limit(5).all()
-    recent_password_resets = PasswordResetRequest.query.limit(5).all()
-
-    # Combine all recent activities (order is undefined)
-    recent_activity = (
-        recent_credit_requests + recent_withdraw_requests + recent_password_resets
+    # The five newest requests of each kind, merged newest first
+    recent_credit_requests = CreditRequest.query.options(joinedload(CreditRequest.user)) \
+                                                .order_by(CreditRequest.date_submitted.desc()).limit(5).all()
+    recent_withdraw_requests = CreditWithdrawRequest.query.options(joinedload(CreditWithdrawRequest.user)) \
+                                                          .order_by(CreditWithdrawRequest.date_requested.desc()).limit(5).all()
+    recent_password_resets = PasswordResetRequest.query.order_by(PasswordResetRequest.date_requested.desc()).limit(5).all()
+    recent_activity = sorted(
+        [(request.date_submitted, 'credit', request) for request in recent_credit_requests] +
+        [(request.date_requested, 'withdraw', request) for request in recent_withdraw_requests] +
+        [(request.date_requested, 'password_reset', request) for request in recent_password_resets],
+        key=lambda activity: activity[0], reverse=True
     )
 
+    # Throughput over the last day comes from the hourly rollups, never the raw tables
     return render_template(
         'admin_dashboard.html',
-        recent_activity=recent_activity
+        recent_activity=recent_activity,
+        totals=recent_totals(hours=24),
+        charts=DASHBOARD_CHARTS
     )
 
+
+# Dashboard chart images, rendered from the rollup tables and cached until the rollups change
+@admin.route('/dashboard/charts/<name>.png')
+@login_required
+def dashboard_chart_image(name):
+    if current_user.role != 'admin':
+        abort(403)
+    if name not in DASHBOARD_CHARTS:
+        abort(404)
+
+    image, etag = dashboard_chart(name)
+    response = make_response(image)
+    response.mimetype = 'image/png'
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # Revalidate each time; unchanged charts are a 304
+    return response.make_conditional(request)
+
 # Route for managing users
 @admin.route('/manage_users')
 @login_required
@@ -41,16 +101,34 @@ def manage_users():
     if current_user.role != 'admin':
         flash('You do not have permission to view this page.', 'danger')  # Show error message if user is not admin
         return redirect(url_for('user.index'))  # Redirect non-admin users to the user index page
-    users = User.query.all()  # Query all users from the database
-    return render_template('admin_manage_users.html', users=users)  # Render the manage users page for admins
+
+    # One page of users, filtered by role and username on the server
+    params = list_params(statuses=('admin', 'user'), sorts=USER_SORTS, default_sort='newest')
+    query = User.query
+    if params.status:
+        query = query.filter(User.role == params.status)
+    if params.q:
+        query = query.filter(search_filter(User.username, params.q))
+    sort_column, descending = USER_SORTS[params.sort]
+    page = fetch_page(query, sort_column, User.id, descending, params.cursor)
+
+    counts = cached_counts('users', lambda: dict(db.session.query(User.role, db.func.count()).group_by(User.role).all()))
+    return render_template('admin_manage_users.html', users=page.items, page=page, params=params, counts=counts)  # Render the manage users page for admins
+
+
+# Admin typeahead: users whose username or email starts with ?q=
+@admin.route('/api/users/search')
+@login_required
+def search_users_api():
+    if current_user.role != 'admin':
+        abort(403)
+    users = search_users(request.args.get('q', ''), current_user, search_limit())
+    return jsonify({'results': [{'id': user.id, 'username': user.username, 'email': user.email, 'role': user.role} for user in users]})
 
 
 @admin.route('/manage_posts', methods=['GET', 'POST'])
 @login_required
 def manage_posts():
-    # Fetch all posts to display to the admin
-    posts = Post.query.all()
-
     if request.method == 'POST':
         # Get the post ID to delete
         post_id = request.form.get("post_id")
@@ -76,10 +154,29 @@ def manage_posts():
         # Commit the changes
         db.session.commit()
 
+        # Move the user down the in-memory leaderboard
+        if challenge_participant:
+            get_leaderboard_service().record_progress(challenge_id, user_id, challenge_participant.user.username,
+                                                      challenge_participant.progress, challenge_participant.wagered_credits,
+                                                      participant_join_order(challenge_participant))
+
         flash("Post deleted successfully.", "success")
-        return redirect(url_for('admin.manage_posts'))
+        return redirect(request.referrer or url_for('admin.manage_posts'))
+
+    # One page of posts with their authors, optionally only reported ones or those by matching users
+    params = list_params(statuses=('reported',), sorts=POST_SORTS, default_sort='newest')
+    query = Post.query.options(joinedload(Post.user))
+    if params.status == 'reported':
+        query = query.filter(Post.reports > 0)
+    if params.q:
+        query = query.join(User, User.id == Post.user_id).filter(search_filter(User.username, params.q))
+    sort_column, descending = POST_SORTS[params.sort]
+    page = fetch_page(query, sort_column, Post.id, descending, params.cursor)
 
-    return render_template('admin_manage_posts.html', posts=posts)
+    counts = cached_counts('posts', lambda: dict(zip(('', 'reported'), db.session.query(
+        db.func.count(), db.func.count().filter(Post.reports > 0)
+    ).one())))
+    return render_template('admin_manage_posts.html', posts=page.items, page=page, params=params, counts=counts)
 
 
 
@@ -87,9 +184,18 @@ def manage_posts():
 @admin.route('/view_password_reset_requests')
 @login_required
 def view_password_reset_requests():
-    # Fetch all password reset requests
-    reset_requests = PasswordResetRequest.query.order_by(PasswordResetRequest.date_requested.desc()).all()
-    return render_template('admin_view_reset_requests.html', reset_requests=reset_requests)
+    # One page of password reset requests, filtered by status and username on the server
+    params = list_params(statuses=('Pending', 'Rejected', 'Password changed'), sorts=RESET_SORTS, default_sort='newest')
+    query = PasswordResetRequest.query
+    if params.status:
+        query = query.filter(PasswordResetRequest.status == params.status)
+    if params.q:
+        query = query.filter(search_filter(PasswordResetRequest.username, params.q))
+    sort_column, descending = RESET_SORTS[params.sort]
+    page = fetch_page(query, sort_column, PasswordResetRequest.id, descending, params.cursor)
+
+    counts = cached_counts('password_resets', lambda: count_by_status(PasswordResetRequest))
+    return render_template('admin_view_reset_requests.html', reset_requests=page.items, page=page, params=params, counts=counts)
 
 
 @admin.route('/reject_password_reset/<int:request_id>', methods=['POST'])
@@ -113,12 +219,20 @@ def admin_reset_password(user_id):
     if form.validate_on_submit():
         if form.password.data != form.confirm_password.data:
             flash('Password and Confirm Password do not match.', 'danger')
-        elif bcrypt.check_password_hash(user.password, form.password.data):
-            flash('New password cannot be the same as the current password.', 'danger')
         else:
+            # Compare with the current password and hash the new one in a single job on the hashing pool
+            try:
+                hashed_password = replace_password(user.password, form.password.data)
+            except PasswordHasherBusy:
+                flash('The server is busy. Please try again in a moment.', 'warning')
+                return render_template('admin_reset_password.html', title='Reset Password', form=form, user=user), 503, {'Retry-After': '1'}
+            if hashed_password is None:
+                flash('New password cannot be the same as the current password.', 'danger')
+                return render_template('admin_reset_password.html', title='Reset Password', form=form, user=user)
+
             # Update password
-            hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
             user.password = hashed_password
+            invalidate_identity(user.id)
             
             # Update reset request status to "Password changed"
             if reset_request:
@@ -175,11 +289,24 @@ def admin_delete_user(user_id):
             (Friendship.user_id == user.id) | (Friendship.friend_id == user.id)
         ).delete()
 
+        # Delete the user's friend suggestions and their appearances in other users' suggestions
+        FriendSuggestion.query.filter(
+            (FriendSuggestion.user_id == user.id) | (FriendSuggestion.candidate_id == user.id)
+        ).delete()
+
+        # Take the user's likes and reports off other posts' counters before the rows go away
+        Post.discount_user_interactions(user.id)
+
         # Delete all records in post_likes related to the user's posts or the user
         PostLike.query.filter(
             (PostLike.user_id == user.id) | (PostLike.post_id.in_([post.id for post in user.posts]))
         ).delete()
 
+        # Delete the user's timeline and every timeline entry pointing at their posts
+        TimelineEntry.query.filter(
+            (TimelineEntry.user_id == user.id) | (TimelineEntry.author_id == user.id)
+        ).delete()
+
         # Delete all records in shopping_list related to the user
         ShoppingList.query.filter_by(user_id=user.id).delete()
 
@@ -193,7 +320,10 @@ def admin_delete_user(user_id):
 
         # Now delete the user
         db.session.delete(user)
+        invalidate_identity(user.id)  # End the deleted user's cached sign-in
         db.session.commit()
+        invalidate_user_tools(user.id)  # Drop the deleted user's cached tools
+        get_leaderboard_service().invalidate()  # Their participations are gone; rebuild the rankings
         flash(f'User {user.username} has been deleted.', 'success')
     except Exception as e:
         db.session.rollback()  # Rollback in case of an error
@@ -224,40 +354,28 @@ def admin_delete_user(user_id):
 @admin.route('/add_user_credits', methods=['GET', 'POST'])
 @login_required
 def add_user_credits():
-    # Fetch all pending credit requests
-    pending_requests = CreditRequest.query.filter_by(status="Pending").all()
-    
     if request.method == 'POST':
-        # Get data from the form submission
-        credit_request_id = request.form.get("credit_request_id")
+        # Either the ticked requests of the bulk form, or the single request of a row's buttons
+        credit_request_ids = request.form.getlist("credit_request_ids", type=int) or \
+                             [request.form.get("credit_request_id", type=int)]
         action = request.form.get("action")  # "approve" or "reject"
-        
-        # Retrieve the credit request and associated user
-        credit_request = CreditRequest.query.get_or_404(credit_request_id)
-        user = credit_request.user
-        
+
+        # Statuses, balances, ledger entries and notifications are updated with set-based statements in one transaction
         if action == "approve":
-            # Approve the request and add the requested credits
-            user.credits += credit_request.credits_requested
-            credit_request.status = "Approved"
-            flash(f"{credit_request.credits_requested} credits added to {user.username}'s account and request approved.", "success")
-        
+            approved = approve_credit_requests(credit_request_ids)
+            db.session.commit()
+            flash(f"Approved {len(approved)} credit request(s), adding {sum(row.credits_requested for row in approved)} credits.", "success")
         elif action == "reject":
-            # Reject the request without adding credits
-            credit_request.status = "Rejected"
-            flash(f"Credit request from {user.username} has been rejected.", "info")
-        
-        # Mark notification as reviewed if any
-        notification = AdminNotification.query.filter_by(credit_request_id=credit_request.id).first()
-        if notification:
-            notification.reviewed = True
-        
-        # Commit changes to the database
-        db.session.commit()
-        
+            rejected = reject_credit_requests(credit_request_ids)
+            db.session.commit()
+            flash(f"Rejected {len(rejected)} credit request(s).", "info")
+
         # Redirect back to the same page to show updated list
         return redirect(url_for('admin.add_user_credits'))
-    
+
+    # Fetch all pending credit requests with their users
+    pending_requests = CreditRequest.query.options(joinedload(CreditRequest.user)).filter_by(status="Pending").all()
+
     # Render the page with pending requests
     return render_template('admin_add_user_credits.html', pending_requests=pending_requests)
 
@@ -265,35 +383,43 @@ def add_user_credits():
 @admin.route('/credit_request_history')
 @login_required
 def credit_request_history():
-    # Retrieve all approved and rejected credit requests
-    credit_requests = CreditRequest.query.filter(CreditRequest.status.in_(['Approved', 'Rejected'])).order_by(CreditRequest.date_submitted.desc()).all()
-    return render_template('admin_credit_request_history.html', credit_requests=credit_requests)
+    # One page of approved and rejected credit requests, filtered by status and username on the server
+    params = list_params(statuses=('Approved', 'Rejected'), sorts=CREDIT_REQUEST_SORTS, default_sort='newest')
+    query = CreditRequest.query.options(joinedload(CreditRequest.user)) \
+                               .filter(CreditRequest.status.in_([params.status] if params.status else ['Approved', 'Rejected']))
+    if params.q:
+        query = query.join(User, User.id == CreditRequest.user_id).filter(search_filter(User.username, params.q))
+    sort_column, descending = CREDIT_REQUEST_SORTS[params.sort]
+    page = fetch_page(query, sort_column, CreditRequest.id, descending, params.cursor)
+
+    counts = cached_counts('credit_requests', lambda: count_by_status(CreditRequest))
+    return render_template('admin_credit_request_history.html', credit_requests=page.items, page=page, params=params, counts=counts)
 
 
 @admin.route('/manage_withdraw_requests', methods=['GET', 'POST'])
 @login_required
 def manage_withdraw_requests():
-    pending_requests = CreditWithdrawRequest.query.filter_by(status='Pending').order_by(
-        CreditWithdrawRequest.date_requested.desc()
-    ).all()
-    
     if request.method == 'POST':
-        request_id = request.form.get('request_id')
+        # Either the ticked requests of the bulk form, or the single request of a row's buttons
+        request_ids = request.form.getlist('request_ids', type=int) or [request.form.get('request_id', type=int)]
         action = request.form.get('action')
-        withdraw_request = CreditWithdrawRequest.query.get_or_404(request_id)
 
         if action == 'approve':
-            withdraw_request.status = 'Approved'
-            withdraw_request.date_approved = datetime.now(timezone.utc)
-            withdraw_request.user.credits -= withdraw_request.credits_requested
-            flash(f"Approved withdrawal of {withdraw_request.credits_requested} credits for user {withdraw_request.user.username}.", 'success')
+            approved, refused = approve_withdraw_requests(request_ids)
+            db.session.commit()
+            flash(f"Approved {len(approved)} withdrawal request(s).", 'success')
+            if refused:
+                flash(f"{len(refused)} request(s) left pending: the user no longer has enough credits.", 'danger')
         elif action == 'reject':
-            withdraw_request.status = 'Rejected'
-            flash(f"Rejected withdrawal request for user {withdraw_request.user.username}.", 'danger')
-        
-        db.session.commit()
+            rejected = reject_withdraw_requests(request_ids)
+            db.session.commit()
+            flash(f"Rejected {len(rejected)} withdrawal request(s).", 'danger')
+
         return redirect(url_for('admin.manage_withdraw_requests'))
-    
+
+    pending_requests = CreditWithdrawRequest.query.options(joinedload(CreditWithdrawRequest.user)).filter_by(status='Pending').order_by(
+        CreditWithdrawRequest.date_requested.desc()
+    ).all()
     return render_template('admin_manage_withdraw_requests.html', pending_requests=pending_requests)
 
 
@@ -301,12 +427,17 @@ def manage_withdraw_requests():
 @admin.route('/view_withdraw_history')
 @login_required
 def view_withdraw_history():
-    # Only retrieve approved or rejected requests and order them by date_requested descending
-    all_requests = CreditWithdrawRequest.query.filter(
-        CreditWithdrawRequest.status.in_(['Approved', 'Rejected'])
-    ).order_by(CreditWithdrawRequest.date_requested.desc()).all()
-    
-    return render_template('admin_view_withdraw_history.html', all_requests=all_requests)
+    # One page of approved or rejected requests, filtered by status and username on the server
+    params = list_params(statuses=('Approved', 'Rejected'), sorts=WITHDRAW_SORTS, default_sort='newest')
+    query = CreditWithdrawRequest.query.options(joinedload(CreditWithdrawRequest.user)) \
+                                       .filter(CreditWithdrawRequest.status.in_([params.status] if params.status else ['Approved', 'Rejected']))
+    if params.q:
+        query = query.join(User, User.id == CreditWithdrawRequest.user_id).filter(search_filter(User.username, params.q))
+    sort_column, descending = WITHDRAW_SORTS[params.sort]
+    page = fetch_page(query, sort_column, CreditWithdrawRequest.id, descending, params.cursor)
+
+    counts = cached_counts('withdraw_requests', lambda: count_by_status(CreditWithdrawRequest))
+    return render_template('admin_view_withdraw_history.html', all_requests=page.items, page=page, params=params, counts=counts)
 
 
 @admin.route('/notifications')
@@ -0,0 +1,100 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli  # Optional: .br files are only built when the brotli package is installed
+except ImportError:
+    brotli = None
+
+# Text assets worth precompressing at build time
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json')
+
+# Precompressed variants, in order of preference: (Accept-Encoding token, file suffix)
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# How long browsers may keep a fingerprinted asset (one year)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def static_file_path(filename):
+    path = safe_join(current_app.static_folder, filename)
+    return path if path and os.path.isfile(path) else None
+
+
+# Short content hash of a static file, cached until the file's modification time changes
+def static_fingerprint(filename):
+    path = static_file_path(filename)
+    if path is None:
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    cache = current_app.extensions['asset_fingerprints']
+    cached = cache.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as asset:
+        for chunk in iter(lambda: asset.read(64 * 1024), b''):
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()[:12]
+    cache.set(filename, (mtime, fingerprint))
+    return fingerprint
+
+
+# url_defaults hook: url_for('static', filename=...) gets ?v=<fingerprint>, so a changed file gets a new URL
+def add_static_fingerprint(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+
+# Replacement for the static view: serves a precompressed .br/.gz copy when the browser accepts it,
+# and marks responses for fingerprinted URLs as cacheable forever
+def send_static(filename):
+    source = static_file_path(filename)
+    available = [(encoding, suffix) for encoding, suffix in PRECOMPRESSED_ENCODINGS
+                if source and os.path.isfile(source + suffix)
+                and os.stat(source + suffix).st_mtime_ns >= os.stat(source).st_mtime_ns]  # Ignore stale builds
+
+    accepted = [(encoding, suffix) for encoding, suffix in available if request.accept_encodings[encoding]]
+    if accepted:
+        encoding, suffix = accepted[0]
+        response = send_from_directory(current_app.static_folder, filename + suffix,
+                                       mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = current_app.send_static_file(filename)
+    if available:
+        response.vary.add('Accept-Encoding')
+
+    # Only the current fingerprint is immutable; an old or made-up one falls back to revalidation
+    if source and request.args.get('v') == static_fingerprint(filename):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+# Write gzip (and, if available, brotli) copies of every compressible static file; returns how many were written
+def build_precompressed_assets():
+    written = 0
+    for directory, _, filenames in os.walk(current_app.static_folder):
+        for filename in filenames:
+            if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, filename)
+            with open(path, 'rb') as asset:
+                data = asset.read()
+            with open(path + '.gz', 'wb') as compressed:
+                compressed.write(gzip.compress(data, compresslevel=9, mtime=0))
+            written += 1
+            if brotli is not None:
+                with open(path + '.br', 'wb') as compressed:
+                    compressed.write(brotli.compress(data, quality=11))
+                written += 1
+    return written
@@ -0,0 +1,53 @@
+from collections import OrderedDict  # Keeps keys in recency order for LRU eviction
+from threading import Lock  # Guards the cache when the server handles requests on several threads
+
+
+# Size-bounded least-recently-used cache with hit/miss counters
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    # Return the cached value for a key (or the default) and mark the key as recently used
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    # Store a value, evicting the least recently used entry once the cache is full
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # Remove a single key if it is cached
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    # Remove every entry and reset the counters
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    # Summary of cache usage for monitoring
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
@@ -0,0 +1,78 @@
+import click  # Command-line interface helpers used by the Flask CLI
+from app.models import Post
+from app.timeline import backfill_timelines
+from app.migrations import MigrationError, upgrade_schema
+from app.images import process_pending_images
+from app.assets import build_precompressed_assets
+from app.ledger import backfill_opening_balances
+from app.metrics import rollup_metrics
+from app.suggestions import compute_friend_suggestions
+from app.settlement import SettlementScheduler, settle_due_challenges
+
+
+# Register maintenance commands on the Flask CLI (run with `flask --app run <command>`)
+def register_commands(app):
+
+    # Apply new tables, columns and indexes to an existing database in place
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        try:
+            applied = upgrade_schema()
+        except MigrationError as e:
+            raise click.ClickException(str(e))
+        for change in applied:
+            click.echo(change)
+        click.echo(f"{len(applied)} schema change(s) applied.")
+
+    # Recompute the denormalized like and report counters from post_likes and post_reports
+    @app.cli.command('reconcile-post-counters')
+    def reconcile_post_counters():
+        updated = Post.reconcile_counters()
+        click.echo(f"Reconciled counters on {updated} post(s).")
+
+    # Rebuild every user's home timeline from existing posts and accepted friendships
+    @app.cli.command('backfill-timelines')
+    def backfill_timelines_command():
+        inserted = backfill_timelines()
+        click.echo(f"Wrote {inserted} timeline entries.")
+
+    # End overdue challenges and pay their winners, once or continuously as a worker process
+    @app.cli.command('settle-challenges')
+    @click.option('--loop', is_flag=True, help='Keep running and settle each challenge when its deadline passes.')
+    def settle_challenges(loop):
+        if loop:
+            SettlementScheduler(app, refresh_interval=app.config['SETTLEMENT_REFRESH_SECONDS']).run_forever()
+        else:
+            settled = settle_due_challenges()
+            click.echo(f"Settled {settled} challenge(s).")
+
+    # Record existing balances in the credit ledger so every user's entries sum to their credits
+    @app.cli.command('backfill-ledger')
+    def backfill_ledger():
+        adjusted = backfill_opening_balances()
+        click.echo(f"Recorded opening balances for {adjusted} user(s).")
+
+    # Aggregate activity into the hourly and daily rollups behind the admin dashboard; run hourly (e.g. from cron)
+    @app.cli.command('rollup-metrics')
+    @click.option('--full', is_flag=True, help='Recompute every bucket instead of only the most recent ones.')
+    def rollup_metrics_command(full):
+        changed = rollup_metrics(full=full)
+        click.echo(f"Updated {changed} rollup row(s).")
+
+    # Recompute every user's "people you may know" list from mutual friends; run periodically (e.g. nightly)
+    @app.cli.command('suggest-friends')
+    def suggest_friends():
+        written = compute_friend_suggestions()
+        click.echo(f"Stored {written} friend suggestion(s).")
+
+    # Precompress static CSS/JS with gzip (and brotli, when installed); run as part of each deploy
+    @app.cli.command('build-assets')
+    def build_assets():
+        written = build_precompressed_assets()
+        click.echo(f"Wrote {written} precompressed file(s).")
+
+    # Finish uploads left pending in the staging area, e.g. after a restart dropped the pipeline queue
+    @app.cli.command('process-pending-images')
+    def process_pending_images_command():
+        processed, failed = process_pending_images()
+        click.echo(f"Processed {processed} image(s), {failed} failed.")
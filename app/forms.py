@@ -24,17 +24,17 @@ class RegisterForm(FlaskForm):
     admin_password = PasswordField('Admin Password')  # Only used when "Admin" role is selected
     submit = SubmitField('Sign Up')
 
-    # Validation for unique username
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('That username is taken. Please choose a different one.')
-
-    # Validation for unique email
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('That email is already registered. Please use a different one.')
+    # Validation for unique username and email, looked up together in one query
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        existing_users = User.query.with_entities(User.username, User.email) \
+                                   .filter((User.username == self.username.data) | (User.email == self.email.data)).all()
+        if any(existing.username == self.username.data for existing in existing_users):
+            self.username.errors.append('That username is taken. Please choose a different one.')
+        if any(existing.email == self.email.data for existing in existing_users):
+            self.email.errors.append('That email is already registered. Please use a different one.')
+        return not existing_users
         
 # Form for user login
 class LoginForm(FlaskForm):
@@ -0,0 +1,81 @@
+import time
+from collections import namedtuple
+from flask import current_app
+from app import db
+from app.models import Challenge, ChallengeParticipant, Friendship, Post, User
+
+# Site-wide numbers and featured challenges shown to everyone on the home page
+SiteSummary = namedtuple('SiteSummary', ['user_count', 'active_challenge_count', 'post_count', 'featured_challenges'])
+FeaturedChallenge = namedtuple('FeaturedChallenge', ['id', 'name', 'participant_count', 'pot', 'ends_at'])
+
+# The signed-in user's own friend and challenge summary
+UserSummary = namedtuple('UserSummary', ['friend_count', 'pending_requests', 'active_challenges'])
+
+
+# Cached value of a home context entry, computed by compute() at most once per HOME_CACHE_SECONDS.
+# Values are immutable tuples, so the same object is safely shared by concurrent requests.
+def cached_home_value(key, compute):
+    cache = current_app.extensions['home_cache']
+    cached = cache.get(key)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+    value = compute()
+    cache.set(key, (time.monotonic() + current_app.config['HOME_CACHE_SECONDS'], value))
+    return value
+
+
+def compute_site_summary():
+    user_count, post_count = db.session.query(
+        db.select(db.func.count()).select_from(User).scalar_subquery(),
+        db.select(db.func.count()).select_from(Post).scalar_subquery()
+    ).one()
+    active_challenge_count = db.session.query(db.func.count()).select_from(Challenge).filter(Challenge.ended == False).scalar()
+
+    # The active challenges with the most participants, with their pots, in one grouped query
+    participant_count = db.func.count(ChallengeParticipant.id)
+    featured = db.session.query(
+        Challenge, participant_count, db.func.coalesce(db.func.sum(ChallengeParticipant.wagered_credits), 0)
+    ).outerjoin(ChallengeParticipant, ChallengeParticipant.challenge_id == Challenge.id) \
+     .filter(Challenge.ended == False) \
+     .group_by(Challenge.id) \
+     .order_by(participant_count.desc(), Challenge.id.desc()) \
+     .limit(current_app.config['HOME_FEATURED_CHALLENGES']).all()
+
+    return SiteSummary(
+        user_count=user_count,
+        active_challenge_count=active_challenge_count,
+        post_count=post_count,
+        featured_challenges=tuple(
+            FeaturedChallenge(challenge.id, challenge.name, participants, pot, challenge.get_end_time())
+            for challenge, participants, pot in featured
+        )
+    )
+
+
+def compute_user_summary(user_id):
+    friend_count, pending_requests = db.session.query(
+        db.func.count(Friendship.id).filter(Friendship.status == 'accepted', Friendship.is_blocked == False),
+        db.func.count(Friendship.id).filter(Friendship.status == 'pending', Friendship.friend_id == user_id)
+    ).filter((Friendship.user_id == user_id) | (Friendship.friend_id == user_id)).one()
+    active_challenges = db.session.query(db.func.count()).select_from(ChallengeParticipant) \
+                                  .join(Challenge, Challenge.id == ChallengeParticipant.challenge_id) \
+                                  .filter(ChallengeParticipant.user_id == user_id, Challenge.ended == False).scalar()
+    return UserSummary(friend_count, pending_requests, active_challenges)
+
+
+def get_site_summary():
+    return cached_home_value('site', compute_site_summary)
+
+
+def get_user_summary(user_id):
+    return cached_home_value(('user', user_id), lambda: compute_user_summary(user_id))
+
+
+# Drop cached home context after an event that changes it: the site-wide summary when no users are
+# given, otherwise those users' own summaries. Anything not invalidated expires after the TTL.
+def invalidate_home_context(*user_ids):
+    cache = current_app.extensions['home_cache']
+    if not user_ids:
+        cache.pop('site')
+    for user_id in user_ids:
+        cache.pop(('user', user_id))
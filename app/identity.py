@@ -0,0 +1,58 @@
+import time
+from collections import namedtuple
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models import User
+
+# The columns routes and templates read from current_user for authorization and the nav bar
+IDENTITY_COLUMNS = ('id', 'username', 'email', 'role', 'credits', 'last_login')
+
+
+# Immutable snapshot of a signed-in user, served to Flask-Login instead of an ORM object so that most
+# requests do not touch the user table. Routes that change a user query the row by current_user.id.
+class CachedUser(UserMixin, namedtuple('CachedUser', IDENTITY_COLUMNS)):
+    __slots__ = ()
+
+
+# user_loader: the user's snapshot, read from the database at most once per IDENTITY_CACHE_SECONDS
+def load_identity(user_id):
+    cache = current_app.extensions['identity_cache']
+    cached = cache.get(user_id)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+
+    row = db.session.execute(
+        db.select(*[getattr(User, column) for column in IDENTITY_COLUMNS]).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    identity = CachedUser(*row)
+    cache.set(user_id, (time.monotonic() + current_app.config['IDENTITY_CACHE_SECONDS'], identity))
+    return identity
+
+
+# Drop the cached snapshots of users whose credits, role, password or last login are changing. They are dropped
+# now and again when the transaction commits, so a request that reads the old row in between cannot
+# keep the stale values cached.
+def invalidate_identity(*user_ids):
+    cache = current_app.extensions['identity_cache']
+    for user_id in user_ids:
+        cache.pop(user_id)
+    db.session.info.setdefault('stale_identities', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def drop_stale_identities(session):
+    user_ids = session.info.pop('stale_identities', None)
+    if user_ids and has_app_context():
+        cache = current_app.extensions['identity_cache']
+        for user_id in user_ids:
+            cache.pop(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_stale_identities(session):
+    session.info.pop('stale_identities', None)
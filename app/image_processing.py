@@ -0,0 +1,47 @@
+import os
+from PIL import Image, ImageOps
+
+# The work done by the image pipeline's worker processes. Spawned workers import this module to run
+# process_image, so it only depends on Pillow. It must not import the models, routes or anything that
+# builds an app; the app package itself only defines the extension objects.
+
+# Size of the thumbnail stored in the upload's original format (the <img> fallback)
+THUMBNAIL_SIZE = (200, 200)
+
+
+# File name of one resized variant, e.g. 3f2a...-400.webp for 3f2a....jpg
+def variant_filename(filename, width, image_format):
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}-{width}.{image_format}"
+
+
+# Decode one upload and write its fallback thumbnail plus a resized copy per width and format, all
+# without EXIF data. Widths larger than the image are skipped (the smallest is always written).
+# Runs in a worker process, so it only takes paths and settings and must not touch the app or database.
+def process_image(source_path, dest_path, widths=(), formats=()):
+    if not os.path.exists(source_path) and os.path.exists(dest_path):
+        return  # A duplicate upload of an image that has already been processed
+    try:
+        with Image.open(source_path) as img:
+            largest = max(widths, default=THUMBNAIL_SIZE[0])
+            img.draft(img.mode, (largest, largest))  # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding
+            img = ImageOps.exif_transpose(img)  # Apply the camera orientation before the EXIF is dropped
+            img.info.pop('exif', None)
+
+            fallback = img.copy()
+            fallback.thumbnail(THUMBNAIL_SIZE)
+            fallback.save(dest_path)  # Written without the original EXIF (location, device, ...)
+
+            has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+            for width in sorted(widths):
+                if width > img.width and width != min(widths):
+                    continue
+                height = max(1, round(img.height * width / img.width))
+                variant = img.resize((width, height), Image.LANCZOS)
+                for image_format in formats:
+                    name = variant_filename(os.path.basename(dest_path), width, image_format)
+                    variant.save(os.path.join(os.path.dirname(dest_path), name), image_format.upper(), quality=75)
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
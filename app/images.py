@@ -0,0 +1,195 @@
+import hashlib  # Content hashes name processed images, so identical uploads share files
+import multiprocessing
+import os
+import secrets
+import threading  # Bounds how many uploads can wait for the process pool
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, url_for
+from PIL import features
+from app import db
+from app.image_processing import process_image, variant_filename
+from app.models import Challenge, CreditRequest, Post
+
+# Modern formats written for every configured width, best first; AVIF needs a Pillow built with libavif
+VARIANT_FORMATS = (['avif'] if 'avif' in features.modules and features.check_module('avif') else []) + ['webp']
+VARIANT_MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+# The model and filename column that each static image folder belongs to
+IMAGE_TARGETS = {
+    'uploads': (Post, 'image_file'),
+    'challenges': (Challenge, 'icon'),
+    'payments': (CreditRequest, 'proof_image'),
+}
+
+# An upload written to the staging area, waiting to be processed into static/<folder>/<filename>
+StagedImage = namedtuple('StagedImage', ['folder', 'filename'])
+
+
+def staging_path(folder, filename):
+    return os.path.join(current_app.instance_path, 'staging', folder, filename)
+
+
+def static_image_path(folder, filename):
+    return os.path.join(current_app.static_folder, folder, filename)
+
+
+# Write the raw upload to the staging area, named by a hash of its content; no decoding happens here.
+# Uploading the same file again gives the same name, so it is stored (and cached by browsers) once.
+def stage_image(form_image, folder='uploads'):
+    _, f_ext = os.path.splitext(form_image.filename)
+    temporary_path = staging_path(folder, secrets.token_hex(8) + '.part')
+    os.makedirs(os.path.dirname(temporary_path), exist_ok=True)
+
+    digest = hashlib.sha256()
+    with open(temporary_path, 'wb') as staged_file:
+        for chunk in iter(lambda: form_image.stream.read(64 * 1024), b''):
+            digest.update(chunk)
+            staged_file.write(chunk)
+
+    filename = digest.hexdigest()[:32] + f_ext.lower()
+    if os.path.exists(static_image_path(folder, filename)):
+        os.remove(temporary_path)  # Already processed for an earlier upload
+    else:
+        os.replace(temporary_path, staging_path(folder, filename))
+    return StagedImage(folder, filename)
+
+
+# Remove a staged upload that will never be processed (e.g. the request was rolled back)
+def discard_staged_image(staged):
+    path = staging_path(staged.folder, staged.filename)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# Variant settings from the app config, passed to process_image in the worker
+def variant_settings():
+    return tuple(current_app.config['IMAGE_VARIANT_WIDTHS']), tuple(VARIANT_FORMATS)
+
+
+# The <source> entries for an image: a list of (mime type, srcset) for every variant format on disk,
+# best format first. Empty for images uploaded before variants existed, or still being processed.
+# Content-hashed files never change, so a found set of variants is cached.
+def image_sources(folder, filename):
+    if not filename:
+        return []
+    cache = current_app.extensions['image_variant_cache']
+    sources = cache.get((folder, filename))
+    if sources is not None:
+        return sources
+
+    widths, formats = variant_settings()
+    sources = []
+    for image_format in formats:
+        candidates = []
+        for width in sorted(widths):
+            name = variant_filename(filename, width, image_format)
+            if os.path.exists(static_image_path(folder, name)):
+                candidates.append(f"{url_for('static', filename=f'{folder}/{name}')} {width}w")
+        if candidates:
+            sources.append((VARIANT_MIME_TYPES[image_format], ', '.join(candidates)))
+    if sources:
+        cache.set((folder, filename), sources)
+    return sources
+
+
+# Record the outcome of processing on the row that owns the image
+def mark_image_status(folder, record_id, status):
+    model, _ = IMAGE_TARGETS[folder]
+    db.session.execute(db.update(model).where(model.id == record_id).values(image_status=status))
+    db.session.commit()
+
+
+# Processes staged uploads on a bounded process pool so requests return as soon as the upload is staged.
+# At most max_pending images wait for the pool; beyond that (or with max_workers=0) an image is processed
+# inline in the request, which slows uploads down instead of letting the backlog grow without limit.
+class ImagePipeline:
+    def __init__(self, app, max_workers=2, max_pending=32):
+        self.app = app
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    # Start the worker processes on first use, so app start-up and the CLI do not pay for them
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked: the web server may already be running other threads
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    # Queue a staged image for the row record_id; returns the Future, or None if it was processed inline
+    def submit(self, staged, record_id):
+        source = staging_path(staged.folder, staged.filename)
+        dest = static_image_path(staged.folder, staged.filename)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+        if not os.path.exists(source) and os.path.exists(dest):
+            mark_image_status(staged.folder, record_id, 'ready')  # Duplicate of an image already processed
+            return None
+
+        if self.max_workers == 0 or not self._slots.acquire(blocking=False):
+            self._process_inline(staged, record_id, source, dest)
+            return None
+
+        try:
+            future = self._get_executor().submit(process_image, source, dest, *variant_settings())
+        except RuntimeError:  # The pool is shutting down or a worker died
+            self._slots.release()
+            self._process_inline(staged, record_id, source, dest)
+            return None
+        future.add_done_callback(lambda done: self._finished(staged, record_id, done))
+        return future
+
+    def _process_inline(self, staged, record_id, source, dest):
+        try:
+            process_image(source, dest, *variant_settings())
+            status = 'ready'
+        except Exception as e:
+            current_app.logger.warning(f"Error processing image {staged.filename}: {e}")
+            status = 'failed'
+        mark_image_status(staged.folder, record_id, status)
+
+    # Runs on the executor's result thread once a worker has finished an image
+    def _finished(self, staged, record_id, future):
+        self._slots.release()
+        with self.app.app_context():
+            error = future.exception()
+            if error:
+                current_app.logger.warning(f"Error processing image {staged.filename}: {error}")
+            mark_image_status(staged.folder, record_id, 'failed' if error else 'ready')
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+# Hand a staged image to the app's pipeline once the row that owns it has been committed
+def queue_image(staged, record_id):
+    return current_app.extensions['image_pipeline'].submit(staged, record_id)
+
+
+# Process the images of rows still marked pending (e.g. after a restart lost the queue); rows whose
+# staged file is gone are marked failed. Returns (processed, failed).
+def process_pending_images():
+    processed = failed = 0
+    for folder, (model, column) in IMAGE_TARGETS.items():
+        for record in model.query.filter_by(image_status='pending').all():
+            filename = getattr(record, column)
+            source = staging_path(folder, filename)
+            dest = static_image_path(folder, filename)
+            try:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                process_image(source, dest, *variant_settings())
+                status = 'ready'
+                processed += 1
+            except Exception as e:
+                current_app.logger.warning(f"Error processing image {filename}: {e}")
+                status = 'failed'
+                failed += 1
+            mark_image_status(folder, record.id, status)
+    return processed, failed
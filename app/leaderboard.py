@@ -0,0 +1,206 @@
+import bisect  # Binary search over each challenge's sorted ranking
+import secrets
+import threading  # Guards the rankings when requests are served on several threads
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import Challenge, ChallengeParticipant, User
+
+# One row of a challenge leaderboard
+LeaderboardEntry = namedtuple('LeaderboardEntry', ['user_id', 'username', 'progress', 'wagered_credits'])
+
+
+# Order in which participants are ranked and in which settlement picks the winner: highest progress
+# first, ties going to the earliest joiner. join_order() is the same tie-break for in-memory keys.
+RANKING_ORDER = (ChallengeParticipant.progress.desc(), ChallengeParticipant.date_joined, ChallengeParticipant.id)
+
+
+# Tie-break part of a ranking key, sorting like ORDER BY date_joined, id in SQLite (NULLs first)
+def join_order(date_joined, participant_id):
+    return (date_joined is not None, date_joined or datetime.min, participant_id)
+
+
+def participant_join_order(participant):
+    return join_order(participant.date_joined, participant.id)
+
+
+# Ranking for a single challenge: keys are kept sorted as (-progress, *join order, user_id) so the leader
+# comes first and ties are broken as in RANKING_ORDER. Lookups and rank queries are binary searches.
+class ChallengeLeaderboard:
+    def __init__(self):
+        self._keys = []  # Sorted list of (-progress, *join order, user_id)
+        self._positions = {}  # user_id -> their current key
+        self._entries = {}  # user_id -> LeaderboardEntry
+
+    # Insert a participant or move them to their new position after a progress change. order is the
+    # participant's join_order(); when omitted a known participant keeps theirs (ties fall to user id otherwise).
+    def update(self, entry, order=None):
+        previous = self._positions.get(entry.user_id)
+        if previous is not None:
+            del self._keys[bisect.bisect_left(self._keys, previous)]
+            if order is None:
+                order = previous[1:-1]
+        key = (-entry.progress, *(order or ()), entry.user_id)
+        bisect.insort(self._keys, key)
+        self._positions[entry.user_id] = key
+        self._entries[entry.user_id] = entry
+
+    def remove(self, user_id):
+        previous = self._positions.pop(user_id, None)
+        if previous is not None:
+            del self._keys[bisect.bisect_left(self._keys, previous)]
+            del self._entries[user_id]
+
+    # The n highest-ranked participants
+    def top(self, n):
+        return [self._entries[key[-1]] for key in self._keys[:n]]
+
+    # 1-based rank of a participant, or None if they have not joined
+    def rank(self, user_id):
+        key = self._positions.get(user_id)
+        if key is None:
+            return None
+        return bisect.bisect_left(self._keys, key) + 1
+
+    def get(self, user_id):
+        return self._entries.get(user_id)
+
+    def entries(self):
+        return self._entries
+
+    def __len__(self):
+        return len(self._keys)
+
+
+# In-memory rankings for every active challenge, kept up to date by the routes that change progress.
+# Rebuilt from the database on first use and whenever it is older than max_age seconds, so changes made
+# by other processes are picked up.
+#
+# Every change bumps a version number and is appended to a bounded change log, so clients can ask for
+# just the challenges that changed since the version they last saw. The epoch identifies this instance;
+# a client holding a version from another process (or from before a restart) gets a full reset instead.
+class LeaderboardService:
+    def __init__(self, max_age=60, change_log_size=1000):
+        self.max_age = max_age
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self._changes = deque(maxlen=change_log_size)  # (version, challenge_id), oldest first
+        self._trimmed_through = 0  # Highest version that has fallen out of the change log
+        self._boards = {}  # challenge_id -> ChallengeLeaderboard
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    # Record that a challenge's ranking changed
+    def _bump(self, challenge_id):
+        if len(self._changes) == self._changes.maxlen:
+            self._trimmed_through = self._changes[0][0]
+        self.version += 1
+        self._changes.append((self.version, challenge_id))
+
+    # Cold-start (or periodic) rebuild of every active challenge's ranking with a single query
+    def rebuild(self):
+        rows = db.session.query(
+            ChallengeParticipant.challenge_id, ChallengeParticipant.user_id, User.username,
+            ChallengeParticipant.progress, ChallengeParticipant.wagered_credits,
+            ChallengeParticipant.date_joined, ChallengeParticipant.id
+        ).join(User, User.id == ChallengeParticipant.user_id) \
+         .join(Challenge, Challenge.id == ChallengeParticipant.challenge_id) \
+         .filter(Challenge.ended == False).all()
+
+        boards = {}
+        for challenge_id, user_id, username, progress, wagered_credits, date_joined, participant_id in rows:
+            board = boards.setdefault(challenge_id, ChallengeLeaderboard())
+            board.update(LeaderboardEntry(user_id, username, progress or 0, wagered_credits), join_order(date_joined, participant_id))
+        with self._lock:
+            # Log the challenges whose rankings differ from what was in memory
+            for challenge_id in set(self._boards) | set(boards):
+                old, new = self._boards.get(challenge_id), boards.get(challenge_id)
+                if old is None or new is None or old.entries() != new.entries():
+                    self._bump(challenge_id)
+            self._boards = boards
+            self._loaded_at = time.monotonic()
+
+    # Force a rebuild on next use, e.g. after bulk deletes
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.rebuild()
+
+    # Record a participant's new progress (also used when they join a challenge); order is their join_order()
+    def record_progress(self, challenge_id, user_id, username, progress, wagered_credits, order=None):
+        with self._lock:
+            if self._loaded_at is None:
+                return  # Not loaded yet; the cold-start rebuild will read the committed value
+            board = self._boards.setdefault(challenge_id, ChallengeLeaderboard())
+            entry = LeaderboardEntry(user_id, username, progress or 0, wagered_credits)
+            if board.get(user_id) != entry:
+                board.update(entry, order)
+                self._bump(challenge_id)
+
+    # Drop a challenge once it has ended
+    def remove_challenge(self, challenge_id):
+        with self._lock:
+            if self._boards.pop(challenge_id, None) is not None:
+                self._bump(challenge_id)
+
+    # (epoch, version) of the current rankings, for pages that later poll changes_since
+    def current_version(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self.epoch, self.version
+
+    def top(self, challenge_id, n):
+        with self._lock:
+            self._ensure_loaded()
+            board = self._boards.get(challenge_id)
+            return board.top(n) if board else []
+
+    def rank(self, challenge_id, user_id):
+        with self._lock:
+            self._ensure_loaded()
+            board = self._boards.get(challenge_id)
+            return board.rank(user_id) if board else None
+
+    def entry(self, challenge_id, user_id):
+        with self._lock:
+            self._ensure_loaded()
+            board = self._boards.get(challenge_id)
+            return board.get(user_id) if board else None
+
+    # Rankings of the challenges changed after version `since`, as plain dicts for a JSON response.
+    # Every active challenge is returned (with reset=True) when the client's version cannot be served
+    # from the change log. A challenge that has ended is reported with ended=True and no entries.
+    def changes_since(self, since, epoch, n, user_id):
+        with self._lock:
+            self._ensure_loaded()
+            reset = since is None or epoch != self.epoch or since > self.version or since < self._trimmed_through
+            if reset:
+                changed_ids = set(self._boards)
+            else:
+                changed_ids = {challenge_id for version, challenge_id in self._changes if version > since}
+
+            challenges = []
+            for challenge_id in sorted(changed_ids):
+                board = self._boards.get(challenge_id)
+                if board is None:
+                    challenges.append({'challenge_id': challenge_id, 'ended': True, 'top': [], 'me': None})
+                    continue
+                top = [dict(entry._asdict(), rank=rank) for rank, entry in enumerate(board.top(n), start=1)]
+                me = board.get(user_id)
+                challenges.append({
+                    'challenge_id': challenge_id,
+                    'ended': False,
+                    'top': top,
+                    'me': dict(me._asdict(), rank=board.rank(user_id)) if me else None
+                })
+            return {'epoch': self.epoch, 'version': self.version, 'reset': reset, 'challenges': challenges}
+
+
+# The leaderboard service of the current app
+def get_leaderboard_service():
+    return current_app.extensions['leaderboard']
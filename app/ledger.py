@@ -0,0 +1,213 @@
+import secrets
+from datetime import datetime, timezone
+from app import db
+from app.models import AdminNotification, CreditLedger, CreditRequest, CreditWithdrawRequest, User
+from app.identity import invalidate_identity
+
+# System accounts on the other side of user transfers
+DEPOSITS_ACCOUNT = 'deposits'  # Credits bought through approved credit requests
+WITHDRAWALS_ACCOUNT = 'withdrawals'  # Credits paid out through approved withdraw requests
+OPENING_BALANCES_ACCOUNT = 'opening-balances'  # Balances that existed before the ledger
+
+
+# Raised when a user's balance cannot cover a debit; nothing has been written when it is raised
+class InsufficientCredits(Exception):
+    pass
+
+
+def user_account(user_id):
+    return f'user:{user_id}'
+
+
+def challenge_account(challenge_id):
+    return f'challenge:{challenge_id}'
+
+
+# Apply one leg of a transfer to the materialized balance of a user account (system accounts have none).
+# Debits are a single conditional UPDATE, so two concurrent debits can never overdraw the balance.
+def _update_balance(account, delta):
+    if not account.startswith('user:'):
+        return
+    user_id = int(account.split(':', 1)[1])
+    invalidate_identity(user_id)  # The cached snapshot shows the balance
+    if delta < 0:
+        updated = db.session.execute(
+            db.update(User).where(User.id == user_id, User.credits >= -delta).values(credits=User.credits + delta)
+        ).rowcount
+        if not updated:
+            raise InsufficientCredits(account)
+    else:
+        db.session.execute(
+            db.update(User).where(User.id == user_id).values(credits=db.func.coalesce(User.credits, 0) + delta)
+        )
+
+
+# Move amount credits from one account to another in the current transaction (the caller commits).
+# Returns the transaction id, or None for a zero amount.
+def transfer(from_account, to_account, amount, kind, reference_id=None):
+    if amount < 0:
+        raise ValueError('Transfer amount must not be negative.')
+    if amount == 0:
+        return None
+
+    _update_balance(from_account, -amount)  # Checked first, so a failed debit writes nothing
+    _update_balance(to_account, amount)
+
+    return _insert_entries([(from_account, to_account, amount, reference_id)], kind)[0]
+
+
+# Write the two ledger rows of each (from_account, to_account, amount, reference_id) transfer in a
+# single INSERT; returns the new transaction ids
+def _insert_entries(transfers, kind):
+    rows, transaction_ids = [], []
+    for from_account, to_account, amount, reference_id in transfers:
+        transaction_id = secrets.token_hex(16)
+        transaction_ids.append(transaction_id)
+        rows.append({'transaction_id': transaction_id, 'account': from_account, 'amount': -amount, 'kind': kind, 'reference_id': reference_id})
+        rows.append({'transaction_id': transaction_id, 'account': to_account, 'amount': amount, 'kind': kind, 'reference_id': reference_id})
+    db.session.execute(db.insert(CreditLedger), rows)
+    return transaction_ids
+
+
+# A user's entry fee goes into the challenge's pot
+def wager_credits(user_id, challenge_id, amount):
+    return transfer(user_account(user_id), challenge_account(challenge_id), amount, 'challenge_wager', challenge_id)
+
+
+# The challenge's pot goes to its winner
+def pay_winnings(user_id, challenge_id, amount):
+    return transfer(challenge_account(challenge_id), user_account(user_id), amount, 'challenge_payout', challenge_id)
+
+
+def deposit_credits(user_id, amount, credit_request_id):
+    return transfer(DEPOSITS_ACCOUNT, user_account(user_id), amount, 'deposit', credit_request_id)
+
+
+def withdraw_credits(user_id, amount, withdraw_request_id):
+    return transfer(user_account(user_id), WITHDRAWALS_ACCOUNT, amount, 'withdrawal', withdraw_request_id)
+
+
+# Approve many pending credit requests in the current transaction with set-based statements: one UPDATE
+# claims the requests that are still pending, one credits every affected balance, one INSERT writes the
+# ledger rows and one UPDATE marks the admin notifications reviewed. Returns the approved
+# (id, user_id, credits_requested) rows; requests that were already reviewed are skipped.
+def approve_credit_requests(credit_request_ids):
+    if not credit_request_ids:
+        return []
+    approved = db.session.execute(
+        db.update(CreditRequest).where(CreditRequest.id.in_(credit_request_ids), CreditRequest.status == 'Pending')
+                                .values(status='Approved')
+                                .returning(CreditRequest.id, CreditRequest.user_id, CreditRequest.credits_requested),
+        execution_options={'synchronize_session': False}
+    ).all()
+    if not approved:
+        return []
+
+    approved_ids = [row.id for row in approved]
+    requested_total = db.select(db.func.sum(CreditRequest.credits_requested)) \
+                        .where(CreditRequest.id.in_(approved_ids), CreditRequest.user_id == User.id).scalar_subquery()
+    invalidate_identity(*{row.user_id for row in approved})
+    db.session.execute(
+        db.update(User).where(User.id.in_({row.user_id for row in approved}))
+                       .values(credits=db.func.coalesce(User.credits, 0) + requested_total),
+        execution_options={'synchronize_session': False}
+    )
+    _insert_entries([(DEPOSITS_ACCOUNT, user_account(row.user_id), row.credits_requested, row.id) for row in approved], 'deposit')
+    _mark_notifications_reviewed(approved_ids)
+    return approved
+
+
+# Reject many pending credit requests; returns the ids that were still pending
+def reject_credit_requests(credit_request_ids):
+    if not credit_request_ids:
+        return []
+    rejected_ids = db.session.execute(
+        db.update(CreditRequest).where(CreditRequest.id.in_(credit_request_ids), CreditRequest.status == 'Pending')
+                                .values(status='Rejected').returning(CreditRequest.id),
+        execution_options={'synchronize_session': False}
+    ).scalars().all()
+    _mark_notifications_reviewed(rejected_ids)
+    return rejected_ids
+
+
+def _mark_notifications_reviewed(credit_request_ids):
+    if credit_request_ids:
+        db.session.execute(
+            db.update(AdminNotification).where(AdminNotification.credit_request_id.in_(credit_request_ids))
+                                        .values(reviewed=True),
+            execution_options={'synchronize_session': False}
+        )
+
+
+# Approve many pending withdraw requests in the current transaction. The requests are claimed with one
+# UPDATE, then one conditional UPDATE debits every user whose balance covers all of their claimed
+# requests; the requests of users who cannot cover them go back to Pending. Returns (approved, refused)
+# lists of (id, user_id, credits_requested) rows.
+def approve_withdraw_requests(withdraw_request_ids):
+    if not withdraw_request_ids:
+        return [], []
+    claimed = db.session.execute(
+        db.update(CreditWithdrawRequest)
+          .where(CreditWithdrawRequest.id.in_(withdraw_request_ids), CreditWithdrawRequest.status == 'Pending')
+          .values(status='Approved', date_approved=datetime.now(timezone.utc))
+          .returning(CreditWithdrawRequest.id, CreditWithdrawRequest.user_id, CreditWithdrawRequest.credits_requested),
+        execution_options={'synchronize_session': False}
+    ).all()
+    if not claimed:
+        return [], []
+
+    requested_total = db.select(db.func.sum(CreditWithdrawRequest.credits_requested)) \
+                        .where(CreditWithdrawRequest.id.in_([row.id for row in claimed]),
+                               CreditWithdrawRequest.user_id == User.id).scalar_subquery()
+    invalidate_identity(*{row.user_id for row in claimed})
+    covered_user_ids = set(db.session.execute(
+        db.update(User).where(User.id.in_({row.user_id for row in claimed}), User.credits >= requested_total)
+                       .values(credits=User.credits - requested_total).returning(User.id),
+        execution_options={'synchronize_session': False}
+    ).scalars())
+
+    approved = [row for row in claimed if row.user_id in covered_user_ids]
+    refused = [row for row in claimed if row.user_id not in covered_user_ids]
+    if refused:
+        db.session.execute(
+            db.update(CreditWithdrawRequest).where(CreditWithdrawRequest.id.in_([row.id for row in refused]))
+                                            .values(status='Pending', date_approved=None),
+            execution_options={'synchronize_session': False}
+        )
+    if approved:
+        _insert_entries([(user_account(row.user_id), WITHDRAWALS_ACCOUNT, row.credits_requested, row.id) for row in approved], 'withdrawal')
+    return approved, refused
+
+
+# Reject many pending withdraw requests; returns the ids that were still pending
+def reject_withdraw_requests(withdraw_request_ids):
+    if not withdraw_request_ids:
+        return []
+    return db.session.execute(
+        db.update(CreditWithdrawRequest)
+          .where(CreditWithdrawRequest.id.in_(withdraw_request_ids), CreditWithdrawRequest.status == 'Pending')
+          .values(status='Rejected').returning(CreditWithdrawRequest.id),
+        execution_options={'synchronize_session': False}
+    ).scalars().all()
+
+
+# A user's ledger entries, newest first (served by ix_credit_ledger_account_created)
+def account_history(user_id, limit=50):
+    return CreditLedger.query.filter_by(account=user_account(user_id)) \
+                             .order_by(CreditLedger.created_at.desc(), CreditLedger.id.desc()).limit(limit).all()
+
+
+# Record each user's existing balance (minus anything already in the ledger) as an opening entry,
+# so that every user's ledger sums to User.credits. Returns the number of users adjusted.
+def backfill_opening_balances():
+    ledger_totals = dict(db.session.query(CreditLedger.account, db.func.sum(CreditLedger.amount))
+                         .filter(CreditLedger.account.like('user:%')).group_by(CreditLedger.account))
+    openings = []
+    for user_id, credits in db.session.query(User.id, User.credits):
+        difference = (credits or 0) - (ledger_totals.get(user_account(user_id)) or 0)
+        if difference:
+            openings.append((OPENING_BALANCES_ACCOUNT, user_account(user_id), difference, None))
+    if openings:
+        _insert_entries(openings, 'opening_balance')
+    db.session.commit()
+    return len(openings)
@@ -0,0 +1,179 @@
+import hashlib
+import io
+from datetime import datetime, timedelta, timezone
+import pandas as pd  # Reshapes rollup rows into one time series per metric
+from flask import current_app
+from matplotlib.figure import Figure  # Renders charts without a GUI backend or pyplot's global state
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert  # INSERT ... ON CONFLICT for upserts
+from app import db
+from app.ledger import DEPOSITS_ACCOUNT, WITHDRAWALS_ACCOUNT
+from app.models import ChallengeParticipant, CreditLedger, MetricRollup, User, post_reports
+
+# strftime format that truncates a timestamp to the start of its bucket, per rollup period
+PERIOD_FORMATS = {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d 00:00:00'}
+
+UPSERT_CHUNK_SIZE = 1000  # Rollup rows per INSERT statement
+
+
+# Each metric is (timestamp column, aggregate, extra filters) over one raw table
+def metric_sources():
+    return {
+        'signups': (User.date_created, db.func.count(), ()),
+        'challenge_joins': (ChallengeParticipant.date_joined, db.func.count(), ()),
+        'credits_wagered': (ChallengeParticipant.date_joined, db.func.coalesce(db.func.sum(ChallengeParticipant.wagered_credits), 0), ()),
+        # The system account's leg of each transfer: deposits pay out (negative), withdrawals receive
+        'credits_in': (CreditLedger.created_at, -db.func.sum(CreditLedger.amount), (CreditLedger.account == DEPOSITS_ACCOUNT,)),
+        'credits_out': (CreditLedger.created_at, db.func.sum(CreditLedger.amount), (CreditLedger.account == WITHDRAWALS_ACCOUNT,)),
+        'reports': (post_reports.c.date_reported, db.func.count(), ()),
+        'reported_posts': (post_reports.c.date_reported, db.func.count(db.distinct(post_reports.c.post_id)), ()),
+    }
+
+
+# {bucket_start: value} of one metric for the buckets starting at or after since (every bucket when None)
+def aggregate_metric(period, metric, since=None):
+    column, aggregate, filters = metric_sources()[metric]
+    bucket = db.func.strftime(PERIOD_FORMATS[period], column)
+    query = db.session.query(bucket.label('bucket_start'), aggregate.label('value')).filter(column.isnot(None), *filters)
+    if since is not None:
+        # A little slack so stored values without microseconds at exactly `since` are included;
+        # the extra rows fall in the previous bucket, which is dropped below
+        query = query.filter(column >= since - timedelta(seconds=1))
+    totals = {}
+    for bucket_start, value in query.group_by(bucket):
+        bucket_start = datetime.strptime(bucket_start, '%Y-%m-%d %H:%M:%S')
+        if since is None or bucket_start >= since:
+            totals[bucket_start] = int(value or 0)
+    return totals
+
+
+# Start of the newest bucket already rolled up for a period. It may have been partial when it was
+# written, so incremental runs recompute from there.
+def rollup_watermark(period):
+    return db.session.query(db.func.max(MetricRollup.bucket_start)).filter_by(period=period).scalar()
+
+
+# Aggregate the raw tables into metric_rollup for every period. Incremental by default: only buckets
+# from the watermark on are recomputed. full=True recomputes all history, e.g. after deleting users.
+# Rows are upserted and only touched when their value changed; returns the number of changed rows.
+def rollup_metrics(full=False, now=None):
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    changed = 0
+    for period in PERIOD_FORMATS:
+        since = None if full else rollup_watermark(period)
+        rows = []
+        for metric in metric_sources():
+            totals = aggregate_metric(period, metric, since)
+            rows += [{'period': period, 'metric': metric, 'bucket_start': bucket_start, 'value': value, 'updated_at': now}
+                     for bucket_start, value in totals.items()]
+            if full:
+                # Buckets whose source rows are all gone drop to zero rather than keeping a stale value
+                stale = db.update(MetricRollup).where(
+                    MetricRollup.period == period, MetricRollup.metric == metric, MetricRollup.value != 0,
+                    MetricRollup.bucket_start.notin_(list(totals))
+                ).values(value=0, updated_at=now)
+                changed += db.session.execute(stale, execution_options={'synchronize_session': False}).rowcount
+        # Chunked so a full rebuild stays under SQLite's limit on bound parameters
+        for offset in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            statement = sqlite_insert(MetricRollup).values(rows[offset:offset + UPSERT_CHUNK_SIZE])
+            statement = statement.on_conflict_do_update(
+                index_elements=['period', 'metric', 'bucket_start'],
+                set_={'value': statement.excluded.value, 'updated_at': statement.excluded.updated_at},
+                where=MetricRollup.value != statement.excluded.value
+            )
+            changed += db.session.execute(statement).rowcount
+    db.session.commit()
+    return changed
+
+
+# Identifies the current state of a period's rollups: changes whenever the rollup job changes a value
+def rollup_version(period):
+    latest, rows = db.session.query(db.func.max(MetricRollup.updated_at), db.func.count()).filter_by(period=period).one()
+    return f'{latest}:{rows}'
+
+
+# Start of the bucket of the given period (hour or day) that contains now, as a naive UTC datetime
+def current_bucket(period, now=None):
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    end = now.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        end = end.replace(hour=0)
+    return end
+
+
+# One DataFrame per period: a row per bucket over the last `buckets` buckets, a column per metric,
+# with empty buckets filled with zero
+def metric_frame(period, buckets, now=None):
+    step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+    end = current_bucket(period, now)
+    start = end - step * (buckets - 1)
+
+    rows = db.session.query(MetricRollup.bucket_start, MetricRollup.metric, MetricRollup.value) \
+                     .filter(MetricRollup.period == period, MetricRollup.bucket_start >= start).all()
+    frame = pd.DataFrame(rows, columns=['bucket_start', 'metric', 'value'])
+    frame = frame.pivot_table(index='bucket_start', columns='metric', values='value', aggfunc='sum')
+    frame = frame.reindex(index=pd.date_range(start, end, freq=step), columns=list(metric_sources()), fill_value=0)
+    return frame.fillna(0)
+
+
+# Dashboard charts: name -> (title, period, number of buckets config key, metrics plotted, kind)
+DASHBOARD_CHARTS = {
+    'signups': ('Signups per day', 'day', 'DASHBOARD_CHART_DAYS', ['signups'], 'bar'),
+    'credits': ('Credits in and out per day', 'day', 'DASHBOARD_CHART_DAYS', ['credits_in', 'credits_out', 'credits_wagered'], 'line'),
+    'participation': ('Challenge joins per hour', 'hour', 'DASHBOARD_CHART_HOURS', ['challenge_joins'], 'bar'),
+    'reports': ('Reports per reported post, per day', 'day', 'DASHBOARD_CHART_DAYS', ['reports_per_post'], 'line'),
+}
+
+
+# Draw one dashboard chart as PNG bytes
+def render_chart(name, now=None):
+    title, period, buckets_key, metrics, kind = DASHBOARD_CHARTS[name]
+    frame = metric_frame(period, current_app.config[buckets_key], now)
+    frame['reports_per_post'] = (frame['reports'] / frame['reported_posts'].where(frame['reported_posts'] > 0)).fillna(0)
+
+    figure = Figure(figsize=(6, 3), dpi=100)
+    axes = figure.subplots()
+    positions = range(len(frame))
+    if kind == 'bar':
+        axes.bar(positions, frame[metrics[0]], color='#0d6efd')
+    else:
+        for metric in metrics:
+            axes.plot(positions, frame[metric], marker='o', markersize=3, label=metric.replace('_', ' '))
+        if len(metrics) > 1:
+            axes.legend(fontsize='small')
+    # Label at most ~15 buckets so the axis stays readable
+    step = len(frame) // 15 + 1
+    labels = frame.index.strftime('%m-%d' if period == 'day' else '%d %Hh')
+    axes.set_xticks(list(positions)[::step], labels[::step], rotation=60, fontsize='x-small')
+    axes.set_title(title)
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+# PNG bytes and ETag of a dashboard chart. Rendered charts are cached against the rollup version of
+# their period and the current bucket, so a chart is only redrawn after the rollup job has changed one
+# of its values or its time window has moved on (e.g. a daily chart after midnight).
+def dashboard_chart(name, now=None):
+    period = DASHBOARD_CHARTS[name][1]
+    now = now or datetime.now(timezone.utc)
+    version = f'{rollup_version(period)}:{current_bucket(period, now).isoformat()}'
+    cache = current_app.extensions['dashboard_chart_cache']
+    cached = cache.get(name)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+    image = render_chart(name, now)
+    etag = hashlib.sha256(f'{name}:{version}'.encode()).hexdigest()[:16]
+    cache.set(name, (version, image, etag))
+    return image, etag
+
+
+# Totals of each metric over the last `hours` hours, from the hourly rollups
+def recent_totals(hours=24, now=None):
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    since = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    totals = dict(db.session.query(MetricRollup.metric, db.func.sum(MetricRollup.value)).filter(
+        MetricRollup.period == 'hour', MetricRollup.bucket_start >= since
+    ).group_by(MetricRollup.metric).all())
+    return {metric: int(totals.get(metric) or 0) for metric in metric_sources()}
@@ -0,0 +1,114 @@
+from sqlalchemy import inspect  # Reads the schema of the live database
+from app import db
+
+
+# Raised when the database cannot be upgraded automatically; nothing is changed
+class MigrationError(Exception):
+    pass
+
+
+# Remove duplicate likes (keeping the earliest) so the one-like-per-user unique index can be created
+def dedupe_post_likes(connection):
+    connection.execute(db.text(
+        "DELETE FROM post_likes WHERE id NOT IN (SELECT MIN(id) FROM post_likes GROUP BY post_id, user_id)"
+    ))
+
+
+# Fill the case-folded search keys of users created before the columns existed
+def backfill_user_search_keys(connection):
+    from app.models import search_key
+    users = connection.execute(db.text('SELECT id, username, email FROM "user"')).all()
+    if users:
+        connection.execute(
+            db.text('UPDATE "user" SET username_key = :username_key, email_key = :email_key WHERE id = :id'),
+            [{'id': id, 'username_key': search_key(username), 'email_key': search_key(email)} for id, username, email in users]
+        )
+
+
+# Fail before creating a unique index over rows that break it, listing the offending key values.
+# Rows such as challenge entries carry credits, so they are left for an admin to merge by hand.
+def check_unique(connection, index):
+    columns = ', '.join(f'"{column.name}"' for column in index.columns)
+    duplicates = connection.execute(db.text(
+        f'SELECT {columns}, COUNT(*) FROM "{index.table.name}" GROUP BY {columns} HAVING COUNT(*) > 1 LIMIT 10'
+    )).all()
+    if duplicates:
+        keys = '; '.join(', '.join(f"{column.name}={value}" for column, value in zip(index.columns, row)) for row in duplicates)
+        raise MigrationError(f"Cannot create unique index {index.name}: {index.table.name} has duplicate rows ({keys}). "
+                             f"Remove the duplicates and run upgrade-db again.")
+
+
+# Rewrite SQLite timestamps stored without microseconds (e.g. by CURRENT_TIMESTAMP defaults or older
+# versions of the app) into the 'YYYY-MM-DD HH:MM:SS.ffffff' form SQLAlchemy writes. DateTime columns are
+# compared as strings, so keyset cursors only match rows stored in this one format.
+def normalize_timestamps(connection, table):
+    changed = []
+    for column in table.columns:
+        if not isinstance(column.type, db.DateTime):
+            continue
+        result = connection.execute(db.text(
+            f'UPDATE "{table.name}" SET "{column.name}" = "{column.name}" || \'.000000\' '
+            f'WHERE length("{column.name}") = 19'
+        ))
+        if result.rowcount:
+            changed.append(f"normalized {result.rowcount} timestamp(s) in {table.name}.{column.name}")
+    return changed
+
+
+# Columns whose existing rows need values computed after the column is added
+COLUMN_BACKFILLS = {('user', 'email_key'): backfill_user_search_keys}
+
+# Unique indexes whose duplicate rows can safely be removed before the index is created
+INDEX_DEDUPES = {'uq_post_likes_post_user': dedupe_post_likes}
+
+
+# Bring an existing database up to date with the models without rebuilding it: create missing tables,
+# add missing columns, create missing indexes and normalize stored timestamps. Returns a list describing each change made.
+# Raises MigrationError, with every change rolled back, if a unique index cannot be created.
+def upgrade_schema(engine=None):
+    engine = engine or db.engine
+    applied = []
+
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = {name.lower() for name in inspector.get_table_names()}
+
+        for table in db.metadata.sorted_tables:
+            if table.name.lower() not in existing_tables:
+                table.create(connection)  # Also creates the table's indexes
+                applied.append(f"created table {table.name}")
+                continue
+
+            # Add columns that were introduced after the table was first created
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.server_default is not None:
+                    # SQLite only accepts NOT NULL on an added column when it also has a default
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                    ddl += f" DEFAULT {connection.dialect.ddl_compiler(connection.dialect, None).get_column_default_string(column)}"
+                connection.execute(db.text(ddl))
+                applied.append(f"added column {table.name}.{column.name}")
+                if (table.name, column.name) in COLUMN_BACKFILLS:
+                    COLUMN_BACKFILLS[table.name, column.name](connection)
+
+            # Create declared indexes that the database does not have yet
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                if index.name in INDEX_DEDUPES:
+                    INDEX_DEDUPES[index.name](connection)
+                if index.unique:
+                    check_unique(connection, index)
+                index.create(connection)
+                applied.append(f"created index {index.name}")
+
+            if connection.dialect.name == 'sqlite':
+                applied += normalize_timestamps(connection, table)
+
+    return applied
@@ -1,5 +1,6 @@
 from flask_login import UserMixin  # Provides default implementations for user authentication (like is_authenticated)
 from datetime import datetime, timezone, timedelta
+from sqlalchemy import func  # SQL functions for counter updates
 from app import db  # Importing the SQLAlchemy instance for database interactions
 
 # Define the User model that extends from SQLAlchemy's Model and Flask-Login's UserMixin
@@ -10,7 +11,12 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(60), nullable=False)
     role = db.Column(db.String(10), nullable=False, default='user')
-    date_created = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+
+    # Case-folded copies of username and email behind the indexed prefix search (app/search.py),
+    # filled in from the row being inserted
+    username_key = db.Column(db.String(120), default=lambda context: search_key(context.get_current_parameters()['username']))
+    email_key = db.Column(db.String(120), default=lambda context: search_key(context.get_current_parameters()['email']))
+    date_created = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Tracking user activity metrics
     completed_recipes = db.Column(db.Integer, default=0)
@@ -37,6 +43,16 @@ class User(db.Model, UserMixin):
     # New relationship to achievements
     achievements = db.relationship('Achievement', backref='user', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_user_username_key', 'username_key'),  # Username typeahead
+        db.Index('ix_user_email_key', 'email_key'),  # Admin lookup by email
+    )
+
+
+# Normalized form of a username or email for case-insensitive search
+def search_key(text):
+    return text.strip().casefold() if text else text
+
 
 # In your models.py file
 class PasswordResetRequest(db.Model):
@@ -47,11 +63,15 @@ class PasswordResetRequest(db.Model):
     username = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), nullable=False)
     status = db.Column(db.String(20), default='Pending')  # "Pending", "Approved", or "Rejected"
-    date_requested = db.Column(db.DateTime, default=db.func.current_timestamp())
+    date_requested = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))  # Python-side default keeps the stored format uniform for keyset pagination
 
     # Relationship to User
     user = db.relationship('User', backref=db.backref('reset_requests', cascade="all, delete-orphan"))
 
+    __table_args__ = (
+        db.Index('ix_password_reset_request_status_date', 'status', 'date_requested'),  # Admin list by status
+    )
+
 
 # Define the Tool model which stores information about users' tools
 class Tool(db.Model, UserMixin):
@@ -71,11 +91,16 @@ class Achievement(db.Model):
     credits_won = db.Column(db.Integer, nullable=False)
     completion_time = db.Column(db.DateTime, nullable=False)  # Store when the achievement was completed
 
+    __table_args__ = (
+        db.Index('ix_achievement_user_completion', 'user_id', 'completion_time'),  # A user's achievements, newest first
+    )
+
 
 # Define the association table for users who reported posts
 post_reports = db.Table('post_reports',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
-    db.Column('post_id', db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    db.Column('post_id', db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('date_reported', db.DateTime, default=lambda: datetime.now(timezone.utc))  # NULL for reports made before it existed
 )
 
 # Define the Post model to store users' shared posts, such as recipe posts with images and messages
@@ -85,10 +110,12 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     image_file = db.Column(db.String(100), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    date_posted = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+    date_posted = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))  # Python-side default keeps the stored format uniform for keyset pagination
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     challenge_id = db.Column(db.Integer, db.ForeignKey('challenge.id'), nullable=True)
-    reports = db.Column(db.Integer, default=0)
+    reports = db.Column(db.Integer, default=0)  # Denormalized count of post_reports rows
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Denormalized count of post_likes rows
+    image_status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')  # pending/ready/failed while the image pipeline runs
 
     # Relationships
     likes = db.relationship('PostLike', backref='liked_post', cascade="all, delete-orphan")
@@ -98,12 +125,68 @@ class Post(db.Model):
     # New relationship to track users who reported the post
     reported_by = db.relationship('User', secondary=post_reports, backref='reported_posts')
 
+    # Fan-out copies of this post in followers' timelines, removed together with the post
+    timeline_entries = db.relationship('TimelineEntry', backref='post', cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.Index('ix_post_user_date', 'user_id', 'date_posted'),  # A user's posts, newest first
+        db.Index('ix_post_date', 'date_posted'),  # Admin post list, newest first
+    )
+
     def is_liked_by(self, user):
         return any(like.user_id == user.id for like in self.likes)
 
     def is_reported_by(self, user):
         return user in self.reported_by
 
+    # Atomically adjust the like counter in SQL so concurrent requests cannot lose updates
+    @staticmethod
+    def adjust_like_count(post_id, delta):
+        db.session.execute(
+            db.update(Post).where(Post.id == post_id).values(like_count=Post.like_count + delta)
+        )
+
+    # Atomically adjust the report counter in SQL so concurrent requests cannot lose updates
+    @staticmethod
+    def adjust_report_count(post_id, delta):
+        db.session.execute(
+            db.update(Post).where(Post.id == post_id).values(reports=func.coalesce(Post.reports, 0) + delta)
+        )
+
+    # Remove a user's likes and reports from other posts' counters before those rows are deleted
+    @staticmethod
+    def discount_user_interactions(user_id):
+        likes_by_user = db.select(func.count(PostLike.id)).where(
+            PostLike.post_id == Post.id, PostLike.user_id == user_id
+        ).scalar_subquery()
+        reports_by_user = db.select(func.count()).select_from(post_reports).where(
+            post_reports.c.post_id == Post.id, post_reports.c.user_id == user_id
+        ).scalar_subquery()
+        db.session.execute(
+            db.update(Post).values(
+                like_count=Post.like_count - likes_by_user,
+                reports=func.coalesce(Post.reports, 0) - reports_by_user
+            ).where(
+                Post.id.in_(db.select(PostLike.post_id).where(PostLike.user_id == user_id)) |
+                Post.id.in_(db.select(post_reports.c.post_id).where(post_reports.c.user_id == user_id))
+            )
+        )
+
+    # Recompute every post's like and report counters from the underlying rows in one statement
+    @staticmethod
+    def reconcile_counters():
+        like_totals = db.select(func.count(PostLike.id)).where(PostLike.post_id == Post.id).scalar_subquery()
+        report_totals = db.select(func.count()).select_from(post_reports).where(
+            post_reports.c.post_id == Post.id
+        ).scalar_subquery()
+        result = db.session.execute(
+            db.update(Post).values(like_count=like_totals, reports=report_totals).where(
+                (Post.like_count != like_totals) | (func.coalesce(Post.reports, -1) != report_totals)
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
     # Method to decrement challenge progress
     def decrement_challenge_progress(self):
         if self.challenge_id:
@@ -123,6 +206,26 @@ class PostLike(db.Model):
     # Relationship to user
     user = db.relationship('User', backref='liked_posts')
 
+    __table_args__ = (
+        db.Index('uq_post_likes_post_user', 'post_id', 'user_id', unique=True),  # One like per user per post
+    )
+
+# Materialized home timeline: one row per (reader, post), written when the post is shared
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline_entry'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)  # Owner of the timeline
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)  # Lets block/unfollow prune without a join
+    date_posted = db.Column(db.DateTime, nullable=False)  # Copied from the post so the feed is a single index range scan
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='uq_timeline_entry_user_post'),
+        db.Index('ix_timeline_entry_user_date', 'user_id', 'date_posted', 'post_id'),
+    )
+
+
 # Define the Friendship model to represent the relationship between users (user friendships)
 class Friendship(db.Model):
     __tablename__ = 'friendship'
@@ -142,6 +245,29 @@ class Friendship(db.Model):
     # 'foreign_keys' specifies which foreign key is used for each relationship
     # 'backref' provides convenient access to friendship records and friends from the User model
 
+    __table_args__ = (
+        db.Index('ix_friendship_user_status', 'user_id', 'status'),  # Outgoing requests and friends
+        db.Index('ix_friendship_friend_status', 'friend_id', 'status'),  # Incoming requests and friends
+    )
+
+# Precomputed "people you may know" candidates, written by the suggestion job (app/suggestions.py).
+# Each user has at most FRIEND_SUGGESTIONS_PER_USER rows, ranked by the number of mutual friends.
+class FriendSuggestion(db.Model):
+    __tablename__ = 'friend_suggestion'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    candidate_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    mutual_friends = db.Column(db.Integer, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 1 is the strongest suggestion
+
+    candidate = db.relationship('User', foreign_keys=[candidate_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'rank', name='uq_friend_suggestion_user_rank'),  # A user's list, in order
+        db.Index('ix_friend_suggestion_candidate', 'candidate_id'),  # Cleanup when a candidate is deleted
+    )
+
 class Challenge(db.Model):
     __tablename__ = 'challenge'
     id = db.Column(db.Integer, primary_key=True)
@@ -152,10 +278,15 @@ class Challenge(db.Model):
     duration = db.Column(db.Integer, nullable=False)  # Duration in seconds
     started_at = db.Column(db.DateTime, nullable=False)  # Start time of the challenge
     ended = db.Column(db.Boolean, default=False)  # Field to mark if the challenge has ended
+    image_status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')  # pending/ready/failed while the icon is processed
 
     # Relationship to participants
     participants = db.relationship('ChallengeParticipant', backref='challenge_participation', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_challenge_ended_started', 'ended', 'started_at'),  # Active/ended challenge listings
+    )
+
     def __init__(self, name, icon, creator_id, credits_required, duration, started_at=None):
         self.name = name
         self.icon = icon
@@ -220,6 +351,11 @@ class ChallengeParticipant(db.Model):
     # Relationship to the challenge with a unique backref name
     challenge = db.relationship('Challenge', backref='participants_in_challenge')
 
+    __table_args__ = (
+        db.Index('ix_challenge_participant_challenge_progress', 'challenge_id', 'progress'),  # Leaderboards and winners
+        db.Index('uq_challenge_participant_user_challenge', 'user_id', 'challenge_id', unique=True),  # One entry per user per challenge
+    )
+
 
 class CreditRequest(db.Model):
     __tablename__ = 'credit_request'
@@ -228,12 +364,17 @@ class CreditRequest(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     status = db.Column(db.String(20), default='Pending')
     proof_image = db.Column(db.String(200), nullable=False)
+    image_status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')  # pending/ready/failed while the proof is processed
     credits_requested = db.Column(db.Integer, nullable=False)
     date_submitted = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Relationship to user
     user = db.relationship('User', backref=db.backref('credit_requests', passive_deletes=True))
 
+    __table_args__ = (
+        db.Index('ix_credit_request_status_date', 'status', 'date_submitted'),  # Pending queue and history
+    )
+
     def __init__(self, user_id, proof_image, credits_requested):
         self.user_id = user_id
         self.proof_image = proof_image
@@ -259,6 +400,41 @@ class AdminCreditAction(db.Model):
         self.action = action
         self.added_credits = added_credits
 
+# Append-only, double-entry record of every credit movement. Each transfer writes two rows with the
+# same transaction_id whose amounts sum to zero; User.credits is the materialized balance of 'user:<id>'.
+class CreditLedger(db.Model):
+    __tablename__ = 'credit_ledger'
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.String(32), nullable=False)  # Shared by the two legs of one transfer
+    account = db.Column(db.String(50), nullable=False)  # 'user:<id>', 'challenge:<id>' or a system account
+    amount = db.Column(db.Integer, nullable=False)  # Positive when the account receives credits, negative when it pays
+    kind = db.Column(db.String(30), nullable=False)  # e.g. challenge_wager, challenge_payout, deposit, withdrawal
+    reference_id = db.Column(db.Integer, nullable=True)  # Challenge, credit request or withdraw request id
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.Index('ix_credit_ledger_account_created', 'account', 'created_at'),  # An account's history, newest first
+        db.Index('ix_credit_ledger_transaction', 'transaction_id'),
+    )
+
+# Pre-aggregated activity counters written by the rollup job (app/metrics.py): one row per metric per
+# hour or day bucket. updated_at only moves when a value changes, so readers can tell when to redraw.
+class MetricRollup(db.Model):
+    __tablename__ = 'metric_rollup'
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    metric = db.Column(db.String(30), nullable=False)  # e.g. signups, credits_in, challenge_joins
+    bucket_start = db.Column(db.DateTime, nullable=False)  # Start of the hour or day, UTC
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.UniqueConstraint('period', 'metric', 'bucket_start', name='uq_metric_rollup_bucket'),
+        db.Index('ix_metric_rollup_period_updated', 'period', 'updated_at'),  # Latest change, for chart versions
+    )
+
 class AdminNotification(db.Model):
     __tablename__ = 'admin_notification'
     
@@ -294,3 +470,7 @@ class CreditWithdrawRequest(db.Model):
     date_approved = db.Column(db.DateTime)
     
     user = db.relationship('User', backref='credit_withdraw_requests')
+
+    __table_args__ = (
+        db.Index('ix_credit_withdraw_request_status_date', 'status', 'date_requested'),  # Pending queue and history
+    )
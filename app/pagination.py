@@ -0,0 +1,74 @@
+import base64
+import binascii
+import json
+import time
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app, request
+
+# One page of a list view: its rows and the cursor of the next page (None on the last page)
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+# The filters of a list view taken from the query string
+ListParams = namedtuple('ListParams', ['q', 'status', 'sort', 'cursor'])
+
+
+# Read ?q=&status=&sort=&cursor= for a list view; unknown statuses and sorts fall back to the defaults
+def list_params(statuses, sorts, default_sort):
+    status = request.args.get('status', '')
+    sort = request.args.get('sort', default_sort)
+    return ListParams(
+        q=request.args.get('q', '').strip(),
+        status=status if status in statuses else '',
+        sort=sort if sort in sorts else default_sort,
+        cursor=request.args.get('cursor') or None,
+    )
+
+
+# Cursors are the sort value and id of the last row of a page, as URL-safe base64 JSON
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+
+# Raises ValueError for a cursor that was not produced by encode_cursor for this column
+def decode_cursor(cursor, sort_column):
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort_column.type.python_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (binascii.Error, TypeError, UnicodeDecodeError) as e:  # json.JSONDecodeError is a ValueError
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+# Keyset pagination: rows after the cursor in (sort_column, id_column) order, without OFFSET, so every
+# page costs the same however deep it is. sort_column must not contain NULLs.
+def keyset_page(query, sort_column, id_column, descending, cursor, page_size):
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_column)
+        if descending:
+            query = query.filter((sort_column < sort_value) | ((sort_column == sort_value) & (id_column < row_id)))
+        else:
+            query = query.filter((sort_column > sort_value) | ((sort_column == sort_value) & (id_column > row_id)))
+
+    order = (sort_column.desc(), id_column.desc()) if descending else (sort_column.asc(), id_column.asc())
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(*order).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return Page(rows, None)
+    rows = rows[:page_size]
+    return Page(rows, encode_cursor(getattr(rows[-1], sort_column.key), getattr(rows[-1], id_column.key)))
+
+
+# Per-status row counts for a list view's filter tabs. compute() runs one GROUP BY and its result is
+# reused for ADMIN_COUNT_CACHE_SECONDS, so paging and searching do not recount the table.
+def cached_counts(name, compute):
+    cache = current_app.extensions['admin_count_cache']
+    cached = cache.get(name)
+    if cached and time.monotonic() - cached[0] < current_app.config['ADMIN_COUNT_CACHE_SECONDS']:
+        return cached[1]
+    counts = compute()
+    cache.set(name, (time.monotonic(), counts))
+    return counts
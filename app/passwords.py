@@ -0,0 +1,101 @@
+import threading  # Bounds how many hashes can wait for a worker
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app import bcrypt, db
+
+
+# Raised when every hashing slot is taken; routes answer 503 rather than queueing the request
+class PasswordHasherBusy(Exception):
+    pass
+
+
+# Runs bcrypt on a small thread pool (bcrypt releases the GIL while hashing), so at most max_workers
+# hashes use the CPU at once however many requests are signing in. At most max_pending hashes may be
+# running or waiting; beyond that a request is turned away immediately instead of piling up behind them.
+class PasswordHasher:
+    def __init__(self, max_workers=4, max_pending=16):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    # Start the worker threads on first use, so app start-up and the CLI do not pay for them
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hasher')
+            return self._executor
+
+    # Run fn(*args) on the pool and wait for its result, or raise PasswordHasherBusy if no slot is free
+    def run(self, fn, *args):
+        if self.max_workers == 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except RuntimeError:  # The pool is shutting down
+            self._slots.release()
+            return fn(*args)
+        future.add_done_callback(lambda done: self._slots.release())
+        return future.result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+# Work factor ("log rounds") of a bcrypt hash such as $2b$12$..., or None if it is not a bcrypt hash
+def hash_cost(pw_hash):
+    parts = pw_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(pw_hash):
+    return hash_cost(pw_hash) != current_app.config['BCRYPT_LOG_ROUNDS']
+
+
+# Hash a new password with the configured work factor
+def hash_password(password):
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    return get_password_hasher().run(bcrypt.generate_password_hash, password, rounds).decode('utf-8')
+
+
+def check_password(pw_hash, password):
+    return get_password_hasher().run(bcrypt.check_password_hash, pw_hash, password)
+
+
+# Check and hash in one job, so a password change takes a single slot: the new hash, or None if the
+# password is the same as the current one
+def _hash_unless_current(pw_hash, password, rounds):
+    if hash_cost(pw_hash) and bcrypt.check_password_hash(pw_hash, password):
+        return None
+    return bcrypt.generate_password_hash(password, rounds)
+
+
+def replace_password(pw_hash, password):
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    new_hash = get_password_hasher().run(_hash_unless_current, pw_hash, password, rounds)
+    return new_hash.decode('utf-8') if new_hash else None
+
+
+# After a successful login, rehash a password stored with an older work factor while the plain
+# password is at hand. Skipped when the pool is busy; the next login tries again.
+def upgrade_password_hash(user, password):
+    if not needs_rehash(user.password):
+        return False
+    try:
+        user.password = hash_password(password)
+    except PasswordHasherBusy:
+        return False
+    db.session.commit()
+    return True
@@ -0,0 +1,63 @@
+from flask import current_app, request
+from app import db
+from app.models import Friendship, User, search_key
+
+# Sorts after every character, so [prefix, prefix + PREFIX_END) covers all keys starting with prefix
+PREFIX_END = '\U0010ffff'
+
+
+# Case-insensitive prefix match on a case-folded key column, as an index range scan
+def prefix_filter(column, prefix):
+    return (column >= prefix) & (column < prefix + PREFIX_END)
+
+
+# Number of search results to return: ?limit=, capped at USER_SEARCH_LIMIT
+def search_limit():
+    limit = current_app.config['USER_SEARCH_LIMIT']
+    return max(1, min(request.args.get('limit', limit, type=int), limit))
+
+
+# Up to limit users whose username starts with q (case-insensitively), in username order. Regular users
+# never see themselves, admins or anyone who has blocked them; admins also match on email prefixes.
+def search_users(q, viewer, limit):
+    key = search_key(q or '')
+    if not key:
+        return []
+
+    filters = []
+    if viewer.role != 'admin':
+        blocked_by = db.session.query(Friendship.user_id).filter(Friendship.friend_id == viewer.id, Friendship.is_blocked == True)
+        filters = [User.id != viewer.id, User.role != 'admin', ~User.id.in_(blocked_by)]
+
+    users = User.query.filter(prefix_filter(User.username_key, key), *filters).order_by(User.username_key).limit(limit).all()
+    if viewer.role == 'admin':
+        by_email = User.query.filter(prefix_filter(User.email_key, key)).order_by(User.email_key).limit(limit).all()
+        users = sorted({user.id: user for user in users + by_email}.values(), key=lambda user: user.username_key)[:limit]
+    return users
+
+
+# The viewer's relationship with each of user_ids, from a single query: 'blocked' (by the viewer),
+# 'friend', 'request_sent', 'request_received' or None
+def relationship_statuses(viewer_id, user_ids):
+    statuses = dict.fromkeys(user_ids)
+    if not user_ids:
+        return statuses
+    priority = {None: 0, 'request_received': 1, 'request_sent': 2, 'friend': 3, 'blocked': 4}
+    friendships = Friendship.query.filter(
+        ((Friendship.user_id == viewer_id) & Friendship.friend_id.in_(user_ids)) |
+        ((Friendship.friend_id == viewer_id) & Friendship.user_id.in_(user_ids))
+    ).all()
+    for friendship in friendships:
+        outgoing = friendship.user_id == viewer_id
+        other_id = friendship.friend_id if outgoing else friendship.user_id
+        if friendship.is_blocked:
+            status = 'blocked' if outgoing else None
+        elif friendship.status == 'accepted':
+            status = 'friend'
+        elif friendship.status == 'pending':
+            status = 'request_sent' if outgoing else 'request_received'
+        else:
+            status = None
+        if priority[status] > priority[statuses[other_id]]:
+            statuses[other_id] = status
+    return statuses
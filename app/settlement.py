@@ -0,0 +1,152 @@
+import heapq  # Min-heap of upcoming challenge deadlines
+import threading  # Runs the scheduler loop next to the web server
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from app import db
+from app.models import Achievement, Challenge, ChallengeParticipant
+from app.ledger import pay_winnings
+from app.home import invalidate_home_context
+from app.leaderboard import RANKING_ORDER
+
+
+# Get the participant with the highest progress in a challenge (earliest joiner wins a tie), i.e. the
+# leader shown on the leaderboard
+def get_winning_participant(challenge_id):
+    return ChallengeParticipant.query.filter_by(challenge_id=challenge_id).order_by(*RANKING_ORDER).first()
+
+
+# End a challenge and pay its winner in a single transaction. Safe to call more than once:
+# the conditional UPDATEs make sure the challenge is ended and the winner is credited exactly once.
+def settle_challenge(challenge_id):
+    challenge = db.session.get(Challenge, challenge_id)
+    if challenge is None:
+        return None
+
+    db.session.execute(
+        db.update(Challenge).where(Challenge.id == challenge_id, Challenge.ended == False).values(ended=True)
+    )
+
+    winner = get_winning_participant(challenge_id)
+    credits_won = 0
+    if winner:
+        # Claim the payout; only the transaction that flips credited from False to True pays
+        claimed = db.session.execute(
+            db.update(ChallengeParticipant)
+            .where(ChallengeParticipant.id == winner.id, ChallengeParticipant.credited == False)
+            .values(credited=True)
+        ).rowcount
+        if claimed:
+            credits_won = db.session.query(
+                db.func.coalesce(db.func.sum(ChallengeParticipant.wagered_credits), 0)
+            ).filter_by(challenge_id=challenge_id).scalar()
+            pay_winnings(winner.user_id, challenge_id, credits_won)
+            existing_achievement = Achievement.query.filter_by(user_id=winner.user_id, challenge_id=challenge_id).first()
+            if not existing_achievement:
+                db.session.add(Achievement(
+                    user_id=winner.user_id,
+                    challenge_id=challenge_id,
+                    challenge_name=challenge.name,
+                    credits_won=credits_won,
+                    completion_time=challenge.get_end_time()
+                ))
+
+    db.session.commit()
+    db.session.expire_all()  # Objects loaded before the SQL-side updates are now stale
+
+    # Ended challenges are no longer ranked
+    leaderboard = current_app.extensions.get('leaderboard')
+    if leaderboard:
+        leaderboard.remove_challenge(challenge_id)
+    invalidate_home_context()  # No longer active or featured
+    invalidate_home_context(*[participant.user_id for participant in challenge.participants])
+    return credits_won
+
+
+# Settle every challenge whose deadline has passed, plus ended challenges whose winner was never paid
+def settle_due_challenges(now=None):
+    now = now or datetime.now(timezone.utc)
+    due_ids = [challenge.id for challenge in Challenge.query.filter_by(ended=False) if challenge.get_end_time() <= now]
+    unpaid_ids = [challenge_id for (challenge_id,) in db.session.query(Challenge.id).filter(
+        Challenge.ended == True,
+        Challenge.participants.any(),
+        ~Challenge.participants.any(ChallengeParticipant.credited == True)
+    )]
+    for challenge_id in due_ids + unpaid_ids:
+        settle_challenge(challenge_id)
+    return len(due_ids) + len(unpaid_ids)
+
+
+# Keeps a min-heap of upcoming challenge deadlines and settles each challenge when its deadline passes
+class SettlementScheduler:
+    def __init__(self, app, refresh_interval=60):
+        self.app = app
+        self.refresh_interval = refresh_interval  # Reload deadlines periodically to see challenges created elsewhere
+        self._deadlines = []  # Heap of (end_time, challenge_id)
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Add a challenge's deadline to the heap (ignored if it is already scheduled)
+    def schedule(self, challenge_id, end_time):
+        with self._lock:
+            if challenge_id in self._scheduled:
+                return
+            self._scheduled.add(challenge_id)
+            heapq.heappush(self._deadlines, (end_time, challenge_id))
+        self._wakeup.set()  # The new deadline may be earlier than the one the loop is sleeping towards
+
+    # Load the deadlines of all active challenges from the database and settle anything already overdue
+    def refresh(self):
+        with self.app.app_context():
+            settle_due_challenges()
+            for challenge in Challenge.query.filter_by(ended=False):
+                self.schedule(challenge.id, challenge.get_end_time())
+
+    # Settle every scheduled challenge whose deadline is at or before now; returns how many were settled
+    def run_pending(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        due = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, challenge_id = heapq.heappop(self._deadlines)
+                self._scheduled.discard(challenge_id)
+                due.append(challenge_id)
+        if due:
+            with self.app.app_context():
+                for challenge_id in due:
+                    settle_challenge(challenge_id)
+        return len(due)
+
+    # Seconds until the earliest deadline, capped at the refresh interval
+    def seconds_until_next(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            if not self._deadlines:
+                return self.refresh_interval
+            wait = (self._deadlines[0][0] - now).total_seconds()
+        return min(max(wait, 0), self.refresh_interval)
+
+    # Main loop: sleep until the next deadline (or a new, earlier one is scheduled), then settle
+    def run_forever(self):
+        next_refresh = datetime.now(timezone.utc)
+        while not self._stop.is_set():
+            now = datetime.now(timezone.utc)
+            if now >= next_refresh:
+                self.refresh()
+                next_refresh = now + timedelta(seconds=self.refresh_interval)
+            self.run_pending()
+            self._wakeup.wait(self.seconds_until_next())
+            self._wakeup.clear()
+
+    # Run the loop on a daemon thread inside the web server process
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name='challenge-settlement', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,59 @@
+// Username typeahead for inputs marked with data-user-search. As the user types, the endpoint in
+// data-endpoint is queried and its matches are listed in the element named by data-results.
+// With data-request-url (a send_friend_request URL for user id 0), users without a relationship
+// get a "Send Request" button.
+
+const STATUS_LABELS = {
+  friend: 'Friend',
+  blocked: 'Blocked',
+  request_sent: 'Request Sent',
+  request_received: 'Wants to be friends'
+};
+
+function userSearchItem(input, result) {
+  const item = document.createElement('li');
+  item.className = 'list-group-item';
+  item.textContent = result.username;
+
+  const detail = result.email ? `${result.email} (${result.role})` : STATUS_LABELS[result.status];
+  if (detail) {
+    const badge = document.createElement('span');
+    badge.className = 'badge badge-secondary ml-2';
+    badge.textContent = detail;
+    item.appendChild(badge);
+  } else if (input.dataset.requestUrl) {
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = input.dataset.requestUrl.replace(/\/0$/, `/${result.id}`);
+    form.className = 'd-inline ml-2';
+    form.innerHTML = '<button type="submit" class="btn btn-primary btn-sm">Send Request</button>';
+    item.appendChild(form);
+  }
+  return item;
+}
+
+function runUserSearch(input) {
+  const results = document.getElementById(input.dataset.results);
+  const q = input.value.trim();
+  if (!q) {
+    results.replaceChildren();
+    return;
+  }
+  fetch(`${input.dataset.endpoint}?${new URLSearchParams({q})}`)
+    .then(response => response.json())
+    .then(data => {
+      if (input.value.trim() !== q) return;  // A newer query is on its way
+      results.replaceChildren(...data.results.map(result => userSearchItem(input, result)));
+    })
+    .catch(error => console.error('Error:', error));
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  document.querySelectorAll('[data-user-search]').forEach(input => {
+    let timer;
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => runUserSearch(input), 200);  // Wait for a pause in typing
+    });
+  });
+});
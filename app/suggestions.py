@@ -0,0 +1,116 @@
+import numpy as np  # Vectorized sparse adjacency and friends-of-friends counting
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Friendship, FriendSuggestion, User
+
+ROW_BLOCK_SIZE = 1024  # Users whose friends-of-friends are counted per vectorized step
+
+
+# Accepted, unblocked friendships as a symmetric adjacency matrix in CSR form. Returns (ids, indptr,
+# indices): the friends of the user with id ids[i] are ids[indices[indptr[i]:indptr[i + 1]]].
+def friendship_graph():
+    pairs = np.array(db.session.query(Friendship.user_id, Friendship.friend_id).filter(
+        Friendship.status == 'accepted', Friendship.is_blocked == False
+    ).all(), dtype=np.int64).reshape(-1, 2)
+    edges = np.concatenate([pairs, pairs[:, ::-1]])  # Friendship is stored once but goes both ways
+    ids, positions = np.unique(edges, return_inverse=True)
+    positions = positions.reshape(-1, 2)
+
+    # Sorted, de-duplicated (row, column) keys give the CSR arrays directly
+    n = len(ids)
+    keys = np.unique(positions[:, 0] * n + positions[:, 1])
+    rows, indices = keys // n, keys % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return ids, indptr, indices
+
+
+# Keys (row * n + column) of the pairs that must never be suggested: pending requests and blocks in
+# either direction, between users that are both in the graph
+def excluded_pair_keys(ids):
+    pairs = np.array(db.session.query(Friendship.user_id, Friendship.friend_id).filter(
+        (Friendship.status != 'accepted') | (Friendship.is_blocked == True)
+    ).all(), dtype=np.int64).reshape(-1, 2)
+    pairs = np.concatenate([pairs, pairs[:, ::-1]])
+    positions = np.searchsorted(ids, pairs).clip(max=max(len(ids) - 1, 0))
+    in_graph = (ids[positions] == pairs).all(axis=1) if len(ids) else np.zeros(len(pairs), dtype=bool)
+    positions = positions[in_graph]
+    return np.unique(positions[:, 0] * len(ids) + positions[:, 1])
+
+
+# Friends-of-friends counts for the users at rows start..stop: the same rows of A·A for the adjacency
+# matrix A, computed by gathering each neighbour's neighbour list. Returns parallel arrays
+# (row, candidate column, mutual friend count), excluding the users themselves.
+def mutual_friend_counts(indptr, indices, start, stop):
+    degrees = np.diff(indptr)
+    rows = np.repeat(np.arange(start, stop), degrees[start:stop])
+    neighbours = indices[indptr[start]:indptr[stop]]
+
+    # Concatenate the neighbour lists of every neighbour without a Python loop
+    lengths = degrees[neighbours]
+    offsets = np.repeat(indptr[neighbours] - (np.cumsum(lengths) - lengths), lengths)
+    candidates = indices[np.arange(lengths.sum()) + offsets]
+    owners = np.repeat(rows, lengths)
+
+    n = len(indptr) - 1
+    keys, counts = np.unique(owners * n + candidates, return_counts=True)
+    owners, candidates = keys // n, keys % n
+    keep = owners != candidates
+    return owners[keep], candidates[keep], counts[keep]
+
+
+# Rebuild every user's top-K suggestions: candidates ranked by mutual friend count (then by id), never
+# the user themselves, an existing friend, someone with a pending request or block, or an admin.
+# Replaces the whole table in one transaction; returns the number of suggestions written.
+def compute_friend_suggestions(per_user=None):
+    per_user = per_user or current_app.config['FRIEND_SUGGESTIONS_PER_USER']
+    ids, indptr, indices = friendship_graph()
+    n = len(ids)
+    excluded = excluded_pair_keys(ids)
+    admin_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.role == 'admin')]
+    is_admin = np.isin(ids, admin_ids)
+
+    rows = []
+    for start in range(0, n, ROW_BLOCK_SIZE):
+        stop = min(start + ROW_BLOCK_SIZE, n)
+        owners, candidates, counts = mutual_friend_counts(indptr, indices, start, stop)
+
+        # Drop existing friends (entries of A itself), excluded pairs and admin candidates
+        friend_keys = np.repeat(np.arange(start, stop), np.diff(indptr)[start:stop]) * n + indices[indptr[start]:indptr[stop]]
+        keys = owners * n + candidates
+        keep = ~np.isin(keys, friend_keys) & ~np.isin(keys, excluded) & ~is_admin[candidates]
+        owners, candidates, counts = owners[keep], candidates[keep], counts[keep]
+
+        # Rank within each user: most mutual friends first, lower id breaks ties; keep the top K
+        order = np.lexsort((ids[candidates], -counts, owners))
+        owners, candidates, counts = owners[order], candidates[order], counts[order]
+        group_starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if len(owners) else np.array([], dtype=np.int64)
+        ranks = np.arange(len(owners)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(owners)])) + 1
+        top = ranks <= per_user
+        rows += [
+            {'user_id': int(user_id), 'candidate_id': int(candidate_id), 'mutual_friends': int(count), 'rank': int(rank)}
+            for user_id, candidate_id, count, rank in zip(ids[owners[top]], ids[candidates[top]], counts[top], ranks[top])
+        ]
+
+    db.session.execute(db.delete(FriendSuggestion))
+    if rows:
+        db.session.execute(db.insert(FriendSuggestion), rows)
+    db.session.commit()
+    return len(rows)
+
+
+# Drop the suggestions between two users once a request or block exists between them (the caller commits)
+def discard_suggestions(user_id, other_id):
+    db.session.execute(db.delete(FriendSuggestion).where(
+        ((FriendSuggestion.user_id == user_id) & (FriendSuggestion.candidate_id == other_id)) |
+        ((FriendSuggestion.user_id == other_id) & (FriendSuggestion.candidate_id == user_id))
+    ))
+
+
+# A user's ranked suggestions as (User, mutual friend count) pairs, in a single indexed read
+def get_friend_suggestions(user_id, limit):
+    suggestions = FriendSuggestion.query.options(joinedload(FriendSuggestion.candidate)) \
+                                        .filter_by(user_id=user_id) \
+                                        .order_by(FriendSuggestion.rank).limit(limit).all()
+    return [(suggestion.candidate, suggestion.mutual_friends) for suggestion in suggestions]
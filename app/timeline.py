@@ -0,0 +1,64 @@
+from app import db
+from app.models import Friendship, Post, TimelineEntry
+
+
+# Query for the ids of everyone with an accepted friendship with the given user, in either direction
+def accepted_friend_ids(user_id):
+    return db.select(Friendship.user_id).where(
+        Friendship.friend_id == user_id, Friendship.status == 'accepted'
+    ).union(
+        db.select(Friendship.friend_id).where(
+            Friendship.user_id == user_id, Friendship.status == 'accepted'
+        )
+    )
+
+
+# Push a newly shared post into the author's own timeline and every accepted friend's timeline.
+# The post must already be flushed so that it has an id and a date_posted.
+def fan_out_post(post):
+    reader_ids = {post.user_id}
+    reader_ids.update(db.session.scalars(accepted_friend_ids(post.user_id)))
+    db.session.execute(db.insert(TimelineEntry), [
+        {'user_id': reader_id, 'post_id': post.id, 'author_id': post.user_id, 'date_posted': post.date_posted}
+        for reader_id in reader_ids
+    ])
+
+
+# Copy every existing post by author_id into reader_id's timeline, skipping posts already there
+def backfill_pair(reader_id, author_id):
+    already_present = db.select(TimelineEntry.id).where(
+        TimelineEntry.user_id == reader_id, TimelineEntry.post_id == Post.id
+    ).exists()
+    rows = db.select(
+        db.literal(reader_id), Post.id, Post.user_id, Post.date_posted
+    ).where(Post.user_id == author_id, ~already_present)
+    db.session.execute(
+        db.insert(TimelineEntry).from_select(['user_id', 'post_id', 'author_id', 'date_posted'], rows)
+    )
+
+
+# Remove two users' posts from each other's timelines after a block or unfollow
+def prune_pair(user_id, other_id):
+    TimelineEntry.query.filter(
+        ((TimelineEntry.user_id == user_id) & (TimelineEntry.author_id == other_id)) |
+        ((TimelineEntry.user_id == other_id) & (TimelineEntry.author_id == user_id))
+    ).delete(synchronize_session=False)
+
+
+# Rebuild every timeline from posts and accepted friendships in one set-based statement
+def backfill_timelines():
+    TimelineEntry.query.delete(synchronize_session=False)
+    accepted = Friendship.status == 'accepted'
+    own_posts = db.select(Post.user_id, Post.id, Post.user_id, Post.date_posted)
+    sender_reads = db.select(Friendship.user_id, Post.id, Post.user_id, Post.date_posted) \
+                     .join(Friendship, Friendship.friend_id == Post.user_id).where(accepted)
+    receiver_reads = db.select(Friendship.friend_id, Post.id, Post.user_id, Post.date_posted) \
+                       .join(Friendship, Friendship.user_id == Post.user_id).where(accepted)
+    result = db.session.execute(
+        db.insert(TimelineEntry).from_select(
+            ['user_id', 'post_id', 'author_id', 'date_posted'],
+            db.union(own_posts, sender_reads, receiver_reads)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
@@ -1,16 +1,25 @@
-from flask import Blueprint, render_template, url_for, flash, redirect, request, abort, current_app
+from flask import Blueprint, render_template, url_for, flash, redirect, request, abort, current_app, jsonify, Response, stream_with_context
 from flask_login import login_user, current_user, logout_user, login_required
-from PIL import Image
-from app import db, bcrypt
+from app import db
 from app.forms import ForgotPasswordForm, RegisterForm, LoginForm, ConversionForm, ToolForm, RecipeConversionForm, SharePostForm, JoinChallengeForm, CreditRequestForm, WithdrawForm
-from app.models import CreditWithdrawRequest, PasswordResetRequest, PostLike, ShoppingList, User, Tool, Achievement, Friendship, Post, Challenge, ChallengeParticipant, db, CreditRequest, AdminNotification
-from app.utils import convert_measurement, process_recipe
+from app.models import CreditWithdrawRequest, PasswordResetRequest, PostLike, ShoppingList, User, Tool, Achievement, Friendship, Post, Challenge, ChallengeParticipant, db, CreditRequest, AdminNotification, TimelineEntry, post_reports
+from app.timeline import fan_out_post, backfill_pair, prune_pair
+from app.settlement import settle_challenge, settle_due_challenges
+from app.leaderboard import get_leaderboard_service, participant_join_order
+from app.images import stage_image, discard_staged_image, queue_image
+from app.ledger import InsufficientCredits, wager_credits, account_history
+from app.suggestions import discard_suggestions, get_friend_suggestions
+from app.search import search_users, search_limit, relationship_statuses
+from app.home import get_site_summary, get_user_summary, invalidate_home_context
+from app.identity import invalidate_identity
+from app.passwords import PasswordHasherBusy, check_password, hash_password, upgrade_password_hash
+from app.utils import SUPPORTED_UNITS, convert_measurement, normalize_unit, process_recipe_cached, get_user_tools, invalidate_user_tools
 from app.forms import ChallengeForm, RegisterForm, LoginForm, ConversionForm, ToolForm, RecipeConversionForm, SharePostForm, ChallengeForm
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import joinedload
 from sqlalchemy import func
-from fractions import Fraction  # Import the Fraction class
-import os, secrets
+from sqlalchemy.exc import IntegrityError
+import json
 
 
 # Create a blueprint for user-related routes
@@ -21,9 +30,11 @@ user = Blueprint('user', __name__)
 @user.route('/')
 @login_required  # Requires user login
 def index():
-    users = User.query.all()  # Get all users for display
+    # Counts and featured challenges shared by everyone, plus the user's own summary, both cached briefly
+    site = get_site_summary()
+    summary = get_user_summary(current_user.id)
     added_friend = request.args.get('added_friend')  # Get the name of the friend added, if any
-    return render_template('index.html', users=users, added_friend=added_friend)
+    return render_template('index.html', site=site, summary=summary, added_friend=added_friend)
 
 
 # Route for user login
@@ -34,8 +45,17 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():  # When the login form is submitted and validated
         user = User.query.filter_by(email=form.email.data).first()  # Fetch the user by email
-        # Check if user exists and password matches
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        # Check if user exists and password matches, turning the request away if the hashing pool is saturated
+        try:
+            valid = user is not None and check_password(user.password, form.password.data)
+        except PasswordHasherBusy:
+            flash('Too many sign-in attempts right now. Please try again in a moment.', 'warning')
+            return render_template('login.html', form=form), 503, {'Retry-After': '1'}
+        if valid:
+            upgrade_password_hash(user, form.password.data)  # Rehash if the work factor has changed
+            user.last_login = datetime.now(timezone.utc)  # Notifications list challenges started since then
+            invalidate_identity(user.id)
+            db.session.commit()
             login_user(user, remember=form.remember.data)  # Log the user in
             next_page = request.args.get('next')  # Get the next page if redirected
             if user.role == 'admin':
@@ -59,34 +79,31 @@ def register():
         if form.password.data != form.confirm_password.data:
             flash('Password and Confirm Password do not match.', 'danger')
         else:
-            # Check for existing users by username or email
-            existing_user_by_username = User.query.filter_by(username=form.username.data).first()
-            existing_user_by_email = User.query.filter_by(email=form.email.data).first()
-            if existing_user_by_username:
-                flash('That username is taken. Please choose a different one.', 'danger')
-            elif existing_user_by_email:
-                flash('That email is already in use. Please choose a different one.', 'danger')
-            else:
-                # Check if the user selected "Admin" and validate admin password
-                if form.role.data == 'admin':
-                    special_admin_password = "123456"  # Admin password 
-                    if form.admin_password.data != special_admin_password:
-                        flash('Invalid admin password. Please try again.', 'danger')
-                        return render_template('register.html', title='Register', form=form)
-                
-                # Hash the password and create a new user
-                hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
-                new_user = User(
-                    username=form.username.data,
-                    email=form.email.data,
-                    password=hashed_password,
-                    role=form.role.data
-                )
-                db.session.add(new_user)
-                db.session.commit()
-                flash('Your account has been created! You are now able to log in', 'success')
-                return redirect(url_for('user.login'))
-    
+            # Username and email uniqueness was checked by the form, in a single query
+            # Check if the user selected "Admin" and validate admin password
+            if form.role.data == 'admin':
+                special_admin_password = "123456"  # Admin password 
+                if form.admin_password.data != special_admin_password:
+                    flash('Invalid admin password. Please try again.', 'danger')
+                    return render_template('register.html', title='Register', form=form)
+            
+            # Hash the password and create a new user
+            try:
+                hashed_password = hash_password(form.password.data)
+            except PasswordHasherBusy:
+                flash('Too many sign-ups right now. Please try again in a moment.', 'warning')
+                return render_template('register.html', title='Register', form=form), 503, {'Retry-After': '1'}
+            new_user = User(
+                username=form.username.data,
+                email=form.email.data,
+                password=hashed_password,
+                role=form.role.data
+            )
+            db.session.add(new_user)
+            db.session.commit()
+            flash('Your account has been created! You are now able to log in', 'success')
+            return redirect(url_for('user.login'))
+
     elif form.errors:  # Handle any form validation errors
         for field, errors in form.errors.items():
             for error in errors:
@@ -150,10 +167,10 @@ def manual_conversion_tool():
 def automatic_conversion():
     form = RecipeConversionForm()
 
-    # Fetch user's tools and populate the form choices
-    user_tools = Tool.query.filter_by(owner_id=current_user.id).all()
+    # Fetch user's tools (cached per user) and populate the form choices
+    user_tools = get_user_tools(current_user.id)
     form.to_unit.choices = [
-        (f"{tool.name} - {tool.unit}", f"{tool.name} ({tool.unit})") for tool in user_tools
+        (f"{name} - {unit}", f"{name} ({unit})") for name, unit in user_tools
     ]
 
     converted_recipe = None
@@ -165,11 +182,8 @@ def automatic_conversion():
             flash("Please provide a recipe text for conversion.", 'warning')
         else:
             try:
-                # Convert decimals in the recipe text to fractions before conversion
-                recipe_text = convert_decimals_to_fractions(recipe_text)
-
-                # Attempt to convert the recipe
-                converted_recipe = process_recipe(recipe_text, to_unit, current_user.id)
+                # Tokenize and convert the recipe in a single pass, reusing cached ingredient lines
+                converted_recipe = process_recipe_cached(recipe_text, to_unit, current_user.id)
                 
                 if not converted_recipe:
                     flash("The recipe could not be converted. Please check the input.", 'warning')
@@ -180,19 +194,56 @@ def automatic_conversion():
     
     return render_template('automatic_conversion_tool.html', form=form, converted_recipe=converted_recipe)
 
-# Helper function to convert decimals to fractions
-def convert_decimals_to_fractions(text):
-    words = text.split()
-    for i, word in enumerate(words):
+
+# JSON API for converting many recipes into several target units in one request.
+# Accepts either a JSON body {"recipes": [...], "to_units": [...]} or an NDJSON upload
+# (one recipe per line, target units passed as ?to_unit=...) and streams NDJSON results back.
+@user.route('/api/convert_recipes', methods=['POST'])
+@login_required
+def convert_recipes_api():
+    ndjson_upload = request.mimetype == 'application/x-ndjson'
+    if ndjson_upload:
+        to_units = request.args.getlist('to_unit')
+        recipes = iter_ndjson_recipes(request.stream)
+    else:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('recipes'), list):
+            return jsonify({'error': 'Expected a JSON object with a "recipes" list.'}), 400
+        to_units = payload.get('to_units') or []
+        recipes = enumerate(payload['recipes'])
+
+    # Validate the target units once up front instead of per recipe
+    to_units = [normalize_unit(str(unit)) for unit in to_units]
+    unsupported = [unit for unit in to_units if unit not in SUPPORTED_UNITS]
+    if not to_units or unsupported:
+        return jsonify({'error': 'Unsupported or missing target units.', 'units': unsupported}), 400
+
+    user_id = current_user.id
+
+    def generate():
+        for index, recipe in recipes:
+            if isinstance(recipe, dict):
+                recipe = recipe.get('recipe')
+            if not isinstance(recipe, str):
+                yield json.dumps({'index': index, 'error': 'Recipe must be a string.'}) + '\n'
+                continue
+            for to_unit in to_units:
+                converted = process_recipe_cached(recipe, to_unit, user_id)
+                yield json.dumps({'index': index, 'to_unit': to_unit, 'converted': converted}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# Helper generator that lazily parses an NDJSON upload into (index, recipe) pairs
+def iter_ndjson_recipes(stream):
+    for index, line in enumerate(stream):
+        line = line.strip()
+        if not line:
+            continue
         try:
-            # Try to convert each word to a float, then to a Fraction
-            number = float(word)
-            fraction = Fraction(number).limit_denominator()  # Limit denominator to get a simplified fraction
-            if number != int(number):  # Only convert if the number is not an integer
-                words[i] = str(fraction)  # Replace the word with its fraction representation
+            yield index, json.loads(line)
         except ValueError:
-            continue  # Skip words that aren't numbers
-    return ' '.join(words)
+            yield index, None  # Reported back to the client as an invalid recipe
 
 
 # Route to manage user's tools
@@ -210,6 +261,7 @@ def my_tools():
             tool = Tool(name=form.name.data, unit=form.unit.data, owner_id=current_user.id)
             db.session.add(tool)
             db.session.commit()
+            invalidate_user_tools(current_user.id)  # Refresh the cached tool list on next use
             flash('Tool has been added!', 'success')
             return redirect(url_for('user.my_tools'))
     elif form.errors:  # Handle any form validation errors
@@ -229,6 +281,7 @@ def delete_tool(tool_id):
         abort(403)  # Return forbidden if not authorized
     db.session.delete(tool)  # Delete the tool from the database
     db.session.commit()
+    invalidate_user_tools(current_user.id)  # Refresh the cached tool list on next use
     flash('Tool has been deleted.', 'success')
     return redirect(url_for('user.my_tools'))
 
@@ -236,6 +289,25 @@ def delete_tool(tool_id):
 @user.route('/connect_friends', methods=['GET', 'POST'])
 @login_required
 def connect_friends():
+    # Ranked "people you may know", precomputed by the suggest-friends job
+    limit = current_app.config['FRIEND_SUGGESTIONS_PER_USER']
+    suggestions = get_friend_suggestions(current_user.id, limit)
+    if not suggestions:
+        suggestions = [(user, 0) for user in unconnected_users(limit)]  # No mutual friends yet (or not computed)
+
+    # Get current user's friends (both directions)
+    friends = User.query.join(Friendship, ((Friendship.user_id == current_user.id) & (Friendship.friend_id == User.id)) |
+                                          ((Friendship.friend_id == current_user.id) & (Friendship.user_id == User.id)))\
+                        .filter(Friendship.status == 'accepted', Friendship.is_blocked == False).all()
+
+    added_friend = request.args.get('added_friend')  # Get the friend added, if any
+
+    return render_template('connect_friends.html', suggestions=suggestions, friends=friends, added_friend=added_friend)
+
+
+# Newest non-admin users with no request, friendship or block with the current user, for users who
+# have no suggestions
+def unconnected_users(limit):
     # Subquery to get users who have a pending or accepted friend request from or to the current user
     pending_or_accepted = db.session.query(Friendship.friend_id).filter(
         (Friendship.user_id == current_user.id) & (Friendship.status.in_(['pending', 'accepted']))
@@ -255,21 +327,12 @@ def connect_friends():
     ).subquery()
 
     # Exclude users who are already friends, have a pending request, or are blocked
-    users = User.query.filter(
-        User.id != current_user.id, 
+    return User.query.filter(
+        User.id != current_user.id,
         User.role != 'admin',
         ~User.id.in_(pending_or_accepted),  # Exclude users with pending/accepted requests
         ~User.id.in_(blocked_users)        # Exclude blocked users
-    ).all()
-
-    # Get current user's friends (both directions)
-    friends = User.query.join(Friendship, ((Friendship.user_id == current_user.id) & (Friendship.friend_id == User.id)) |
-                                          ((Friendship.friend_id == current_user.id) & (Friendship.user_id == User.id)))\
-                        .filter(Friendship.status == 'accepted', Friendship.is_blocked == False).all()
-
-    added_friend = request.args.get('added_friend')  # Get the friend added, if any
-
-    return render_template('connect_friends.html', users=users, friends=friends, added_friend=added_friend)
+    ).order_by(User.id.desc()).limit(limit).all()
 
 
 @user.route('/add_friend/<int:friend_id>', methods=['POST'])
@@ -286,8 +349,10 @@ def add_friend(friend_id):
         flash(f'{friend.username} is already your friend.', 'warning')
     else:
         new_friendship = Friendship(user_id=current_user.id, friend_id=friend.id)
+        discard_suggestions(current_user.id, friend.id)
         db.session.add(new_friendship)
         db.session.commit()
+        invalidate_home_context(friend.id)  # A new incoming request
         flash(f'You have added {friend.username} as your friend!', 'success')
     
     return redirect(url_for('user.connect_friends', added_friend=friend.username))
@@ -296,8 +361,20 @@ def add_friend(friend_id):
 @user.route('/users')
 @login_required
 def list_users():
-    users = User.query.all()
-    return render_template('list_users.html', users=users)
+    # Bounded, indexed username search instead of rendering every user
+    q = request.args.get('q', '')
+    users = search_users(q, current_user, current_app.config['USER_SEARCH_LIMIT'])
+    statuses = relationship_statuses(current_user.id, [user.id for user in users])
+    return render_template('list_users.html', q=q, users=users, statuses=statuses)
+
+
+# Typeahead: users whose username starts with ?q=, with the current user's relationship to each
+@user.route('/api/users/search', methods=['GET'])
+@login_required
+def search_users_api():
+    users = search_users(request.args.get('q', ''), current_user, search_limit())
+    statuses = relationship_statuses(current_user.id, [user.id for user in users])
+    return jsonify({'results': [{'id': user.id, 'username': user.username, 'status': statuses[user.id]} for user in users]})
 
 
 # Route to handle the post sharing
@@ -323,15 +400,13 @@ def share_post():
     if form.validate_on_submit():
         challenge_id = form.challenge.data if form.challenge.data != 0 else None
 
-        # Handle image upload
-        if form.image.data:
-            image_file = save_image(form.image.data)
-        else:
-            image_file = 'default.jpg'
+        # Stage the uploaded image; it is thumbnailed in the background after the post is saved
+        staged = stage_image(form.image.data, folder='uploads') if form.image.data else None
 
         # Create a new post
         post = Post(
-            image_file=image_file,
+            image_file=staged.filename if staged else 'default.jpg',
+            image_status='pending' if staged else 'ready',
             message=form.message.data,
             user_id=current_user.id,
             challenge_id=challenge_id  # Use None if "No Challenge" is selected
@@ -351,9 +426,25 @@ def share_post():
             else:
                 flash("You're not part of this challenge.", "danger")
                 db.session.rollback()  # Rollback the post creation if not part of the challenge
+                if staged:
+                    discard_staged_image(staged)
                 return redirect(url_for('user.share_post'))
 
+        # Push the post into the author's and their friends' timelines in the same transaction
+        db.session.flush()
+        fan_out_post(post)
+
         db.session.commit()
+
+        if staged:
+            queue_image(staged, post.id)
+
+        # Move the user up the in-memory leaderboard
+        if challenge_id:
+            get_leaderboard_service().record_progress(challenge_id, current_user.id, current_user.username,
+                                                      participation.progress, participation.wagered_credits,
+                                                      participant_join_order(participation))
+
         flash('Your post has been shared!', 'success')
         return redirect(url_for('user.view_posts'))
 
@@ -364,24 +455,67 @@ def share_post():
     return render_template('share_post.html', form=form)
 
 
-# Route to view posts from friends
+# Route to view posts from friends, one keyset-paginated page at a time
 @user.route('/view_posts')
 @login_required
 def view_posts():
-    # Retrieve all friends of the current user
-    friends = Friendship.query.filter_by(user_id=current_user.id).all()
-    friend_ids = [friend.friend_id for friend in friends]
-    friend_ids.append(current_user.id)  # Include the current user in the posts
+    page_size = current_app.config['FEED_PAGE_SIZE']
+
+    # "Liked by me" and "reported by me" are computed in the same query as the posts;
+    # like counts come from the denormalized Post.like_count column
+    liked_by_me = db.session.query(PostLike.id) \
+                            .filter(PostLike.post_id == Post.id, PostLike.user_id == current_user.id) \
+                            .correlate(Post).exists()
+    reported_by_me = db.session.query(post_reports.c.post_id) \
+                               .filter(post_reports.c.post_id == Post.id, post_reports.c.user_id == current_user.id) \
+                               .correlate(Post).exists()
+
+    # Read the user's precomputed timeline, which share_post fills in on write
+    query = db.session.query(
+        Post,
+        liked_by_me.label('liked_by_me'),
+        reported_by_me.label('reported_by_me')
+    ).join(
+        TimelineEntry, TimelineEntry.post_id == Post.id
+    ).filter(
+        TimelineEntry.user_id == current_user.id
+    ).options(
+        joinedload(Post.user), joinedload(Post.challenge)
+    )
 
-    # Query posts from friends and the current user, ordered by date, and eager load challenges
-    posts = Post.query.filter(Post.user_id.in_(friend_ids)) \
-                      .options(db.joinedload(Post.challenge)) \
-                      .order_by(Post.date_posted.desc()).all()
+    # Continue after the last post of the previous page, using (date_posted, id) as the keyset
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_feed_cursor(cursor)
+        except ValueError:
+            abort(400)
+        query = query.filter(
+            (TimelineEntry.date_posted < cursor_date) |
+            ((TimelineEntry.date_posted == cursor_date) & (TimelineEntry.post_id < cursor_id))
+        )
 
-    if not posts:
+    # Fetch one extra row to know whether an older page exists
+    posts = query.order_by(TimelineEntry.date_posted.desc(), TimelineEntry.post_id.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(posts) > page_size:
+        posts = posts[:page_size]
+        next_cursor = encode_feed_cursor(posts[-1].Post)
+
+    if not posts and not cursor:
         flash('No posts to show', 'info')
-    
-    return render_template('view_posts.html', posts=posts)
+
+    return render_template('view_posts.html', posts=posts, next_cursor=next_cursor)
+
+
+# Helper functions to turn the last post of a feed page into an opaque cursor and back
+def encode_feed_cursor(post):
+    return f"{post.date_posted.isoformat()}_{post.id}"
+
+
+def decode_feed_cursor(cursor):
+    date_part, _, id_part = cursor.rpartition('_')
+    return datetime.fromisoformat(date_part), int(id_part)
 
 
 @user.route('/notifications')
@@ -427,14 +561,16 @@ def like_post(post_id):
 
     if existing_like:
         db.session.delete(existing_like)
+        Post.adjust_like_count(post.id, -1)  # SQL-side decrement, no read-modify-write
         flash("You have unliked this post.", "info")
     else:
         like = PostLike(post_id=post_id, user_id=current_user.id)
         db.session.add(like)
+        Post.adjust_like_count(post.id, 1)  # SQL-side increment, no read-modify-write
         flash("You have liked this post!", "success")
     
     db.session.commit()
-    return redirect(request.referrer or url_for('user.posts'))
+    return redirect(request.referrer or url_for('user.view_posts'))
 
 
 # In user_routes.py
@@ -443,15 +579,19 @@ def like_post(post_id):
 def report_post(post_id):
     post = Post.query.get_or_404(post_id)
 
-    # Check if the user has already reported the post
-    if current_user in post.reported_by:
+    # Check if the user has already reported the post without loading every reporter
+    already_reported = db.session.query(
+        db.select(post_reports).where(
+            post_reports.c.post_id == post.id, post_reports.c.user_id == current_user.id
+        ).exists()
+    ).scalar()
+    if already_reported:
         flash("You have already reported this post.", "info")
         return redirect(url_for('user.view_posts'))
 
-    # Increment the reports count
-    post.reports += 1
-    # Assuming you have a relationship to track users who reported the post
-    post.reported_by.append(current_user)
+    # Record the report and increment the reports count in SQL
+    db.session.execute(post_reports.insert().values(user_id=current_user.id, post_id=post.id))
+    Post.adjust_report_count(post.id, 1)
     db.session.commit()
 
     flash("Post has been reported.", "success")
@@ -465,7 +605,11 @@ def approve_friend_request(request_id):
     request = Friendship.query.get(request_id)
     if request and request.friend_id == current_user.id:
         request.status = 'accepted'
+        # Bring each friend's existing posts into the other's timeline
+        backfill_pair(request.user_id, request.friend_id)
+        backfill_pair(request.friend_id, request.user_id)
         db.session.commit()
+        invalidate_home_context(request.user_id, request.friend_id)
         flash(f'You are now friends with {request.user.username}!', 'success')
     return redirect(url_for('user.notifications'))
 
@@ -479,6 +623,7 @@ def reject_friend_request(request_id):
     if request and request.friend_id == current_user.id:
         db.session.delete(request)  # Delete the friendship request
         db.session.commit()
+        invalidate_home_context(current_user.id)
         flash('Friend request has been rejected.', 'info')
     return redirect(url_for('user.notifications'))  # Redirect to notifications page
 
@@ -500,7 +645,9 @@ def send_friend_request(friend_id):
         # Set the status to 'pending'
         new_request = Friendship(user_id=current_user.id, friend_id=friend_id, status='pending')
         db.session.add(new_request)
+        discard_suggestions(current_user.id, friend_id)
         db.session.commit()
+        invalidate_home_context(friend_id)  # A new incoming request
         flash(f'Friend request sent to {friend.username}!', 'success')
 
     return redirect(url_for('user.connect_friends'))  # Redirect back to Connect with Friends
@@ -517,7 +664,9 @@ def unfollow_friend(friend_id):
     
     if friendship:
         db.session.delete(friendship)  # Fully delete the friendship
+        prune_pair(current_user.id, friend_id)  # Remove each other's posts from both timelines
         db.session.commit()
+        invalidate_home_context(current_user.id, friend_id)
         flash('You have unfollowed this user. You can send a new friend request.', 'success')
     else:
         flash('Friendship not found.', 'danger')
@@ -537,12 +686,15 @@ def block_friend(friend_id):
     if friendship:
         # Delete the friendship since it's a one-sided block
         db.session.delete(friendship)
+        prune_pair(current_user.id, friend_id)  # Remove each other's posts from both timelines
         db.session.commit()
 
         # Create a new friendship record to track the block status
         new_block = Friendship(user_id=current_user.id, friend_id=friend_id, is_blocked=True, status='blocked')
         db.session.add(new_block)
+        discard_suggestions(current_user.id, friend_id)
         db.session.commit()
+        invalidate_home_context(current_user.id, friend_id)
         flash('You have blocked this user.', 'success')
     else:
         flash('Friendship not found.', 'danger')
@@ -590,11 +742,9 @@ def create_challenge():
         # Calculate duration in seconds
         duration = (form.days.data * 86400) + (form.hours.data * 3600) + (form.minutes.data * 60) + form.seconds.data
 
-        # Handle file upload, specifying the folder as 'challenge'
-        if form.icon.data:
-            icon_filename = save_image(form.icon.data, folder='challenges')  # Save to 'static/challenge'
-        else:
-            icon_filename = 'default_icon.png'
+        # Stage the uploaded icon; it is processed into 'static/challenges' after the challenge is saved
+        staged = stage_image(form.icon.data, folder='challenges') if form.icon.data else None
+        icon_filename = staged.filename if staged else 'default_icon.png'
 
         # Get the current time in UTC for the start time
         started_at = datetime.now(timezone.utc)
@@ -608,46 +758,26 @@ def create_challenge():
             duration=duration,
             started_at=started_at  # Start the timer immediately in UTC
         )
-        
+        if staged:
+            challenge.image_status = 'pending'
+
         db.session.add(challenge)
         db.session.commit()
+
+        if staged:
+            queue_image(staged, challenge.id)
+
+        # Let the in-process settlement scheduler know about the new deadline
+        scheduler = current_app.extensions.get('settlement_scheduler')
+        if scheduler:
+            scheduler.schedule(challenge.id, challenge.get_end_time())
+        invalidate_home_context()  # Counts and featured challenges
+
         flash('Challenge created successfully!', 'success')
         return redirect(url_for('user.challenges'))
     
     return render_template('create_challenge.html', form=form)
 
-# Function to save images (like post images, challenge icons, or payment proofs)
-def save_image(form_image, folder='uploads'):
-    try:
-        # Generate a random filename to avoid duplicates
-        random_hex = secrets.token_hex(8)
-        _, f_ext = os.path.splitext(form_image.filename)
-        image_filename = random_hex + f_ext
-        
-        # Construct folder path based on the specified folder (e.g., static/challenge)
-        folder_path = os.path.join(current_app.root_path, 'static', folder)
-        os.makedirs(folder_path, exist_ok=True)  # Ensure the directory exists
-        
-        # Full image path
-        image_path = os.path.join(folder_path, image_filename)
-
-        # Debugging print statements to confirm paths
-        print(f"Folder Path: {folder_path}")
-        print(f"Image Path: {image_path}")
-
-        # Resize and save the image
-        output_size = (200, 200)
-        img = Image.open(form_image)
-        img.thumbnail(output_size)
-        img.save(image_path)
-
-        return image_filename  # Return filename to be saved in the database
-
-    except Exception as e:
-        print(f"Error saving image: {e}")
-        return None
-
-
 @user.route('/join_challenge/<int:challenge_id>', methods=['POST'])
 @login_required
 def join_challenge(challenge_id):
@@ -660,16 +790,28 @@ def join_challenge(challenge_id):
         flash('You have already joined this challenge.', 'info')
         return redirect(url_for('user.challenges'))
 
-    # Check if the user has enough credits
-    if current_user.credits < challenge.credits_required:
+    # Move the entry fee into the challenge's pot (the balance check and deduction are one conditional UPDATE)
+    # and add the user as a participant, in one transaction
+    try:
+        wager_credits(current_user.id, challenge_id, challenge.credits_required)
+        participant = ChallengeParticipant(user_id=current_user.id, challenge_id=challenge_id, wagered_credits=challenge.credits_required)
+        db.session.add(participant)
+        db.session.commit()
+    except InsufficientCredits:
+        db.session.rollback()
         flash('You do not have enough credits to join this challenge.', 'danger')
         return redirect(url_for('user.challenges'))
+    except IntegrityError:
+        # A concurrent request (e.g. a double submit) joined first; rolling back also undoes this wager
+        db.session.rollback()
+        flash('You have already joined this challenge.', 'info')
+        return redirect(url_for('user.challenges'))
 
-    # Deduct credits and add user as a participant
-    current_user.credits -= challenge.credits_required
-    participant = ChallengeParticipant(user_id=current_user.id, challenge_id=challenge_id, wagered_credits=challenge.credits_required)
-    db.session.add(participant)
-    db.session.commit()
+    # Add the new participant to the in-memory leaderboard
+    get_leaderboard_service().record_progress(challenge_id, current_user.id, current_user.username, 0, participant.wagered_credits,
+                                              participant_join_order(participant))
+    invalidate_home_context()  # Participant counts of featured challenges
+    invalidate_home_context(current_user.id)
 
     flash(f'You have successfully joined the challenge: {challenge.name}!', 'success')
     return redirect(url_for('user.challenges'))
@@ -678,85 +820,55 @@ def join_challenge(challenge_id):
 @user.route('/challenges')
 @login_required
 def challenges():
-    # Fetch all challenges and check their end status
-    challenges = Challenge.query.all()
-    
-    # Update the 'ended' status of each challenge if the timer has expired
-    for challenge in challenges:
-        if not challenge.ended and challenge.get_end_time() <= datetime.now(timezone.utc):
-            challenge.ended = True
-            db.session.add(challenge)
-    db.session.commit()
-
-    # Only include active challenges (not ended)
-    active_challenges = Challenge.query.filter_by(ended=False).all()
+    # Without the scheduler thread or a settle-challenges worker, end overdue challenges and pay any
+    # unpaid winners here instead
+    if 'settlement_scheduler' not in current_app.extensions and current_app.config['SETTLE_ON_PAGE_LOAD']:
+        settle_due_challenges()
+
+    # Only include active challenges; ending them and paying winners is done by the settlement scheduler
+    now = datetime.now(timezone.utc)
+    active_challenges = [
+        challenge for challenge in Challenge.query.filter_by(ended=False).all()
+        if challenge.get_end_time() > now
+    ]
     
     # Get IDs of challenges the current user has joined
-    joined_challenge_ids = [p.challenge_id for p in current_user.participations]
+    joined_challenge_ids = [challenge_id for (challenge_id,) in db.session.query(ChallengeParticipant.challenge_id).filter_by(user_id=current_user.id)]
+
+    # The page polls the leaderboard changes feed from this version to notice challenges ending
+    epoch, version = get_leaderboard_service().current_version()
     
     # Prepare data for rendering
     challenge_data = [{
         'id': challenge.id,
         'name': challenge.name,
         'credits_required': challenge.credits_required,
-        'time_remaining': max(0, (challenge.get_end_time() - datetime.now(timezone.utc)).total_seconds()),
-        'icon': challenge.icon
+        'time_remaining': max(0, (challenge.get_end_time() - now).total_seconds()),
+        'icon': challenge.icon,
+        'image_status': challenge.image_status
     } for challenge in active_challenges]
 
-    return render_template('challenges.html', challenges=challenge_data, joined_challenge_ids=joined_challenge_ids, remaining_credits=current_user.credits)
+    return render_template('challenges.html', challenges=challenge_data, joined_challenge_ids=joined_challenge_ids, remaining_credits=current_user.credits,
+                           epoch=epoch, version=version, poll_seconds=current_app.config['LEADERBOARD_POLL_SECONDS'])
 
 
 @user.route('/achievements')
 @login_required
 def achievements():
-    # Fetch only challenges marked as ended to avoid premature display
-    completed_challenges = Challenge.query.filter_by(ended=True).all()
-
-    for challenge in completed_challenges:
-        # Calculate total wagered credits for this challenge
-        total_wagered_credits = db.session.query(
-            db.func.sum(ChallengeParticipant.wagered_credits)
-        ).filter_by(challenge_id=challenge.id).scalar() or 0
-
-        # Determine the winner by highest progress
-        winner = ChallengeParticipant.query.filter_by(
-            challenge_id=challenge.id
-        ).order_by(ChallengeParticipant.progress.desc()).first()
-
-        # Credit the winner if applicable
-        if winner and winner.user_id == current_user.id and not winner.credited:
-            current_user.credits += total_wagered_credits
-            winner.credited = True
-            db.session.add(current_user)
-            db.session.add(winner)
-            db.session.commit()
-
-            # Create an achievement if one does not already exist
-            existing_achievement = Achievement.query.filter_by(user_id=current_user.id, challenge_id=challenge.id).first()
-            if not existing_achievement:
-                new_achievement = Achievement(
-                    user_id=current_user.id,
-                    challenge_id=challenge.id,
-                    challenge_name=challenge.name,
-                    credits_won=total_wagered_credits,
-                    completion_time=challenge.started_at + timedelta(seconds=challenge.duration)
-                )
-                db.session.add(new_achievement)
-                db.session.commit()
-
-    # Retrieve all achievements for the current user to display permanently
-    user_achievements = Achievement.query.filter_by(user_id=current_user.id).all()
+    # Fetch the user's achievements together with each challenge's icon in one joined query.
+    # Winners are paid by the settlement scheduler, so this page only reads.
+    user_achievements = db.session.query(Achievement, Challenge.icon) \
+                                  .outerjoin(Challenge, Challenge.id == Achievement.challenge_id) \
+                                  .filter(Achievement.user_id == current_user.id) \
+                                  .order_by(Achievement.completion_time.desc()).all()
 
     # Prepare data for achievements display
-    completed_challenges_data = []
-    for achievement in user_achievements:
-        challenge = Challenge.query.get(achievement.challenge_id)
-        completed_challenges_data.append({
-            'name': achievement.challenge_name,
-            'completion_time': achievement.completion_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'image': challenge.icon if challenge else 'default_icon.jpg',
-            'credits': achievement.credits_won
-        })
+    completed_challenges_data = [{
+        'name': achievement.challenge_name,
+        'completion_time': achievement.completion_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'image': icon or 'default_icon.jpg',
+        'credits': achievement.credits_won
+    } for achievement, icon in user_achievements]
 
     return render_template('achievements.html', completed_challenges=completed_challenges_data)
 
@@ -782,26 +894,18 @@ def challenge_history():
     return render_template('challenge_history.html', history_data=history_data)
 
 def get_leaderboard_data():
-    # Assuming you want to show all challenges and participants sorted by their progress
-    leaderboard_data = []
-
-    # Get all challenges
-    challenges = Challenge.query.all()
-
-    for challenge in challenges:
-        # Get all participants for the current challenge, ordered by their progress (highest first)
-        participants = ChallengeParticipant.query.filter_by(challenge_id=challenge.id).order_by(ChallengeParticipant.progress.desc()).all()
+    # All challenges and their participants sorted by progress (highest first), in one joined query
+    rows = db.session.query(User.username, Challenge.name, ChallengeParticipant.progress, ChallengeParticipant.wagered_credits) \
+                     .join(ChallengeParticipant, ChallengeParticipant.challenge_id == Challenge.id) \
+                     .join(User, User.id == ChallengeParticipant.user_id) \
+                     .order_by(Challenge.id, ChallengeParticipant.progress.desc()).all()
 
-        # Add each participant's info to the leaderboard
-        for participant in participants:
-            leaderboard_data.append({
-                'username': participant.user.username,  # Assuming ChallengeParticipant has a reference to the User
-                'challenge_name': challenge.name,
-                'progress': participant.progress,
-                'wagered_credits': participant.wagered_credits
-            })
-
-    return leaderboard_data
+    return [{
+        'username': username,
+        'challenge_name': challenge_name,
+        'progress': progress,
+        'wagered_credits': wagered_credits
+    } for username, challenge_name, progress, wagered_credits in rows]
 
 
 @user.route('/leaderboard', methods=['GET'])
@@ -810,25 +914,48 @@ def leaderboard():
     # Fetch only active challenges (those that haven't ended)
     active_challenges = Challenge.query.filter_by(ended=False).all()
     
+    # Rankings come from the in-memory leaderboard, so each challenge costs a binary search instead of a sort
+    service = get_leaderboard_service()
+    top_n = current_app.config['LEADERBOARD_TOP_N']
+    epoch, version = service.current_version()  # The page polls for changes after this version
+
     # Prepare leaderboard data
     leaderboard_data = []
     for challenge in active_challenges:
         # Calculate time remaining
         time_remaining = max(0, (challenge.get_end_time() - datetime.now(timezone.utc)).total_seconds())
-        
-        # Sort participants by progress in descending order (for leaderboard ranking)
-        sorted_participants = sorted(challenge.participants, key=lambda p: p.progress, reverse=True)
-        
-        # Prepare data for each challenge with sorted participants
+
+        # Prepare data for each challenge with its top participants and the current user's rank
         challenge_data = {
             'challenge': challenge,
             'time_remaining': time_remaining,
-            'participants': sorted_participants  # Sorted by progress for leaderboard display
+            'participants': service.top(challenge.id, top_n),
+            'my_rank': service.rank(challenge.id, current_user.id),
+            'my_entry': service.entry(challenge.id, current_user.id)
         }
         leaderboard_data.append(challenge_data)
 
     # Render the leaderboard template with the leaderboard data
-    return render_template('leaderboard.html', leaderboard_data=leaderboard_data)
+    return render_template('leaderboard.html', leaderboard_data=leaderboard_data, epoch=epoch, version=version,
+                           poll_seconds=current_app.config['LEADERBOARD_POLL_SECONDS'])
+
+
+# Compact JSON feed of the leaderboard rankings that changed since the client's version, polled by the
+# leaderboard and challenges pages instead of reloading them
+@user.route('/api/leaderboard/changes', methods=['GET'])
+@login_required
+def leaderboard_changes():
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'since must be an integer version.'}), 400
+
+    changes = get_leaderboard_service().changes_since(
+        since, request.args.get('epoch'), current_app.config['LEADERBOARD_TOP_N'], current_user.id
+    )
+    return jsonify(changes)
 
 def get_challenge_winner(challenge):
     # Get the participant with the highest progress in the challenge
@@ -837,40 +964,8 @@ def get_challenge_winner(challenge):
     return winner  # Return the participant object with the highest progress
 
 def end_challenge(challenge):
-    # Mark the challenge as ended
-    if not challenge.ended:
-        challenge.ended = True
-        db.session.add(challenge)
-
-        # Get the winner
-        winner = get_challenge_winner(challenge)
-
-        if winner:
-            # Calculate total wagered credits
-            total_wagered = sum([p.wagered_credits for p in challenge.participants])
-
-            # Award the winner with the total credits
-            winner.user.credits += total_wagered
-            db.session.add(winner.user)  # Save updated credits for the winner
-
-            # Check if an achievement already exists for this challenge and winner
-            existing_achievement = Achievement.query.filter_by(user_id=winner.user.id, challenge_id=challenge.id).first()
-
-            # Create a new achievement if it doesn't already exist
-            if not existing_achievement:
-                achievement = Achievement(
-                    challenge_name=challenge.name,
-                    credits_won=total_wagered,
-                    challenge_duration=challenge.duration,
-                    participants=len(challenge.participants),
-                    user_id=winner.user.id
-                )
-                db.session.add(achievement)
-                print(f"Achievement created for user {winner.user.username}: {achievement}")
-
-        db.session.commit()  # Commit all changes after updates
-    else:
-        print(f"Challenge '{challenge.name}' has already ended.")
+    # Mark the challenge as ended and pay the winner (a no-op if already settled)
+    settle_challenge(challenge.id)
 
 
 @user.route('/add_credits', methods=['GET', 'POST'])
@@ -879,17 +974,19 @@ def add_credits():
     form = CreditRequestForm()
     
     if form.validate_on_submit():
-        # Save the payment proof image
-        proof_image_filename = save_image(form.proof.data, folder='payments')
+        # Stage the payment proof image; it is processed in the background once the request is saved
+        staged = stage_image(form.proof.data, folder='payments')
 
         # Step 1: Create and commit the credit request first to ensure it has an ID
         credit_request = CreditRequest(
             user_id=current_user.id,
-            proof_image=proof_image_filename,
+            proof_image=staged.filename,
             credits_requested=form.credits_requested.data
         )
+        credit_request.image_status = 'pending'
         db.session.add(credit_request)
         db.session.commit()  # Commit to ensure the credit_request.id is available
+        queue_image(staged, credit_request.id)
 
         # Step 2: Now, create the notification with a valid credit_request_id
         notification = AdminNotification(credit_request_id=credit_request.id)
@@ -910,6 +1007,14 @@ def add_credit_status():
     return render_template('add_credit_status.html', credit_requests=credit_requests)
 
 
+@user.route('/credit_history')
+@login_required
+def credit_history():
+    # The user's most recent credit movements from the ledger
+    entries = account_history(current_user.id, limit=100)
+    return render_template('credit_history.html', entries=entries)
+
+
 @user.route('/withdraw', methods=['GET', 'POST'])
 @login_required
 def request_withdraw():
@@ -1,6 +1,9 @@
 import re  # Regular expressions for parsing text
+import time  # Expiry of cached tool lists
 from fractions import Fraction  # Handling fractional values
-from app.models import User, Friendship
+from collections import namedtuple  # Lightweight token records for the recipe tokenizer
+from flask import current_app
+from app.models import User, Friendship, Tool
 
 # Mapping of units to their standardized abbreviations
 UNIT_MAPPING = {
@@ -37,69 +40,205 @@ UNIT_MAPPING = {
 def normalize_unit(unit):
     return UNIT_MAPPING.get(unit.lower(), unit)
 
-# Function to convert a given measurement from one unit to another
-def convert_measurement(amount, from_unit, to_unit):
-    # Conversion rates between different units
-    conversions = {
-        'tsp': {'tbsp': 1/3, 'cup': 1/48, 'fl oz': 1/6, 'ml': 5},
-        'tbsp': {'tsp': 3, 'cup': 1/16, 'fl oz': 1/2, 'ml': 15},
-        'cup': {'tsp': 48, 'tbsp': 16, 'fl oz': 8, 'pt': 1/2, 'qt': 1/4, 'gal': 1/16, 'ml': 240},
-        'fl oz': {'tsp': 6, 'tbsp': 2, 'cup': 1/8, 'pt': 1/16, 'qt': 1/32, 'gal': 1/128, 'ml': 30},
-        'pt': {'cup': 2, 'fl oz': 16, 'qt': 1/2, 'gal': 1/8, 'ml': 480},
-        'qt': {'cup': 4, 'fl oz': 32, 'pt': 2, 'gal': 1/4, 'ml': 960},
-        'gal': {'cup': 16, 'fl oz': 128, 'pt': 8, 'qt': 4, 'ml': 3840},
-        'oz': {'lb': 1/16, 'g': 28.35},
-        'lb': {'oz': 16, 'g': 453.59},
-        'ml': {'tsp': 1/5, 'tbsp': 1/15, 'cup': 1/240, 'fl oz': 1/30, 'pt': 1/480, 'qt': 1/960, 'gal': 1/3840, 'g': 1},
-        'g': {'oz': 1/28.35, 'lb': 1/453.59, 'ml': 1},
-    }
+# Size of one unit of each volume measure, expressed in the canonical base unit (millilitres)
+VOLUME_IN_ML = {
+    'tsp': 5,
+    'tbsp': 15,
+    'cup': 240,
+    'fl oz': 30,
+    'pt': 480,
+    'qt': 960,
+    'gal': 3840,
+    'ml': 1,
+}
+
+# Size of one unit of each mass measure, expressed in the canonical base unit (grams)
+MASS_IN_G = {
+    'oz': 28.35,
+    'lb': 453.59,
+    'g': 1,
+}
+
+# Density bridge used to move between volume and mass (grams per millilitre, i.e. water)
+DENSITY_G_PER_ML = 1
+
+
+# Build a flat table of conversion factors for every supported unit pair
+def build_conversion_table():
+    # Express every unit in grams so that any pair shares a single base
+    in_grams = {unit: size * DENSITY_G_PER_ML for unit, size in VOLUME_IN_ML.items()}
+    in_grams.update(MASS_IN_G)
+
+    table = {}
+    for from_unit, from_size in in_grams.items():
+        for to_unit, to_size in in_grams.items():
+            table[(from_unit, to_unit)] = from_size / to_size
+    return table
 
+
+# Conversion factors are computed once at import time and shared by every call
+CONVERSION_FACTORS = build_conversion_table()
+
+# Every unit that can be used as a conversion target
+SUPPORTED_UNITS = frozenset(VOLUME_IN_ML) | frozenset(MASS_IN_G)
+
+
+# Look up the multiplication factor for a unit pair
+def get_conversion_factor(from_unit, to_unit):
     # If the from and to units are the same, no conversion is needed
+    if from_unit == to_unit:
+        return 1
+    try:
+        return CONVERSION_FACTORS[(from_unit, to_unit)]
+    except KeyError:
+        # If no valid conversion is found, raise an error
+        raise ValueError(f"Conversion from {from_unit} to {to_unit} not supported.") from None
+
+
+# Function to convert a given measurement from one unit to another
+def convert_measurement(amount, from_unit, to_unit):
     if from_unit == to_unit:
         return amount
+    return amount * get_conversion_factor(from_unit, to_unit)
+
+
+# Function to convert many measurements that share the same unit pair with a single lookup
+def convert_many(amounts, from_unit, to_unit):
+    factor = get_conversion_factor(from_unit, to_unit)
+    return [amount * factor for amount in amounts]
 
-    # If a direct conversion exists, use it to calculate the result
-    if from_unit in conversions and to_unit in conversions[from_unit]:
-        return amount * conversions[from_unit][to_unit]
 
-    # Handle cases where a multi-step conversion is needed (e.g., via an intermediate unit)
-    for intermediate_unit in conversions[from_unit]:
-        if intermediate_unit in conversions and to_unit in conversions[intermediate_unit]:
-            return amount * conversions[from_unit][intermediate_unit] * conversions[intermediate_unit][to_unit]
+# Unicode vulgar fraction characters and the values they represent
+VULGAR_FRACTIONS = {
+    '½': Fraction(1, 2),
+    '⅓': Fraction(1, 3),
+    '⅔': Fraction(2, 3),
+    '¼': Fraction(1, 4),
+    '¾': Fraction(3, 4),
+    '⅕': Fraction(1, 5),
+    '⅖': Fraction(2, 5),
+    '⅗': Fraction(3, 5),
+    '⅘': Fraction(4, 5),
+    '⅙': Fraction(1, 6),
+    '⅚': Fraction(5, 6),
+    '⅛': Fraction(1, 8),
+    '⅜': Fraction(3, 8),
+    '⅝': Fraction(5, 8),
+    '⅞': Fraction(7, 8),
+}
+
+# Single compiled grammar for recipe text. Alternatives are tried in order at each position, so
+# mixed numbers win over plain integers and longer unit names win over their prefixes.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<vulgar>(?:(?P<vulgar_whole>\d+)[ \t]*)?(?P<vulgar_part>[{vulgar}]))
+  | (?P<mixed>(?P<mixed_whole>\d+)[ \t]+(?P<mixed_num>\d+)/(?P<mixed_den>\d+))
+  | (?P<fraction>(?P<fraction_num>\d+)/(?P<fraction_den>\d+))
+  | (?P<decimal>\d*\.\d+)
+  | (?P<integer>\d+)
+  | (?P<unit>(?:{units})(?!\w))
+  | (?P<space>\s+)
+  | (?P<word>[^\s\d{vulgar}]+|.)
+""".format(
+    vulgar=''.join(VULGAR_FRACTIONS),
+    units='|'.join(re.escape(unit).replace('\\ ', '[ \\t]+') for unit in sorted(UNIT_MAPPING, key=len, reverse=True)),
+), re.VERBOSE | re.IGNORECASE)
+
+# A single token emitted by tokenize_recipe: kind is 'quantity', 'unit', 'space' or 'word'
+Token = namedtuple('Token', ['kind', 'text', 'value'])
+
+
+# Tokenize recipe text in one linear scan, yielding quantities as Fractions and units in normalized form
+def tokenize_recipe(recipe_text):
+    for match in TOKEN_PATTERN.finditer(recipe_text):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'vulgar':
+            whole = match.group('vulgar_whole')
+            value = VULGAR_FRACTIONS[match.group('vulgar_part')] + (int(whole) if whole else 0)
+        elif kind == 'mixed':
+            value = int(match.group('mixed_whole')) + Fraction(int(match.group('mixed_num')), int(match.group('mixed_den')))
+        elif kind == 'fraction':
+            # A zero denominator is not a quantity, so keep it as plain text
+            if int(match.group('fraction_den')) == 0:
+                yield Token('word', text, None)
+                continue
+            value = Fraction(int(match.group('fraction_num')), int(match.group('fraction_den')))
+        elif kind in ('decimal', 'integer'):
+            value = Fraction(text)
+        elif kind == 'unit':
+            yield Token('unit', text, normalize_unit(' '.join(text.split())))
+            continue
+        else:
+            yield Token(kind, text, None)
+            continue
+        yield Token('quantity', text, value)
 
-    # If no valid conversion is found, raise an error
-    raise ValueError(f"Conversion from {from_unit} to {to_unit} not supported.")
 
 # Function to process a recipe and convert units to a desired unit
-def process_recipe(recipe_text, to_unit, user_id):
-    # Split the recipe text into words for easy parsing
-    words = recipe_text.split()
-    result = []  # List to store the final processed recipe text
-    quantity = 0  # Variable to keep track of the current quantity
-    unit = ''  # Variable to store the unit of the quantity
-
-    # Iterate through each word in the recipe text
-    for word in words:
-        if re.match(r'^\d+/\d+$', word):  # If the word is a fraction (e.g., 1/2)
-            quantity = float(Fraction(word))  # Convert it to a float using the Fraction class
-        elif word.isdigit():  # If the word is a whole number
-            quantity = float(word)  # Convert it to a float
-        elif word in UNIT_MAPPING:  # If the word is a recognized unit
-            unit = normalize_unit(word)  # Normalize the unit to its abbreviation
-            try:
-                # Attempt to convert the quantity to the desired unit
-                converted_quantity = convert_measurement(quantity, unit, to_unit)
-                # Append the converted quantity and unit to the result list
-                result.append(f"{converted_quantity} {to_unit}")
-            except ValueError:
-                # If the conversion is not supported, append the original quantity and unit
-                result.append(f"{quantity} {unit}")
+def process_recipe(recipe_text, to_unit, user_id=None):
+    result = []  # List of text fragments making up the processed recipe
+    pending = []  # A quantity token (and the whitespace after it) waiting to see if a unit follows
+
+    for token in tokenize_recipe(recipe_text):
+        if pending:
+            if token.kind == 'space' and len(pending) == 1:
+                pending.append(token)
+                continue
+            if token.kind == 'unit':
+                quantity = float(pending[0].value)
+                pending = []
+                try:
+                    # Attempt to convert the quantity to the desired unit
+                    converted_quantity = convert_measurement(quantity, token.value, to_unit)
+                    result.append(f"{converted_quantity} {to_unit}")
+                except ValueError:
+                    # If the conversion is not supported, keep the original quantity and unit
+                    result.append(f"{quantity} {token.value}")
+                continue
+            # The quantity was not followed by a unit, so keep it as written
+            result.extend(pending_token.text for pending_token in pending)
+            pending = []
+
+        if token.kind == 'quantity':
+            pending = [token]
         else:
-            # If the word is not a quantity or unit, append it as is
-            result.append(word)
+            result.append(token.text)
+
+    result.extend(pending_token.text for pending_token in pending)
+    return ''.join(result)
+
+
+# Convert a recipe line by line, reusing cached results for lines that have been converted before
+def process_recipe_cached(recipe_text, to_unit, user_id=None):
+    recipe_cache = current_app.extensions['recipe_cache']
+    converted_lines = []
+    for line in recipe_text.splitlines():
+        # Normalize whitespace so the same ingredient pasted with different spacing hits the same entry
+        key = (' '.join(line.split()), to_unit)
+        converted_line = recipe_cache.get(key)
+        if converted_line is None:
+            converted_line = process_recipe(key[0], to_unit, user_id)
+            recipe_cache.set(key, converted_line)
+        converted_lines.append(converted_line)
+    return '\n'.join(converted_lines)
+
+
+# Helper function to fetch a user's tools as (name, unit) pairs, served from the tool cache when possible.
+# Entries expire after TOOL_CACHE_SECONDS, so other worker processes pick up added or deleted tools.
+def get_user_tools(user_id):
+    tool_cache = current_app.extensions['tool_cache']
+    cached = tool_cache.get(user_id)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+    tools = [(tool.name, tool.unit) for tool in Tool.query.filter_by(owner_id=user_id).all()]
+    tool_cache.set(user_id, (time.monotonic() + current_app.config['TOOL_CACHE_SECONDS'], tools))
+    return tools
+
 
-    # Join the words in the result list into a final string and return it
-    return ' '.join(result)
+# Helper function to drop a user's cached tool list after their tools change (in this process; other
+# processes refresh theirs when the entry expires)
+def invalidate_user_tools(user_id):
+    current_app.extensions['tool_cache'].pop(user_id)
 
 
 # Helper function to fetch all users except the current user
@@ -19,3 +19,111 @@ class Config:
     # Disable the SQLAlchemy event system to save resources
     # This reduces overhead as it prevents tracking of every change in the database objects, which is not needed here
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Maximum number of converted ingredient lines kept in the recipe conversion cache
+    RECIPE_CACHE_SIZE = 1024
+
+    # Maximum number of users whose tool lists are kept in the tool cache, and how long (in seconds) a cached list
+    # is trusted; changes made through another worker process show up after at most this long
+    TOOL_CACHE_SIZE = 512
+    TOOL_CACHE_SECONDS = 30
+
+    # Number of posts shown per page of the friends feed
+    FEED_PAGE_SIZE = 20
+
+    # Run the challenge settlement scheduler on a background thread inside the web process.
+    # Alternatively run `flask settle-challenges --loop` as a separate process.
+    SETTLEMENT_SCHEDULER_ENABLED = os.environ.get('SETTLEMENT_SCHEDULER_ENABLED') == '1'
+
+    # Settle overdue challenges (and pay unpaid winners) when the challenges page is loaded while the scheduler thread
+    # is off, so a plain `python run.py` still ends challenges. This writes on a GET and is on by default on purpose;
+    # set SETTLEMENT_WORKER=1 when `flask settle-challenges --loop` runs to keep page loads read-only.
+    SETTLE_ON_PAGE_LOAD = os.environ.get('SETTLEMENT_WORKER') != '1'
+
+    # How often (in seconds) the settlement scheduler reloads challenge deadlines from the database
+    SETTLEMENT_REFRESH_SECONDS = 60
+
+    # Maximum age (in seconds) of the in-memory leaderboard before it is rebuilt from the database
+    LEADERBOARD_MAX_AGE = 60
+
+    # Number of participants shown per challenge on the leaderboard page
+    LEADERBOARD_TOP_N = 10
+
+    # How often (in seconds) the leaderboard and challenges pages poll for ranking changes
+    LEADERBOARD_POLL_SECONDS = 5
+
+    # Worker processes that thumbnail uploaded images (0 processes them inline in the request)
+    IMAGE_PIPELINE_WORKERS = 2
+
+    # Uploads allowed to wait for a worker before new ones are processed inline
+    IMAGE_PIPELINE_MAX_PENDING = 32
+
+    # Widths (in pixels) of the resized copies written for every uploaded image, offered to browsers via srcset
+    IMAGE_VARIANT_WIDTHS = (200, 400, 800)
+
+    # Number of images whose variant lists are cached for rendering srcset attributes
+    IMAGE_VARIANT_CACHE_SIZE = 2048
+
+    # Number of static files whose content fingerprints are cached for fingerprinted URLs
+    ASSET_FINGERPRINT_CACHE_SIZE = 1024
+
+    # Rows per page in the admin list views
+    ADMIN_PAGE_SIZE = 50
+
+    # How long (in seconds) the per-status counts shown in admin list views are reused
+    ADMIN_COUNT_CACHE_SECONDS = 30
+
+    # Buckets shown in the admin dashboard charts (daily and hourly rollups)
+    DASHBOARD_CHART_DAYS = 30
+    DASHBOARD_CHART_HOURS = 48
+
+    # "People you may know" candidates stored per user by suggest-friends, and shown on Connect Friends
+    FRIEND_SUGGESTIONS_PER_USER = 20
+
+    # Maximum matches returned by the username search and typeahead endpoints
+    USER_SEARCH_LIMIT = 10
+
+    # How long (in seconds) the home page's counts and summaries are reused, and how many challenges it features
+    HOME_CACHE_SECONDS = 30
+    HOME_FEATURED_CHALLENGES = 3
+    HOME_CACHE_SIZE = 4096
+
+    # How long (in seconds) a signed-in user's cached identity is trusted, and how many are kept
+    IDENTITY_CACHE_SECONDS = 30
+    IDENTITY_CACHE_SIZE = 4096
+
+    # bcrypt work factor for new password hashes; hashes made with another factor are redone at the user's next login
+    BCRYPT_LOG_ROUNDS = 12
+
+    # Threads that run bcrypt (0 hashes inline in the request), and how many hashes may be running or waiting
+    # for one before logins and registrations are answered with 503
+    PASSWORD_HASH_WORKERS = 4
+    PASSWORD_HASH_MAX_PENDING = 16
+
+
+# Production database profile: SQLite in WAL mode with tuned pragmas and a sized connection pool.
+# Select it with APP_CONFIG=production (or create_app(ProductionConfig)) to benchmark against Config.
+class ProductionConfig(Config):
+    # Pragmas applied to every new SQLite connection by create_app
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # Readers no longer block on a writer (and vice versa)
+        'synchronous': 'NORMAL',  # Safe with WAL and avoids an fsync on every commit
+        'cache_size': -64000,  # Page cache size in KiB (negative value), i.e. 64 MB per connection
+        'mmap_size': 268435456,  # Memory-map up to 256 MB of the database file
+        'busy_timeout': 5000,  # Wait up to 5 seconds for a lock instead of failing with "database is locked"
+    }
+
+    # Connection pool sizing for the SQLAlchemy engine
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+    }
+
+
+# Config classes selectable by name through the APP_CONFIG environment variable
+config_by_name = {
+    'default': Config,
+    'production': ProductionConfig,
+}
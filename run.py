@@ -2,8 +2,11 @@
 # This function will initialize and configure the Flask application instance
 from app import create_app
 
-# Create an instance of the Flask application by calling the create_app function
-app = create_app()
+# Create an instance of the Flask application by calling the create_app function.
+# Worker processes spawned by the app (the image pipeline's) re-import this file as '__mp_main__';
+# they only run plain functions, so they skip building a second app of their own.
+if __name__ != '__mp_main__':
+    app = create_app()
 
 # This block ensures that the application runs only if the script is executed directly
 # The '__name__' variable is set to '__main__' when the script is run directly, not when imported
@@ -1,6 +1,11 @@
 import pytest
+from config import Config
 from app import create_app, db
 
+# The engine is created inside create_app(), so overriding SQLALCHEMY_DATABASE_URI on the app afterwards
+# would still run the tests against instance/database.db. Point the default config at memory instead.
+Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+
 @pytest.fixture
 def app():
     app = create_app()
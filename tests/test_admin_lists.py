@@ -0,0 +1,146 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from app import create_app, db
+from app.migrations import upgrade_schema
+from app.models import CreditRequest, PasswordResetRequest, Post, User
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+    app.config['ADMIN_PAGE_SIZE'] = 2  # Small pages so a handful of rows spans several
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_users(app):
+    admin = User(username='admin', email='admin@example.com', password='hashed_password', role='admin')
+    users = [User(username=f'player{i}', email=f'player{i}@example.com', password='hashed_password') for i in range(4)]
+    db.session.add_all([admin] + users)
+    db.session.commit()
+    return admin.id, [user.id for user in users]
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+# Follow "Next page" links from url to the last page, returning which of the given names each page showed
+def walk_pages(client, url, names):
+    seen = []
+    for _ in range(20):
+        page = client.get(url).get_data(as_text=True)
+        seen += [name for name in names if f'<td>{name}</td>' in page]
+        if 'Next page' not in page:
+            return seen
+        cursor = page.split('cursor=')[1].split('"')[0]
+        url = f"{url.split('cursor=')[0].rstrip('&?')}{'&' if '?' in url else '?'}cursor={cursor}"
+    raise AssertionError(f"{url} kept returning a next page")
+
+def test_manage_users_pages_with_cursor(client, setup_users):
+    """Test that the user list is served in pages linked by a cursor until the last one."""
+    admin_id, _ = setup_users
+    login(client, admin_id)
+
+    seen = []
+    response = client.get('/admin/manage_users?sort=username')
+    while True:
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        seen += [name for name in ('admin', 'player0', 'player1', 'player2', 'player3') if f'<td>{name}</td>' in page]
+        if 'Next page' not in page:
+            break
+        cursor = page.split('cursor=')[1].split('"')[0]
+        response = client.get(f'/admin/manage_users?sort=username&cursor={cursor}')
+
+    assert seen == ['admin', 'player0', 'player1', 'player2', 'player3']  # Every user exactly once, in order
+
+def test_manage_users_filters_and_counts(client, setup_users):
+    """Test role and username filters, and the per-role counts on the tabs."""
+    admin_id, _ = setup_users
+    login(client, admin_id)
+
+    page = client.get('/admin/manage_users?status=admin').get_data(as_text=True)
+    assert '<td>admin</td>' in page and 'player0' not in page
+    assert 'Admins (1)' in page and 'Users (4)' in page and 'All (5)' in page
+
+    page = client.get('/admin/manage_users?q=YER3').get_data(as_text=True)
+    assert '<td>player3</td>' in page and '<td>player0</td>' not in page
+
+def test_manage_posts_reported_filter(client, setup_users):
+    """Test that the reported tab only lists posts with reports, newest first."""
+    admin_id, user_ids = setup_users
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        Post(image_file='a.jpg', message=f'post {i}', user_id=user_ids[0], reports=i % 2, date_posted=now - timedelta(hours=i))
+        for i in range(5)
+    ])
+    db.session.commit()
+    login(client, admin_id)
+
+    page = client.get('/admin/manage_posts?status=reported').get_data(as_text=True)
+    assert 'post 1' in page and 'post 3' in page
+    assert 'post 0' not in page and 'post 2' not in page
+    assert page.index('post 1') < page.index('post 3')
+    assert 'Next page' not in page
+    assert 'Reported (2)' in page and 'All (5)' in page
+
+def test_credit_request_history_sorts_by_amount(client, setup_users):
+    """Test that the history can be sorted by size and excludes pending requests."""
+    admin_id, user_ids = setup_users
+    for amount, status in ((10, 'Approved'), (30, 'Rejected'), (20, 'Approved'), (99, 'Pending')):
+        credit_request = CreditRequest(user_id=user_ids[0], proof_image='p.jpg', credits_requested=amount)
+        credit_request.status = status
+        db.session.add(credit_request)
+    db.session.commit()
+    login(client, admin_id)
+
+    page = client.get('/admin/credit_request_history?sort=largest').get_data(as_text=True)
+    assert 'Requested Credits: 99' not in page
+    assert page.index('Requested Credits: 30') < page.index('Requested Credits: 20')
+    assert 'Requested Credits: 10' not in page  # On the second page
+
+def test_invalid_cursor_is_rejected(client, setup_users):
+    """Test that a tampered cursor is a bad request rather than a server error."""
+    admin_id, _ = setup_users
+    login(client, admin_id)
+
+    assert client.get('/admin/view_withdraw_history?cursor=not-a-cursor').status_code == 400
+    assert client.get('/admin/view_password_reset_requests?cursor=WzFd').status_code == 400  # Valid base64 of "[1]"
+
+def test_pages_through_legacy_timestamps(client, setup_users):
+    """Test that rows stored without microseconds are each listed once after upgrade-db."""
+    admin_id, user_ids = setup_users
+    names = [f'legacy {i}' for i in range(5)]
+    db.session.add_all([Post(image_file='a.jpg', message=name, user_id=user_ids[0]) for name in names])
+    db.session.add_all([PasswordResetRequest(user_id=user_ids[0], username=name, email='player0@example.com') for name in names])
+    db.session.commit()
+    # Older databases stored CURRENT_TIMESTAMP values: seconds only, several rows in the same second
+    db.session.execute(db.text("UPDATE post SET date_posted = '2024-11-27 11:02:07'"))
+    db.session.execute(db.text("UPDATE password_reset_request SET date_requested = '2024-11-27 11:02:07'"))
+    db.session.commit()
+    upgrade_schema()
+    login(client, admin_id)
+
+    for sort in ('newest', 'oldest'):
+        assert sorted(walk_pages(client, f'/admin/view_password_reset_requests?sort={sort}', names)) == names
+        assert sorted(walk_pages(client, f'/admin/manage_posts?sort={sort}', names)) == names
+
+def test_reset_requests_store_microseconds(setup_users):
+    """Test that new reset requests are stored in the same format as other timestamps."""
+    _, user_ids = setup_users
+    db.session.add(PasswordResetRequest(user_id=user_ids[0], username='player0', email='player0@example.com'))
+    db.session.commit()
+    stored = db.session.execute(db.text('SELECT date_requested FROM password_reset_request')).scalar()
+    assert len(stored) == 26  # YYYY-MM-DD HH:MM:SS.ffffff
@@ -1,6 +1,7 @@
 import pytest
 from app import create_app, db
 from app.models import User, Tool
+from app.utils import get_user_tools
 
 # Fixture to set up the app in testing mode
 @pytest.fixture
@@ -62,4 +63,57 @@ def test_automatic_conversion_post_valid(client, setup_user_and_tools):
             'recipe_text': '1.5 cups of milk',
             'to_unit': 'Cup - ml'
         }, follow_redirects=True)
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 200
+
+def test_automatic_conversion_reuses_cached_lines(client, app, setup_user_and_tools):
+    """Test that converting the same recipe twice is served from the recipe cache."""
+    user = setup_user_and_tools
+    recipe_cache = app.extensions['recipe_cache']
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)  # Mock the user session
+
+        for _ in range(2):
+            response = client.post('/automatic_conversion', data={
+                'recipe_text': '1.5 cups of milk\n2 tablespoons of sugar',
+                'to_unit': 'Cup - ml'
+            }, follow_redirects=True)
+            assert response.status_code == 200
+            assert b'360.0 ml of milk' in response.data
+
+        assert recipe_cache.misses == 2  # Each line is parsed once
+        assert recipe_cache.hits == 2  # The second submission is served from the cache
+
+def test_tool_cache_invalidated_on_change(client, app, setup_user_and_tools):
+    """Test that adding or deleting a tool refreshes the cached tool list."""
+    user = setup_user_and_tools
+    tool_cache = app.extensions['tool_cache']
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)  # Mock the user session
+
+        client.get('/automatic_conversion')
+        assert tool_cache.get(user.id)[1] == [('Cup', 'ml'), ('Spoon', 'tbsp')]
+
+        client.post('/my_tools', data={'name': 'Jug', 'unit': 'pt'}, follow_redirects=True)
+        assert user.id not in tool_cache
+
+        response = client.get('/automatic_conversion')
+        assert b'Jug (pt)' in response.data
+
+        tool = Tool.query.filter_by(name='Jug', owner_id=user.id).first()
+        client.post(f'/delete_tool/{tool.id}', follow_redirects=True)
+        assert user.id not in tool_cache
+
+def test_tool_cache_expires(app, setup_user_and_tools):
+    """Test that a cached tool list is re-read once the TTL has passed, e.g. after another worker changed it."""
+    user = setup_user_and_tools
+    app.config['TOOL_CACHE_SECONDS'] = 0
+    assert get_user_tools(user.id) == [('Cup', 'ml'), ('Spoon', 'tbsp')]
+
+    # A tool added without invalidating this process's cache, as another worker would
+    db.session.add(Tool(name='Jug', unit='pt', owner_id=user.id))
+    db.session.commit()
+    assert ('Jug', 'pt') in get_user_tools(user.id)
@@ -0,0 +1,83 @@
+import json
+import pytest
+from app import create_app, db
+from app.models import User
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_user(app):
+    # Set up a test user
+    user = User(username='testuser', email='test@example.com', password='hashed_password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_convert_recipes_json(client, setup_user):
+    """Test converting several recipes into several target units from a JSON body."""
+    user = setup_user
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)  # Mock the user session
+
+        response = client.post('/api/convert_recipes', json={
+            'recipes': ['1 cup of milk', {'recipe': '2 tablespoons of sugar'}],
+            'to_units': ['ml', 'teaspoons']
+        })
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        assert read_ndjson(response) == [
+            {'index': 0, 'to_unit': 'ml', 'converted': '240.0 ml of milk'},
+            {'index': 0, 'to_unit': 'tsp', 'converted': '48.0 tsp of milk'},
+            {'index': 1, 'to_unit': 'ml', 'converted': '30.0 ml of sugar'},
+            {'index': 1, 'to_unit': 'tsp', 'converted': '6.0 tsp of sugar'},
+        ]
+
+def test_convert_recipes_ndjson_upload(client, setup_user):
+    """Test converting an NDJSON upload, reporting invalid lines without aborting the stream."""
+    user = setup_user
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)  # Mock the user session
+
+        body = '"1 pint of stock"\nnot json\n{"recipe": "1 lb of flour"}\n'
+        response = client.post('/api/convert_recipes?to_unit=cup', data=body, content_type='application/x-ndjson')
+        assert response.status_code == 200
+        results = read_ndjson(response)
+        assert results[0] == {'index': 0, 'to_unit': 'cup', 'converted': '2.0 cup of stock'}
+        assert 'error' in results[1]
+        assert results[2]['index'] == 2
+
+def test_convert_recipes_rejects_unknown_unit(client, setup_user):
+    """Test that unsupported target units are rejected before any conversion happens."""
+    user = setup_user
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)  # Mock the user session
+
+        response = client.post('/api/convert_recipes', json={'recipes': ['1 cup of milk'], 'to_units': ['pinch']})
+        assert response.status_code == 400
+        assert response.get_json()['units'] == ['pinch']
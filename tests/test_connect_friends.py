@@ -1,6 +1,7 @@
 import pytest
 from app import create_app, db
 from app.models import User, Friendship
+from app.suggestions import compute_friend_suggestions, get_friend_suggestions
 from flask_login import login_user
 
 # Fixture to set up the app in testing mode
@@ -95,3 +96,61 @@ def test_connect_friends_includes_valid_users(client, setup_users_and_friendship
         # Check that users who are not friends, pending, or blocked are included
         assert b'user3' not in response.data  # user3 is pending, should not be included
         assert b'admin' not in response.data  # admin should not be included
+
+@pytest.fixture
+def setup_friend_graph(app):
+    # alice - bob, alice - carol, bob - dave, carol - dave, carol - erin; frank is unconnected
+    names = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank']
+    users = {name: User(username=name, email=f'{name}@example.com', password='hashed_password') for name in names}
+    db.session.add_all(users.values())
+    db.session.commit()
+    for user, friend in [('alice', 'bob'), ('alice', 'carol'), ('bob', 'dave'), ('dave', 'carol'), ('carol', 'erin')]:
+        db.session.add(Friendship(user_id=users[user].id, friend_id=users[friend].id, status='accepted'))
+    db.session.commit()
+    return {name: user.id for name, user in users.items()}
+
+def suggested(user_id):
+    return [(user.username, mutual) for user, mutual in get_friend_suggestions(user_id, 10)]
+
+def test_suggestions_ranked_by_mutual_friends(setup_friend_graph):
+    """Test that friends-of-friends are suggested, most mutual friends first, excluding existing friends."""
+    ids = setup_friend_graph
+    compute_friend_suggestions()
+
+    assert suggested(ids['alice']) == [('dave', 2), ('erin', 1)]
+    assert suggested(ids['dave']) == [('alice', 2), ('erin', 1)]
+    assert suggested(ids['frank']) == []
+
+def test_suggestions_exclude_pending_blocked_and_admins(setup_friend_graph):
+    """Test that pending requests, blocks and admins never appear as suggestions."""
+    ids = setup_friend_graph
+    db.session.add(Friendship(user_id=ids['erin'], friend_id=ids['alice'], status='pending'))
+    db.session.get(User, ids['dave']).role = 'admin'
+    db.session.commit()
+
+    compute_friend_suggestions()
+    assert suggested(ids['alice']) == []
+    assert suggested(ids['bob']) == [('carol', 2)]  # Through alice and through dave, who is no longer suggested
+
+def test_suggestions_limited_per_user(setup_friend_graph):
+    """Test that only the top K candidates are stored for each user."""
+    ids = setup_friend_graph
+    compute_friend_suggestions(per_user=1)
+    assert suggested(ids['alice']) == [('dave', 2)]
+
+def test_connect_friends_serves_suggestions(client, setup_friend_graph):
+    """Test that the page lists ranked suggestions and a sent request removes the suggestion."""
+    ids = setup_friend_graph
+    compute_friend_suggestions()
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(ids['alice'])
+
+        page = client.get('/connect_friends').get_data(as_text=True)
+        assert page.index('dave') < page.index('erin')
+        assert '2 mutual friends' in page
+
+        client.post(f'/send_friend_request/{ids["dave"]}')
+        assert suggested(ids['alice']) == [('erin', 1)]
+        assert ('alice', 2) not in suggested(ids['dave'])
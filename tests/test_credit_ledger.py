@@ -0,0 +1,210 @@
+import pytest
+from app import create_app, db
+from app.ledger import InsufficientCredits, backfill_opening_balances, transfer, user_account, wager_credits, withdraw_credits
+from app.models import AdminNotification, Challenge, ChallengeParticipant, CreditLedger, CreditRequest, CreditWithdrawRequest, User
+from app.user_routes import end_challenge
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_users(app):
+    user = User(username='player', email='player@example.com', password='hashed_password', credits=100)
+    admin = User(username='admin', email='admin@example.com', password='hashed_password', role='admin')
+    db.session.add_all([user, admin])
+    db.session.commit()
+    return user.id, admin.id
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+def balance(user_id):
+    db.session.expire_all()
+    return db.session.get(User, user_id).credits
+
+def ledger_total(account):
+    return db.session.query(db.func.coalesce(db.func.sum(CreditLedger.amount), 0)).filter_by(account=account).scalar()
+
+def test_join_challenge_wagers_through_ledger(client, setup_users):
+    """Test that joining a challenge moves the entry fee into the challenge pot, and is refused when short."""
+    user_id, admin_id = setup_users
+    cheap = Challenge(name='Cheap', icon='icon.png', creator_id=admin_id, credits_required=60, duration=3600)
+    pricey = Challenge(name='Pricey', icon='icon.png', creator_id=admin_id, credits_required=60, duration=3600)
+    db.session.add_all([cheap, pricey])
+    db.session.commit()
+    login(client, user_id)
+
+    client.post(f'/join_challenge/{cheap.id}')
+    assert balance(user_id) == 40
+    assert ledger_total(user_account(user_id)) == -60
+    assert ledger_total(f'challenge:{cheap.id}') == 60
+
+    # 40 credits left cannot cover a second 60 credit wager
+    client.post(f'/join_challenge/{pricey.id}')
+    assert balance(user_id) == 40
+    assert ChallengeParticipant.query.filter_by(challenge_id=pricey.id).count() == 0
+
+def test_concurrent_join_is_charged_once(client, monkeypatch, setup_users):
+    """Test that a join racing past the already-joined check is rolled back instead of failing."""
+    user_id, admin_id = setup_users
+    challenge = Challenge(name='Cheap', icon='icon.png', creator_id=admin_id, credits_required=30, duration=3600)
+    db.session.add(challenge)
+    db.session.commit()
+    login(client, user_id)
+
+    # The other request of a double submit commits its join after this one has passed the check
+    def join_concurrently(*args):
+        wager_credits(user_id, challenge.id, 30)
+        db.session.add(ChallengeParticipant(user_id=user_id, challenge_id=challenge.id, wagered_credits=30))
+        db.session.commit()
+        return wager_credits(*args)
+    monkeypatch.setattr('app.user_routes.wager_credits', join_concurrently)
+
+    response = client.post(f'/join_challenge/{challenge.id}', follow_redirects=True)
+    assert response.status_code == 200
+    assert b'You have already joined this challenge.' in response.data
+    assert ChallengeParticipant.query.filter_by(challenge_id=challenge.id).count() == 1
+    assert balance(user_id) == 70
+    assert ledger_total(f'challenge:{challenge.id}') == 30
+
+def test_settlement_pays_winner_from_pot(setup_users):
+    """Test that the winner's payout is a ledger transfer out of the challenge pot."""
+    user_id, admin_id = setup_users
+    challenge = Challenge(name='Race', icon='icon.png', creator_id=admin_id, credits_required=0, duration=60)
+    db.session.add(challenge)
+    db.session.commit()
+    db.session.add(ChallengeParticipant(user_id=user_id, challenge_id=challenge.id, wagered_credits=25, progress=3))
+    db.session.commit()
+
+    end_challenge(challenge)
+    assert balance(user_id) == 125
+    entries = CreditLedger.query.filter_by(kind='challenge_payout').all()
+    assert sorted(entry.amount for entry in entries) == [-25, 25]
+    assert len({entry.transaction_id for entry in entries}) == 1
+
+def test_credit_request_approval_pays_once(client, setup_users):
+    """Test that approving the same credit request twice only deposits once."""
+    user_id, admin_id = setup_users
+    credit_request = CreditRequest(user_id=user_id, proof_image='proof.png', credits_requested=30)
+    db.session.add(credit_request)
+    db.session.commit()
+    db.session.add(AdminNotification(credit_request_id=credit_request.id))
+    db.session.commit()
+    login(client, admin_id)
+
+    for _ in range(2):
+        client.post('/admin/add_user_credits', data={'credit_request_id': credit_request.id, 'action': 'approve'})
+
+    assert balance(user_id) == 130
+    assert ledger_total(user_account(user_id)) == 30
+    assert db.session.get(CreditRequest, credit_request.id).status == 'Approved'
+    assert AdminNotification.query.filter_by(credit_request_id=credit_request.id).one().reviewed
+
+def test_withdraw_approval_cannot_overdraw(client, setup_users):
+    """Test that a withdrawal larger than the current balance is not approved."""
+    user_id, admin_id = setup_users
+    withdraw_request = CreditWithdrawRequest(user_id=user_id, credits_requested=150, payment_mode='PayPal')
+    db.session.add(withdraw_request)
+    db.session.commit()
+    login(client, admin_id)
+
+    client.post('/admin/manage_withdraw_requests', data={'request_id': withdraw_request.id, 'action': 'approve'})
+    assert balance(user_id) == 100
+    assert db.session.get(CreditWithdrawRequest, withdraw_request.id).status == 'Pending'
+
+    with pytest.raises(InsufficientCredits):
+        withdraw_credits(user_id, 101, withdraw_request.id)
+    with pytest.raises(ValueError):
+        transfer(user_account(user_id), 'withdrawals', -5, 'withdrawal')
+
+def test_backfill_opening_balances(setup_users):
+    """Test that existing balances are recorded so every user's ledger sums to their credits."""
+    user_id, admin_id = setup_users
+
+    assert backfill_opening_balances() == 1  # Only the player has credits
+    assert ledger_total(user_account(user_id)) == 100
+    assert backfill_opening_balances() == 0  # Running it again changes nothing
+
+def test_credit_history_page(client, setup_users):
+    """Test that the credit history page lists the user's ledger entries."""
+    user_id, admin_id = setup_users
+    backfill_opening_balances()
+    login(client, user_id)
+
+    html = client.get('/credit_history').get_data(as_text=True)
+    assert 'Opening balance' in html
+    assert '+100' in html
+
+def test_bulk_credit_request_approval(client, setup_users):
+    """Test that a batch of credit requests is approved in one go, skipping already reviewed ones."""
+    user_id, admin_id = setup_users
+    requests = [CreditRequest(user_id=user_id, proof_image='proof.png', credits_requested=amount) for amount in (10, 20, 30)]
+    db.session.add_all(requests)
+    db.session.commit()
+    db.session.add_all([AdminNotification(credit_request_id=credit_request.id) for credit_request in requests])
+    requests[2].status = 'Rejected'
+    db.session.commit()
+    login(client, admin_id)
+
+    client.post('/admin/add_user_credits', data={'credit_request_ids': [r.id for r in requests], 'action': 'approve'})
+
+    assert balance(user_id) == 130  # 10 + 20; the rejected request is not paid
+    assert [db.session.get(CreditRequest, r.id).status for r in requests] == ['Approved', 'Approved', 'Rejected']
+    assert [n.reviewed for n in AdminNotification.query.order_by(AdminNotification.credit_request_id)] == [True, True, False]
+    assert CreditLedger.query.filter_by(kind='deposit').count() == 4  # Two legs per approved request
+
+def test_bulk_credit_request_rejection(client, setup_users):
+    """Test that a batch of credit requests is rejected and their notifications reviewed."""
+    user_id, admin_id = setup_users
+    requests = [CreditRequest(user_id=user_id, proof_image='proof.png', credits_requested=10) for _ in range(2)]
+    db.session.add_all(requests)
+    db.session.commit()
+    db.session.add_all([AdminNotification(credit_request_id=credit_request.id) for credit_request in requests])
+    db.session.commit()
+    login(client, admin_id)
+
+    client.post('/admin/add_user_credits', data={'credit_request_ids': [r.id for r in requests], 'action': 'reject'})
+
+    db.session.expire_all()
+    assert {r.status for r in CreditRequest.query} == {'Rejected'}
+    assert all(n.reviewed for n in AdminNotification.query)
+    assert balance(user_id) == 100
+
+def test_bulk_withdraw_approval_checks_each_users_total(client, setup_users):
+    """Test that a batch approval debits users who can cover all their requests and leaves the rest pending."""
+    user_id, admin_id = setup_users
+    rich = User(username='rich', email='rich@example.com', password='hashed_password', credits=500)
+    db.session.add(rich)
+    db.session.commit()
+    requests = [
+        CreditWithdrawRequest(user_id=user_id, credits_requested=60, payment_mode='PayPal'),
+        CreditWithdrawRequest(user_id=user_id, credits_requested=60, payment_mode='PayPal'),  # 120 in total > 100
+        CreditWithdrawRequest(user_id=rich.id, credits_requested=200, payment_mode='PayPal'),
+    ]
+    db.session.add_all(requests)
+    db.session.commit()
+    login(client, admin_id)
+
+    client.post('/admin/manage_withdraw_requests', data={'request_ids': [r.id for r in requests], 'action': 'approve'})
+
+    assert balance(user_id) == 100
+    assert balance(rich.id) == 300
+    assert [db.session.get(CreditWithdrawRequest, r.id).status for r in requests] == ['Pending', 'Pending', 'Approved']
+    assert ledger_total(user_account(rich.id)) == -200
@@ -0,0 +1,131 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from app import create_app, db
+from app.ledger import deposit_credits, withdraw_credits
+from app.metrics import dashboard_chart, recent_totals, rollup_metrics
+from app.models import Challenge, ChallengeParticipant, MetricRollup, Post, User, post_reports
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_activity(app):
+    now = datetime.now(timezone.utc)
+    admin = User(username='admin', email='admin@example.com', password='hashed_password', role='admin', date_created=now - timedelta(days=3))
+    player = User(username='player', email='player@example.com', password='hashed_password', credits=0)
+    db.session.add_all([admin, player])
+    db.session.commit()
+
+    challenge = Challenge(name='Bake', icon='bake.png', creator_id=admin.id, credits_required=5, duration=3600, started_at=now)
+    db.session.add(challenge)
+    db.session.commit()
+    db.session.add(ChallengeParticipant(user_id=player.id, challenge_id=challenge.id, wagered_credits=5))
+    post = Post(image_file='a.jpg', message='bread', user_id=player.id)
+    db.session.add(post)
+    db.session.commit()
+    db.session.execute(post_reports.insert().values(user_id=admin.id, post_id=post.id))
+
+    deposit_credits(player.id, 40, None)
+    withdraw_credits(player.id, 15, None)
+    db.session.commit()
+    return admin.id, player.id
+
+def rollup_value(period, metric):
+    return db.session.query(db.func.sum(MetricRollup.value)).filter_by(period=period, metric=metric).scalar()
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+def test_rollup_aggregates_activity(setup_activity):
+    """Test that the rollup job writes hourly and daily counters for each metric."""
+    assert rollup_metrics() > 0
+
+    for period in ('hour', 'day'):
+        assert rollup_value(period, 'signups') == 2
+        assert rollup_value(period, 'challenge_joins') == 1
+        assert rollup_value(period, 'credits_wagered') == 5
+        assert rollup_value(period, 'credits_in') == 40
+        assert rollup_value(period, 'credits_out') == 15
+        assert rollup_value(period, 'reports') == 1
+    assert recent_totals(hours=24)['signups'] == 1  # The admin signed up three days ago
+
+def test_rollup_is_incremental_and_idempotent(setup_activity):
+    """Test that re-running the job changes nothing, and new activity only updates the latest buckets."""
+    rollup_metrics()
+    assert rollup_metrics() == 0  # Nothing changed since the last run
+
+    db.session.add(User(username='late', email='late@example.com', password='hashed_password'))
+    db.session.commit()
+    assert rollup_metrics() == 2  # The current hour and day of the signups metric
+    assert rollup_value('day', 'signups') == 3
+
+def test_full_rollup_clears_deleted_activity(setup_activity):
+    """Test that a full rebuild zeroes buckets whose source rows were deleted."""
+    rollup_metrics()
+    db.session.execute(post_reports.delete())
+    db.session.commit()
+
+    rollup_metrics(full=True)
+    assert rollup_value('day', 'reports') == 0
+
+def test_dashboard_chart_cached_until_rollup_changes(client, app, setup_activity):
+    """Test that chart images are served from the cache and redrawn only after the rollups change."""
+    admin_id, _ = setup_activity
+    login(client, admin_id)
+    rollup_metrics()
+
+    response = client.get('/admin/dashboard/charts/signups.png')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG')
+    etag = response.headers['ETag']
+
+    assert client.get('/admin/dashboard/charts/signups.png', headers={'If-None-Match': etag}).status_code == 304
+
+    db.session.add(User(username='late', email='late@example.com', password='hashed_password'))
+    db.session.commit()
+    assert client.get('/admin/dashboard/charts/signups.png').headers['ETag'] == etag  # Not rolled up yet
+    rollup_metrics()
+    assert client.get('/admin/dashboard/charts/signups.png').headers['ETag'] != etag
+
+def test_dashboard_chart_moves_with_its_window(setup_activity):
+    """Test that a cached chart is redrawn once its time window moves on, even without new rollups."""
+    rollup_metrics()
+    today = datetime.now(timezone.utc)
+    image, etag = dashboard_chart('signups', today)
+    assert dashboard_chart('signups', today) == (image, etag)
+    assert dashboard_chart('signups', today + timedelta(days=1))[1] != etag
+
+def test_dashboard_reads_rollups(client, setup_activity):
+    """Test that the dashboard shows the rolled-up totals and links every chart."""
+    admin_id, _ = setup_activity
+    login(client, admin_id)
+    rollup_metrics()
+
+    page = client.get('/admin/dashboard').get_data(as_text=True)
+    assert 'Credits in (24h)' in page
+    for name in ('signups', 'credits', 'participation', 'reports'):
+        assert f'/admin/dashboard/charts/{name}.png' in page
+
+def test_dashboard_chart_requires_admin(client, setup_activity):
+    """Test that regular users cannot fetch dashboard charts."""
+    _, player_id = setup_activity
+    login(client, player_id)
+    assert client.get('/admin/dashboard/charts/signups.png').status_code == 403
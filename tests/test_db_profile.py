@@ -0,0 +1,33 @@
+import pytest
+from app import create_app, db
+from config import Config, ProductionConfig
+
+def pragma(name):
+    return db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+
+def test_production_profile_pragmas(tmp_path):
+    """Test that the production profile opens SQLite in WAL mode with the tuned pragmas."""
+    class FileProductionConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'production.db')
+
+    app = create_app(FileProductionConfig)
+    with app.app_context():
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1  # NORMAL
+        assert pragma('busy_timeout') == 5000
+        assert pragma('cache_size') == -64000
+        assert db.engine.pool.size() == 10
+        db.engine.dispose()
+
+def test_default_profile_unchanged(app):
+    """Test that the default profile (used by the in-memory test fixture) keeps SQLite defaults."""
+    assert 'SQLITE_PRAGMAS' not in app.config
+    assert pragma('journal_mode') == 'memory'
+
+def test_config_selected_by_name(monkeypatch):
+    """Test that APP_CONFIG selects the config class when none is passed."""
+    monkeypatch.setenv('APP_CONFIG', 'production')
+    monkeypatch.setattr(ProductionConfig, 'SQLALCHEMY_DATABASE_URI', Config.SQLALCHEMY_DATABASE_URI)
+    monkeypatch.setattr(ProductionConfig, 'SQLALCHEMY_ENGINE_OPTIONS', {})
+    app = create_app()
+    assert app.config['SQLITE_PRAGMAS'] == ProductionConfig.SQLITE_PRAGMAS
@@ -0,0 +1,91 @@
+import pytest
+from datetime import datetime, timezone
+from app import create_app, db
+from app.home import get_site_summary, get_user_summary
+from app.models import Challenge, ChallengeParticipant, Friendship, User
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_home(app):
+    cook = User(username='cook', email='cook@example.com', password='hashed_password', credits=50)
+    friend = User(username='friend', email='friend@example.com', password='hashed_password')
+    stranger = User(username='stranger', email='stranger@example.com', password='hashed_password')
+    db.session.add_all([cook, friend, stranger])
+    db.session.commit()
+
+    now = datetime.now(timezone.utc)
+    quiet = Challenge(name='Quiet', icon='q.png', creator_id=friend.id, credits_required=5, duration=3600, started_at=now)
+    busy = Challenge(name='Busy', icon='b.png', creator_id=friend.id, credits_required=5, duration=3600, started_at=now)
+    db.session.add_all([quiet, busy])
+    db.session.commit()
+    db.session.add_all([
+        ChallengeParticipant(user_id=friend.id, challenge_id=busy.id, wagered_credits=5),
+        ChallengeParticipant(user_id=stranger.id, challenge_id=busy.id, wagered_credits=5),
+        Friendship(user_id=cook.id, friend_id=friend.id, status='accepted'),
+        Friendship(user_id=stranger.id, friend_id=cook.id, status='pending'),
+    ])
+    db.session.commit()
+    return cook.id, quiet.id, busy.id
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+def test_home_page_renders_summary(client, setup_home):
+    """Test that the home page shows the site counts, the user's summary and featured challenges."""
+    cook_id, _, _ = setup_home
+    login(client, cook_id)
+
+    page = client.get('/').get_data(as_text=True)
+    assert 'You have 1 friend' in page
+    assert '1 friend request waiting' in page
+    assert page.index('Busy') < page.index('Quiet')  # Most participants first
+    assert '10 credits in the pot' in page
+
+def test_home_context_is_cached(setup_home):
+    """Test that the summaries are reused within the TTL instead of recounting."""
+    cook_id, _, _ = setup_home
+    assert get_site_summary().user_count == 3
+
+    db.session.add(User(username='late', email='late@example.com', password='hashed_password'))
+    db.session.commit()
+    assert get_site_summary().user_count == 3  # Served from the cache
+    assert get_site_summary() is get_site_summary()
+
+def test_home_context_expires(app, setup_home):
+    """Test that the summaries are recomputed once the TTL has passed."""
+    app.config['HOME_CACHE_SECONDS'] = 0
+    get_site_summary()
+    db.session.add(User(username='late', email='late@example.com', password='hashed_password'))
+    db.session.commit()
+    assert get_site_summary().user_count == 4
+
+def test_joining_a_challenge_invalidates_home_context(client, setup_home):
+    """Test that joining a challenge refreshes the user's summary and the featured challenges."""
+    cook_id, quiet_id, _ = setup_home
+    login(client, cook_id)
+    assert get_user_summary(cook_id).active_challenges == 0
+    get_site_summary()
+
+    client.post(f'/join_challenge/{quiet_id}')
+    assert get_user_summary(cook_id).active_challenges == 1
+    featured = {challenge.name: challenge.participant_count for challenge in get_site_summary().featured_challenges}
+    assert featured['Quiet'] == 1
@@ -0,0 +1,109 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import event
+from app import bcrypt, create_app, db
+from app.identity import CachedUser, invalidate_identity, load_identity
+from app.ledger import deposit_credits
+from app.models import User
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_user(app):
+    user = User(username='cook', email='cook@example.com', password='hashed_password', credits=10)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def count_user_queries():
+    """Return a list that collects every SELECT on the user table run from now on."""
+    statements = []
+
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and 'FROM user' in statement:
+            statements.append(statement)
+    return statements
+
+def test_snapshot_is_cached(setup_user):
+    """Test that the loader returns an immutable snapshot and queries the user table once per TTL."""
+    queries = count_user_queries()
+    identity = load_identity(setup_user)
+    assert isinstance(identity, CachedUser)
+    assert (identity.username, identity.credits, identity.role) == ('cook', 10, 'user')
+    with pytest.raises(AttributeError):
+        identity.credits = 99
+
+    assert load_identity(setup_user) is identity
+    assert len(queries) == 1
+
+def test_snapshot_expires(app, setup_user):
+    """Test that snapshots are re-read once the TTL has passed."""
+    app.config['IDENTITY_CACHE_SECONDS'] = 0
+    first = load_identity(setup_user)
+    assert load_identity(setup_user) is not first
+
+def test_credit_change_invalidates_snapshot(setup_user):
+    """Test that a ledger movement drops the cached balance once it commits."""
+    load_identity(setup_user)
+    deposit_credits(setup_user, 5, None)
+    db.session.commit()
+    assert load_identity(setup_user).credits == 15
+
+def test_invalidation_is_repeated_on_commit(setup_user):
+    """Test that a snapshot cached while a change is uncommitted is dropped at commit."""
+    invalidate_identity(setup_user)
+    db.session.execute(db.update(User).where(User.id == setup_user).values(role='admin'))
+    load_identity(setup_user)  # Cached mid-transaction, e.g. by a concurrent request
+    db.session.commit()
+    assert load_identity(setup_user).role == 'admin'
+
+def test_request_uses_snapshot(client, setup_user):
+    """Test that routes see the snapshot as current_user."""
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(setup_user)
+        page = client.get('/credit_history').get_data(as_text=True)
+        assert 'Current balance: 10' in page
+
+        from flask_login import current_user
+        assert isinstance(current_user._get_current_object(), CachedUser)
+
+def test_login_updates_last_login(client, setup_user):
+    """Test that signing in records the time and refreshes the cached snapshot."""
+    db.session.execute(db.update(User).where(User.id == setup_user).values(
+        password=bcrypt.generate_password_hash('Password123!').decode('utf-8'), last_login=datetime(2020, 1, 1)))
+    db.session.commit()
+    assert load_identity(setup_user).last_login == datetime(2020, 1, 1)
+
+    client.post('/login', data={'email': 'cook@example.com', 'password': 'Password123!'})
+    assert load_identity(setup_user).last_login > datetime(2020, 1, 2)
+
+def test_deleted_user_is_signed_out(client, setup_user):
+    """Test that deleting a user drops their cached identity."""
+    admin = User(username='admin', email='admin@example.com', password='hashed_password', role='admin')
+    db.session.add(admin)
+    db.session.commit()
+    load_identity(setup_user)
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+    client.post(f'/admin/delete_user/{setup_user}')
+    assert load_identity(setup_user) is None
@@ -0,0 +1,152 @@
+import os
+import pytest
+from io import BytesIO
+from PIL import Image
+from app import create_app, db
+from app.images import ImagePipeline, StagedImage, process_pending_images, staging_path, static_image_path, variant_filename
+from app.models import Post, User
+from app.timeline import backfill_timelines
+
+# Fixture to set up the app in testing mode, with uploads written to a temporary directory
+@pytest.fixture
+def app(tmp_path):
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+    app.instance_path = str(tmp_path / 'instance')
+    app.static_folder = str(tmp_path / 'static')
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_user(app):
+    user = User(username='testuser', email='test@example.com', password='hashed_password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def make_jpeg(size=(1200, 900)):
+    """Return a JPEG upload carrying EXIF data."""
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCamera'  # Make
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+    buffer.seek(0)
+    return buffer
+
+def stage_post(filename, data):
+    """Write a staged upload and a pending post that owns it."""
+    path = staging_path('uploads', filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as staged_file:
+        staged_file.write(data.read())
+    post = Post(message='Photo', user_id=User.query.first().id, image_file=filename, image_status='pending')
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+def test_share_post_stages_and_processes_image(client, app, setup_user):
+    """Test that an uploaded post image is thumbnailed without EXIF and the post marked ready."""
+    app.extensions['image_pipeline'].max_workers = 0  # Process inline so the result can be checked
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(setup_user.id)
+
+    client.post('/share_post', data={
+        'message': 'Look at this',
+        'challenge': 0,
+        'image': (make_jpeg(), 'photo.jpg')
+    }, content_type='multipart/form-data')
+
+    post = Post.query.filter_by(message='Look at this').one()
+    db.session.refresh(post)
+    assert post.image_status == 'ready'
+    assert not os.path.exists(staging_path('uploads', post.image_file))  # Staged upload cleaned up
+    with Image.open(static_image_path('uploads', post.image_file)) as img:
+        assert max(img.size) <= 200
+        assert not img.getexif()
+
+    # Resized WebP variants, capped at the source width
+    for width in (200, 400, 800):
+        with Image.open(static_image_path('uploads', variant_filename(post.image_file, width, 'webp'))) as img:
+            assert img.width == width
+            assert not img.getexif()
+
+def test_process_pool_marks_post_ready(app, setup_user):
+    """Test that an image handed to the process pool is processed and its row updated when done."""
+    post = stage_post('pooled.jpg', make_jpeg())
+    pipeline = ImagePipeline(app, max_workers=1)
+    try:
+        future = pipeline.submit(StagedImage('uploads', 'pooled.jpg'), post.id)
+        future.result(timeout=60)
+    finally:
+        pipeline.shutdown()
+
+    db.session.expire_all()
+    assert db.session.get(Post, post.id).image_status == 'ready'
+    assert os.path.exists(static_image_path('uploads', 'pooled.jpg'))
+
+def test_pending_post_shows_placeholder(client, setup_user):
+    """Test that the feed shows a placeholder instead of a broken image while processing."""
+    stage_post('waiting.jpg', make_jpeg())
+    backfill_timelines()
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(setup_user.id)
+
+    html = client.get('/view_posts').get_data(as_text=True)
+    assert 'Processing image' in html
+    assert 'uploads/waiting.jpg' not in html
+
+def test_process_pending_images(app, setup_user):
+    """Test that leftover pending uploads are processed, and invalid ones marked failed."""
+    good = stage_post('good.jpg', make_jpeg())
+    bad = stage_post('bad.jpg', BytesIO(b'not an image'))
+
+    assert process_pending_images() == (1, 1)
+    db.session.expire_all()
+    assert db.session.get(Post, good.id).image_status == 'ready'
+    assert db.session.get(Post, bad.id).image_status == 'failed'
+
+def test_duplicate_uploads_share_one_file(client, app, setup_user):
+    """Test that uploading the same image twice stores it once under its content hash."""
+    app.extensions['image_pipeline'].max_workers = 0
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(setup_user.id)
+
+    for message in ('First', 'Second'):
+        client.post('/share_post', data={
+            'message': message,
+            'challenge': 0,
+            'image': (make_jpeg(), f'{message}.jpg')
+        }, content_type='multipart/form-data')
+
+    first, second = Post.query.order_by(Post.id).all()
+    assert first.image_file == second.image_file
+    assert second.image_status == 'ready'
+
+def test_feed_offers_srcset_for_variants(client, app, setup_user):
+    """Test that the feed lists the resized variants of a processed image in a srcset."""
+    post = stage_post('abc123.jpg', make_jpeg(size=(500, 500)))
+    ImagePipeline(app, max_workers=0).submit(StagedImage('uploads', 'abc123.jpg'), post.id)
+    backfill_timelines()
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(setup_user.id)
+
+    html = client.get('/view_posts').get_data(as_text=True)
+    assert 'type="image/webp"' in html
+    assert 'uploads/abc123-200.webp' in html
+    assert 'uploads/abc123-400.webp' in html
+    assert 'uploads/abc123-800.webp' not in html  # Not upscaled past the 500px source
@@ -6,6 +6,8 @@ from app import db
 from datetime import datetime, timedelta, timezone
 
 from app.user_routes import end_challenge, get_challenge_winner
+from app.leaderboard import ChallengeLeaderboard, LeaderboardEntry, join_order
+from app.settlement import get_winning_participant
 
 @pytest.fixture
 def setup_challenges(app):
@@ -80,3 +82,142 @@ def test_get_challenge_winner(setup_challenges):
     winner = get_challenge_winner(challenge2)
     assert winner is None  # No participants in the ended challenge
 
+
+def test_leaderboard_orders_participants_by_progress(client, setup_challenges):
+    """Test that the leaderboard page lists the leader first and marks the current user's rank."""
+    challenges, participants = setup_challenges
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(participants[0].user_id)
+
+    html = client.get('/leaderboard').get_data(as_text=True)
+    assert html.index('1. user2') < html.index('2. user1')
+
+def test_challenge_leaderboard_ranks():
+    """Test insert, move, remove, top-N and rank on a single challenge ranking."""
+    board = ChallengeLeaderboard()
+    board.update(LeaderboardEntry(1, 'a', 5, 10))
+    board.update(LeaderboardEntry(2, 'b', 7, 10))
+    board.update(LeaderboardEntry(3, 'c', 5, 10))
+    assert [entry.user_id for entry in board.top(3)] == [2, 1, 3]  # Ties broken by user id
+    assert board.rank(3) == 3
+
+    # Overtake the leader
+    board.update(LeaderboardEntry(3, 'c', 8, 10))
+    assert board.rank(3) == 1
+    assert [entry.user_id for entry in board.top(2)] == [3, 2]
+
+    board.remove(2)
+    assert len(board) == 2
+    assert board.rank(2) is None
+    assert board.rank(1) == 2
+
+def test_ties_follow_join_order():
+    """Test that equal progress is ranked by join time and participant id, not user id."""
+    board = ChallengeLeaderboard()
+    joined = datetime(2024, 1, 1)
+    board.update(LeaderboardEntry(1, 'a', 5, 10), join_order(joined + timedelta(minutes=5), 2))
+    board.update(LeaderboardEntry(2, 'b', 5, 10), join_order(joined, 1))
+    assert [entry.user_id for entry in board.top(2)] == [2, 1]
+
+    # A progress change keeps the participant's join order
+    board.update(LeaderboardEntry(1, 'a', 6, 10))
+    board.update(LeaderboardEntry(1, 'a', 5, 10))
+    assert board.rank(1) == 2
+
+def test_leader_is_the_settlement_winner(app, setup_challenges):
+    """Test that on a tie the leaderboard shows the participant settlement would pay."""
+    challenges, participants = setup_challenges
+    challenge1 = challenges[0]
+    participants[0].progress = 100  # Tied with user2, but user2 joined earlier
+    participants[0].date_joined = datetime(2024, 1, 2)
+    participants[1].date_joined = datetime(2024, 1, 1)
+    db.session.commit()
+
+    service = app.extensions['leaderboard']
+    service.rebuild()
+    leader = service.top(challenge1.id, 1)[0]
+    assert leader.user_id == get_winning_participant(challenge1.id).user_id == participants[1].user_id
+
+def test_leaderboard_service_tracks_progress(app, setup_challenges):
+    """Test that the service rebuilds from the database and then follows recorded progress changes."""
+    challenges, participants = setup_challenges
+    challenge1, challenge2 = challenges
+    service = app.extensions['leaderboard']
+    user1_id = participants[0].user_id
+
+    # Cold start reads the active challenge from the database
+    assert service.rank(challenge1.id, user1_id) == 2
+    assert service.top(challenge2.id, 10) == []
+
+    # A progress bump moves user1 ahead without touching the database
+    service.record_progress(challenge1.id, user1_id, 'user1', 101, 30)
+    assert service.rank(challenge1.id, user1_id) == 1
+
+    # Invalidating reloads the committed state
+    service.invalidate()
+    assert service.rank(challenge1.id, user1_id) == 2
+
+    # Settling the challenge drops its ranking
+    end_challenge(challenge1)
+    assert service.top(challenge1.id, 10) == []
+
+def test_join_challenge_adds_participant_to_leaderboard(client, app, setup_challenges):
+    """Test that joining a challenge places the new participant on the in-memory leaderboard."""
+    challenges, participants = setup_challenges
+    challenge1 = challenges[0]
+    service = app.extensions['leaderboard']
+
+    user3 = User(username='user3', email='user3@example.com', password='hashed_password', credits=100)
+    db.session.add(user3)
+    db.session.commit()
+    service.rebuild()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user3.id)
+
+    client.post(f'/join_challenge/{challenge1.id}')
+    assert service.rank(challenge1.id, user3.id) == 3
+    assert service.entry(challenge1.id, user3.id).wagered_credits == 50
+
+def test_leaderboard_changes_feed(client, app, setup_challenges):
+    """Test that the changes feed returns only challenges changed since the client's version."""
+    challenges, participants = setup_challenges
+    challenge1 = challenges[0]
+    service = app.extensions['leaderboard']
+    user1_id = participants[0].user_id
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user1_id)
+
+    # Without a version the client gets every active challenge
+    first = client.get('/api/leaderboard/changes').get_json()
+    assert first['reset'] is True
+    assert [c['challenge_id'] for c in first['challenges']] == [challenge1.id]
+    assert first['challenges'][0]['me']['rank'] == 2
+
+    # Nothing has changed since then
+    params = {'since': first['version'], 'epoch': first['epoch']}
+    unchanged = client.get('/api/leaderboard/changes', query_string=params).get_json()
+    assert unchanged['reset'] is False
+    assert unchanged['challenges'] == []
+
+    # A progress change is reported with the new ranks
+    service.record_progress(challenge1.id, user1_id, 'user1', 150, 30)
+    changed = client.get('/api/leaderboard/changes', query_string=params).get_json()
+    assert changed['version'] > first['version']
+    assert [entry['username'] for entry in changed['challenges'][0]['top']] == ['user1', 'user2']
+    assert changed['challenges'][0]['me']['rank'] == 1
+
+    # Settling the challenge is reported as ended
+    end_challenge(challenge1)
+    params['since'] = changed['version']
+    ended = client.get('/api/leaderboard/changes', query_string=params).get_json()
+    assert ended['challenges'] == [{'challenge_id': challenge1.id, 'ended': True, 'top': [], 'me': None}]
+
+    # A version from another server instance forces a reset
+    stale = client.get('/api/leaderboard/changes', query_string={'since': 1, 'epoch': 'other'}).get_json()
+    assert stale['reset'] is True
+
+    assert client.get('/api/leaderboard/changes?since=abc').status_code == 400
@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.passwords import PasswordHasher, hash_cost, hash_password, check_password
+from app.models import User
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+    app.config['BCRYPT_LOG_ROUNDS'] = 4  # Cheapest work factor, to keep the tests fast
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_user(app):
+    user = User(username='cook', email='cook@example.com', password=hash_password('Password123!'))
+    admin = User(username='admin', email='admin@example.com', password=hash_password('Password123!'), role='admin')
+    db.session.add_all([user, admin])
+    db.session.commit()
+    return user.id, admin.id
+
+def login(client, email='cook@example.com', password='Password123!'):
+    return client.post('/login', data={'email': email, 'password': password})
+
+def test_hashes_use_configured_work_factor(app):
+    """Test that new hashes use BCRYPT_LOG_ROUNDS and verify through the pool."""
+    pw_hash = hash_password('secret')
+    assert hash_cost(pw_hash) == 4
+    assert check_password(pw_hash, 'secret')
+    assert not check_password(pw_hash, 'wrong')
+    assert hash_cost('hashed_password') is None
+
+def test_login_rehashes_old_work_factor(app, client, setup_user):
+    """Test that logging in upgrades a hash made with a different work factor."""
+    user_id, _ = setup_user
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+
+    assert login(client).status_code == 302
+    user = db.session.get(User, user_id)
+    assert hash_cost(user.password) == 5
+    assert check_password(user.password, 'Password123!')
+
+def test_failed_login_keeps_hash(app, client, setup_user):
+    """Test that a wrong password neither signs in nor rehashes."""
+    user_id, _ = setup_user
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+
+    assert login(client, password='wrong').status_code == 200
+    assert hash_cost(db.session.get(User, user_id).password) == 4
+
+def test_saturated_pool_answers_503(app, client, setup_user):
+    """Test that logins are turned away at once when no hashing slot is free."""
+    app.extensions['password_hasher'] = PasswordHasher(max_workers=1, max_pending=0)
+
+    response = login(client)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_register_checks_uniqueness_in_one_query(client, setup_user):
+    """Test that registration looks up the username and email with a single query."""
+    statements = []
+
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and 'FROM user' in statement:
+            statements.append(statement)
+
+    data = {'username': 'baker', 'email': 'cook@example.com', 'password': 'Password123!',
+            'confirm_password': 'Password123!', 'role': 'user'}
+    response = client.post('/register', data=data)
+    assert b'That email is already registered' in response.data
+    assert len(statements) == 1
+
+    response = client.post('/register', data=dict(data, email='baker@example.com'), follow_redirects=True)
+    assert b'Your account has been created!' in response.data
+    assert hash_cost(User.query.filter_by(username='baker').one().password) == 4
+
+def test_admin_reset_rejects_current_password(client, setup_user):
+    """Test that the admin reset refuses the current password and stores a new one."""
+    user_id, admin_id = setup_user
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+
+    response = client.post(f'/admin/admin/reset_password/{user_id}',
+                           data={'password': 'Password123!', 'confirm_password': 'Password123!'})
+    assert b'cannot be the same as the current password' in response.data
+
+    client.post(f'/admin/admin/reset_password/{user_id}',
+                data={'password': 'NewPassword1!', 'confirm_password': 'NewPassword1!'})
+    db.session.expire_all()
+    assert check_password(db.session.get(User, user_id).password, 'NewPassword1!')
@@ -0,0 +1,92 @@
+import pytest
+from app import create_app, db
+from app.migrations import MigrationError, upgrade_schema
+from app.models import Achievement, Challenge, ChallengeParticipant, CreditLedger, CreditRequest, CreditWithdrawRequest, Friendship, FriendSuggestion, MetricRollup, PasswordResetRequest, Post, PostLike, TimelineEntry, User
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+def query_plan(query):
+    """Return the EXPLAIN QUERY PLAN detail lines for an ORM query."""
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql))]
+
+# Queries on the hot paths, and the table each one must reach through an index
+HOT_QUERIES = [
+    ('friendship', lambda: Friendship.query.filter_by(user_id=1, status='pending')),
+    ('friendship', lambda: Friendship.query.filter_by(friend_id=1, status='accepted')),
+    ('challenge_participant', lambda: ChallengeParticipant.query.filter_by(challenge_id=1).order_by(ChallengeParticipant.progress.desc())),
+    ('challenge_participant', lambda: ChallengeParticipant.query.filter_by(user_id=1, challenge_id=1)),
+    ('post_likes', lambda: PostLike.query.filter_by(post_id=1, user_id=1)),
+    ('post', lambda: Post.query.filter_by(user_id=1).order_by(Post.date_posted.desc())),
+    ('credit_request', lambda: CreditRequest.query.filter_by(status='Pending').order_by(CreditRequest.date_submitted.desc())),
+    ('challenge', lambda: Challenge.query.filter_by(ended=False)),
+    ('achievement', lambda: Achievement.query.filter_by(user_id=1).order_by(Achievement.completion_time.desc())),
+    ('timeline_entry', lambda: TimelineEntry.query.filter_by(user_id=1).order_by(TimelineEntry.date_posted.desc())),
+    ('credit_withdraw_request', lambda: CreditWithdrawRequest.query.filter_by(status='Approved').order_by(CreditWithdrawRequest.date_requested.desc())),
+    ('password_reset_request', lambda: PasswordResetRequest.query.filter_by(status='Pending').order_by(PasswordResetRequest.date_requested.desc())),
+    ('post', lambda: Post.query.filter(Post.date_posted < '2024-01-01').order_by(Post.date_posted.desc())),  # Admin list, past the first page
+    ('metric_rollup', lambda: MetricRollup.query.filter(MetricRollup.period == 'day', MetricRollup.bucket_start >= '2024-01-01')),
+    ('friend_suggestion', lambda: FriendSuggestion.query.filter_by(user_id=1).order_by(FriendSuggestion.rank).limit(20)),
+    ('user', lambda: User.query.filter(User.username_key >= 'al', User.username_key < 'al\U0010ffff').order_by(User.username_key).limit(10)),
+    ('user', lambda: User.query.filter(User.email_key >= 'al', User.email_key < 'al\U0010ffff').order_by(User.email_key).limit(10)),
+    ('credit_ledger', lambda: CreditLedger.query.filter_by(account='user:1').order_by(CreditLedger.created_at.desc())),
+]
+
+@pytest.mark.parametrize('table, build_query', HOT_QUERIES)
+def test_hot_queries_use_an_index(app, table, build_query):
+    """Fail if a hot query falls back to a full table scan."""
+    plan = query_plan(build_query())
+    assert not any(detail.startswith(f'SCAN {table}') for detail in plan), plan
+
+def test_upgrade_schema_applies_missing_indexes_and_columns(app):
+    """Test that the migration upgrades a database created before the indexes and counters existed."""
+    # Recreate the state of an older database
+    db.session.execute(db.text('DROP INDEX ix_friendship_user_status'))
+    db.session.execute(db.text('DROP INDEX uq_post_likes_post_user'))
+    db.session.execute(db.text('DROP TABLE timeline_entry'))
+    db.session.execute(db.text('DROP INDEX ix_post_user_date'))
+    db.session.execute(db.text('ALTER TABLE post DROP COLUMN like_count'))
+    db.session.execute(db.text('INSERT INTO post_likes (post_id, user_id) VALUES (1, 1), (1, 1)'))
+    db.session.commit()
+
+    applied = upgrade_schema()
+    assert 'created index ix_friendship_user_status' in applied
+    assert 'created index uq_post_likes_post_user' in applied
+    assert 'created table timeline_entry' in applied
+    assert 'added column post.like_count' in applied
+    assert db.session.execute(db.text('SELECT COUNT(*) FROM post_likes')).scalar() == 1  # Duplicate like removed
+
+    # Running it again is a no-op
+    assert upgrade_schema() == []
+
+def test_upgrade_schema_adds_string_defaults(app):
+    """Test that an added column with a string server default gets it quoted, filling existing rows."""
+    db.session.execute(db.text("INSERT INTO post (image_file, message, date_posted, user_id) VALUES ('a.jpg', 'hi', '2024-01-01 00:00:00.000000', 1)"))
+    db.session.execute(db.text('ALTER TABLE post DROP COLUMN image_status'))
+    db.session.commit()
+
+    assert 'added column post.image_status' in upgrade_schema()
+    assert db.session.execute(db.text('SELECT image_status FROM post')).scalar() == 'ready'
+
+def test_upgrade_schema_refuses_duplicate_participants(app):
+    """Test that duplicate challenge entries stop the upgrade with a clear message and change nothing."""
+    db.session.execute(db.text('DROP INDEX uq_challenge_participant_user_challenge'))
+    db.session.execute(db.text('DROP INDEX ix_friendship_user_status'))
+    db.session.execute(db.text('INSERT INTO challenge_participant (user_id, challenge_id, wagered_credits) VALUES (1, 2, 10), (1, 2, 10)'))
+    db.session.commit()
+
+    with pytest.raises(MigrationError, match='challenge_participant has duplicate rows \\(user_id=1, challenge_id=2\\)'):
+        upgrade_schema()
+    indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('friendship')}
+    assert 'ix_friendship_user_status' not in indexes  # Rolled back with the rest of the upgrade
@@ -0,0 +1,116 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from app import db
+from app.models import Achievement, Challenge, ChallengeParticipant, User
+from app.settlement import SettlementScheduler, settle_challenge, settle_due_challenges
+
+
+@pytest.fixture
+def setup_challenges(app):
+    user1 = User(username='user1', email='user1@example.com', password='hashed_password', credits=0)
+    user2 = User(username='user2', email='user2@example.com', password='hashed_password', credits=0)
+    db.session.add_all([user1, user2])
+    db.session.commit()
+
+    now = datetime.now(timezone.utc)
+    overdue = Challenge(name='Overdue Challenge', icon='icon.png', creator_id=user1.id, credits_required=10,
+                        duration=3600, started_at=now - timedelta(hours=2))
+    running = Challenge(name='Running Challenge', icon='icon.png', creator_id=user1.id, credits_required=10,
+                        duration=3600, started_at=now - timedelta(minutes=30))
+    db.session.add_all([overdue, running])
+    db.session.commit()
+
+    db.session.add_all([
+        ChallengeParticipant(user_id=user1.id, challenge_id=overdue.id, progress=2, wagered_credits=30),
+        ChallengeParticipant(user_id=user2.id, challenge_id=overdue.id, progress=5, wagered_credits=20),
+        ChallengeParticipant(user_id=user1.id, challenge_id=running.id, progress=1, wagered_credits=10),
+    ])
+    db.session.commit()
+    return (user1.id, user2.id), (overdue.id, running.id)
+
+
+def test_settle_challenge_pays_winner_once(setup_challenges):
+    (user1_id, user2_id), (overdue_id, _) = setup_challenges
+
+    assert settle_challenge(overdue_id) == 50
+    assert settle_challenge(overdue_id) == 0  # Settling again must not pay twice
+
+    assert db.session.get(Challenge, overdue_id).ended is True
+    assert db.session.get(User, user2_id).credits == 50
+    assert db.session.get(User, user1_id).credits == 0
+    achievements = Achievement.query.filter_by(challenge_id=overdue_id).all()
+    assert [(a.user_id, a.credits_won) for a in achievements] == [(user2_id, 50)]
+
+
+def test_settle_due_challenges_skips_running(setup_challenges):
+    _, (overdue_id, running_id) = setup_challenges
+
+    assert settle_due_challenges() == 1
+    assert db.session.get(Challenge, overdue_id).ended is True
+    assert db.session.get(Challenge, running_id).ended is False
+
+
+def test_scheduler_settles_in_deadline_order(app, setup_challenges):
+    (user1_id, _), (overdue_id, running_id) = setup_challenges
+    running = db.session.get(Challenge, running_id)
+    scheduler = SettlementScheduler(app)
+    scheduler.schedule(running_id, running.get_end_time())
+    scheduler.schedule(overdue_id, db.session.get(Challenge, overdue_id).get_end_time())
+
+    # Only the overdue challenge is due now
+    assert scheduler.run_pending() == 1
+    db.session.expire_all()  # The scheduler settles in its own app context and session
+    assert db.session.get(Challenge, running_id).ended is False
+
+    # Once the running challenge's deadline passes it is settled too
+    assert scheduler.run_pending(now=running.get_end_time()) == 1
+    db.session.expire_all()
+    assert db.session.get(Challenge, running_id).ended is True
+    assert db.session.get(User, user1_id).credits == 10
+
+
+def test_challenges_page_settles_without_scheduler(client, setup_challenges):
+    (user1_id, user2_id), (overdue_id, _) = setup_challenges
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user1_id)
+
+    response = client.get('/challenges')
+    assert b'Running Challenge' in response.data
+    assert b'Overdue Challenge' not in response.data
+    assert db.session.get(Challenge, overdue_id).ended is True  # Fallback while no scheduler or worker runs
+    assert db.session.get(User, user2_id).credits == 50
+
+
+def test_challenges_page_pays_ended_unpaid_challenges(client, setup_challenges):
+    (user1_id, user2_id), (overdue_id, _) = setup_challenges
+    db.session.get(Challenge, overdue_id).ended = True  # Ended by an older version without paying
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user1_id)
+
+    client.get('/challenges')
+    assert db.session.get(User, user2_id).credits == 50
+    assert Achievement.query.filter_by(challenge_id=overdue_id, user_id=user2_id).count() == 1
+
+
+def test_challenges_page_leaves_settlement_to_worker(app, client, setup_challenges):
+    (user1_id, _), (overdue_id, _) = setup_challenges
+    app.config['SETTLE_ON_PAGE_LOAD'] = False
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user1_id)
+
+    response = client.get('/challenges')
+    assert b'Overdue Challenge' not in response.data
+    assert db.session.get(Challenge, overdue_id).ended is False  # Left for the settlement worker
+
+
+def test_achievements_page_reads_settled_results(client, setup_challenges):
+    (_, user2_id), (overdue_id, _) = setup_challenges
+    settle_due_challenges()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user2_id)
+
+    response = client.get('/achievements')
+    assert b'Overdue Challenge' in response.data
+    assert b'icon.png' in response.data
+    assert b'50' in response.data
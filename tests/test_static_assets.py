@@ -0,0 +1,65 @@
+import gzip
+import pytest
+from flask import url_for
+from app import create_app, db
+from app.assets import build_precompressed_assets, static_fingerprint
+
+# Fixture to set up the app in testing mode, serving static files from a temporary directory
+@pytest.fixture
+def app(tmp_path):
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.static_folder = str(tmp_path / 'static')
+    (tmp_path / 'static' / 'css').mkdir(parents=True)
+    (tmp_path / 'static' / 'css' / 'site.css').write_text('body { color: red; }\n' * 50)
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_static_urls_are_fingerprinted(app, tmp_path):
+    """Test that url_for('static') appends a content fingerprint that changes with the file."""
+    with app.test_request_context():
+        first = url_for('static', filename='css/site.css')
+        assert first == f"/static/css/site.css?v={static_fingerprint('css/site.css')}"
+
+        (tmp_path / 'static' / 'css' / 'site.css').write_text('body { color: blue; }\n')
+        assert url_for('static', filename='css/site.css') != first
+
+        # Missing files are left alone
+        assert url_for('static', filename='css/missing.css') == '/static/css/missing.css'
+
+def test_fingerprinted_assets_are_immutable(client, app):
+    """Test that only requests for the current fingerprint are cached forever."""
+    with app.test_request_context():
+        url = url_for('static', filename='css/site.css')
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+
+    stale = client.get('/static/css/site.css?v=000000000000')
+    assert not stale.cache_control.immutable
+
+def test_precompressed_assets_are_served(client, app):
+    """Test that a built .gz copy is served to browsers that accept gzip, and the original otherwise."""
+    assert build_precompressed_assets() >= 1
+
+    compressed = client.get('/static/css/site.css', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.mimetype == 'text/css'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data).startswith(b'body { color: red; }')
+
+    plain = client.get('/static/css/site.css')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data.startswith(b'body { color: red; }')
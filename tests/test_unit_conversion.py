@@ -0,0 +1,59 @@
+import pytest
+from fractions import Fraction
+from app.utils import convert_measurement, convert_many, process_recipe, tokenize_recipe
+
+
+def test_convert_measurement_direct():
+    """Test conversions within the same dimension."""
+    assert convert_measurement(1, 'cup', 'ml') == 240
+    assert convert_measurement(3, 'tsp', 'tbsp') == pytest.approx(1)
+    assert convert_measurement(1, 'gal', 'cup') == pytest.approx(16)
+
+
+def test_convert_measurement_across_density_bridge():
+    """Test pairs that need the volume/mass bridge, which the old single-hop walk could not reach."""
+    assert convert_measurement(1, 'cup', 'g') == pytest.approx(240)
+    assert convert_measurement(1, 'tbsp', 'oz') == pytest.approx(15 / 28.35)
+    assert convert_measurement(453.59, 'g', 'pt') == pytest.approx(453.59 / 480)
+
+
+def test_convert_measurement_same_unit():
+    """Test that converting a unit to itself returns the amount unchanged."""
+    assert convert_measurement(2.5, 'pinch', 'pinch') == 2.5
+
+
+def test_convert_measurement_unsupported():
+    """Test that unknown units raise a ValueError."""
+    with pytest.raises(ValueError):
+        convert_measurement(1, 'cup', 'pinch')
+
+
+def test_convert_many():
+    """Test converting a batch of amounts that share a unit pair."""
+    assert convert_many([1, 2, 0.5], 'cup', 'tbsp') == pytest.approx([16, 32, 8])
+    assert convert_many([], 'cup', 'ml') == []
+    with pytest.raises(ValueError):
+        convert_many([1], 'pinch', 'ml')
+
+
+def test_tokenize_recipe_quantities_and_units():
+    """Test that the tokenizer recognizes every quantity form and multi-word units."""
+    tokens = [token for token in tokenize_recipe('1 1/2 fluid ounces, 2½ cups 0.5g 3/4 tbsp') if token.kind != 'space']
+    assert [(token.kind, token.value) for token in tokens] == [
+        ('quantity', Fraction(3, 2)),
+        ('unit', 'fl oz'),
+        ('word', None),
+        ('quantity', Fraction(5, 2)),
+        ('unit', 'cup'),
+        ('quantity', Fraction(1, 2)),
+        ('unit', 'g'),
+        ('quantity', Fraction(3, 4)),
+        ('unit', 'tbsp'),
+    ]
+
+
+def test_process_recipe():
+    """Test converting quantities that are followed by a unit while leaving other text alone."""
+    assert process_recipe('1.5 cups of milk', 'ml') == '360.0 ml of milk'
+    assert process_recipe('1 1/2 fluid ounces of cream', 'ml') == '45.0 ml of cream'
+    assert process_recipe('2 eggs and ½ cup sugar', 'tbsp') == '2 eggs and 8.0 tbsp sugar'
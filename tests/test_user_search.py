@@ -0,0 +1,95 @@
+import pytest
+from app import create_app, db
+from app.migrations import upgrade_schema
+from app.models import Friendship, User
+
+# Fixture to set up the app in testing mode
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+
+    with app.app_context():
+        db.create_all()  # Create the tables
+        yield app
+        db.session.remove()
+        db.drop_all()  # Clean up
+
+# Fixture for the test client
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def setup_users(app):
+    names = ['Alice', 'alina', 'albert', 'bob', 'Alfred']
+    users = {name: User(username=name, email=f'{name.lower()}@example.com', password='hashed_password') for name in names}
+    users['admin'] = User(username='aladmin', email='root@example.com', password='hashed_password', role='admin')
+    db.session.add_all(users.values())
+    db.session.commit()
+
+    alice = users['Alice']
+    db.session.add_all([
+        Friendship(user_id=alice.id, friend_id=users['alina'].id, status='accepted'),
+        Friendship(user_id=alice.id, friend_id=users['albert'].id, status='pending'),
+        Friendship(user_id=users['Alfred'].id, friend_id=alice.id, status='blocked', is_blocked=True),
+    ])
+    db.session.commit()
+    return {name: user.id for name, user in users.items()}
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+def test_search_keys_set_on_insert(setup_users):
+    """Test that new users get case-folded search keys without the caller setting them."""
+    user = db.session.get(User, setup_users['Alice'])
+    assert user.username_key == 'alice'
+    assert user.email_key == 'alice@example.com'
+
+def test_typeahead_matches_prefix_with_statuses(client, setup_users):
+    """Test case-insensitive prefix matches, ordered by username, with relationship statuses."""
+    login(client, setup_users['Alice'])
+
+    response = client.get('/api/users/search?q=AL')
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    # Alice is excluded (herself), aladmin is an admin and Alfred has blocked her
+    assert [(result['username'], result['status']) for result in results] == [('albert', 'request_sent'), ('alina', 'friend')]
+
+    assert client.get('/api/users/search?q=').get_json()['results'] == []
+    assert len(client.get('/api/users/search?q=al&limit=1').get_json()['results']) == 1
+
+def test_list_users_renders_search_results(client, setup_users):
+    """Test the search page renders a bounded list of matches rather than every user."""
+    login(client, setup_users['bob'])
+
+    page = client.get('/users?q=ali').get_data(as_text=True)
+    assert 'Alice' in page and 'alina' in page
+    assert 'albert' not in page
+
+def test_admin_lookup_matches_email(client, setup_users):
+    """Test that the admin lookup also matches email prefixes and is admin-only."""
+    login(client, setup_users['admin'])
+    results = client.get('/admin/api/users/search?q=ROOT').get_json()['results']
+    assert [(result['username'], result['role']) for result in results] == [('aladmin', 'admin')]
+
+def test_admin_lookup_requires_admin(client, setup_users):
+    """Test that regular users cannot use the admin lookup."""
+    login(client, setup_users['bob'])
+    assert client.get('/admin/api/users/search?q=a').status_code == 403
+
+def test_upgrade_backfills_search_keys(setup_users):
+    """Test that adding the search columns to an older database fills them for existing users."""
+    db.session.execute(db.text('DROP INDEX ix_user_username_key'))
+    db.session.execute(db.text('DROP INDEX ix_user_email_key'))
+    db.session.execute(db.text('ALTER TABLE user DROP COLUMN username_key'))
+    db.session.execute(db.text('ALTER TABLE user DROP COLUMN email_key'))
+    db.session.commit()
+
+    applied = upgrade_schema()
+    assert 'added column user.username_key' in applied
+    db.session.expire_all()
+    assert db.session.get(User, setup_users['Alfred']).username_key == 'alfred'
@@ -1,6 +1,8 @@
 import pytest
 from app import create_app, db
-from app.models import User, Friendship, Post
+from app.models import User, Friendship, Post, PostLike, TimelineEntry
+from app.migrations import upgrade_schema
+from app.timeline import backfill_timelines, fan_out_post
 
 # Fixture to set up the app in testing mode
 @pytest.fixture
@@ -29,8 +31,8 @@ def setup_users_and_posts(app):
     db.session.add_all([user1, user2])
     db.session.commit()
 
-    # Create a friendship between the two users
-    friendship = Friendship(user_id=user1.id, friend_id=user2.id)
+    # Create an accepted friendship between the two users
+    friendship = Friendship(user_id=user1.id, friend_id=user2.id, status='accepted')
     db.session.add(friendship)
     db.session.commit()
 
@@ -40,6 +42,9 @@ def setup_users_and_posts(app):
     db.session.add_all([post1, post2])
     db.session.commit()
 
+    # Build the precomputed timelines for the posts created above
+    backfill_timelines()
+
     return user1, user2, [post1, post2]
 
 def test_view_posts(client, setup_users_and_posts):
@@ -73,3 +78,145 @@ def test_view_posts_no_posts(client, app):
         response = client.get('/view_posts')
         assert response.status_code == 200
         assert b'No posts to show' in response.data  # Check for the flash message
+
+def test_view_posts_keyset_pagination(client, app, setup_users_and_posts):
+    """Test that the feed is served one page at a time with like and report state per post."""
+    user1, user2, posts = setup_users_and_posts
+    app.config['FEED_PAGE_SIZE'] = 1
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user1.id)  # Mock the user session
+
+        # user1 likes user2's post and reports it
+        client.post(f'/like_post/{posts[1].id}')
+        client.post(f'/report_post/{posts[1].id}')
+
+        # The newest post comes first, with a link to the older page
+        first_page = client.get('/view_posts')
+        assert b'Hello from user2' in first_page.data
+        assert b'Hello from user1' not in first_page.data
+        assert b'1 Like' in first_page.data
+        assert b'Already Reported' in first_page.data
+        assert b'Older posts' in first_page.data
+
+        cursor = f"{posts[1].date_posted.isoformat()}_{posts[1].id}"
+        second_page = client.get('/view_posts', query_string={'cursor': cursor})
+        assert b'Hello from user1' in second_page.data
+        assert b'Hello from user2' not in second_page.data
+        assert b'Older posts' not in second_page.data
+
+        assert client.get('/view_posts', query_string={'cursor': 'garbage'}).status_code == 400
+
+def test_feed_pages_through_legacy_timestamps(client, app, setup_users_and_posts):
+    """Test that posts stored without microseconds are each shown once after upgrade-db."""
+    user1, user2, posts = setup_users_and_posts
+    app.config['FEED_PAGE_SIZE'] = 1
+    db.session.add_all([Post(message=f'Legacy {i}', user_id=user2.id, image_file='default.jpg') for i in range(3)])
+    db.session.commit()
+    # Older databases stored CURRENT_TIMESTAMP values: seconds only, several posts in the same second
+    db.session.execute(db.text("UPDATE post SET date_posted = '2024-11-27 11:02:07'"))
+    db.session.commit()
+
+    assert any(change.startswith('normalized') for change in upgrade_schema())
+    backfill_timelines()
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user1.id)
+    seen = []
+    url = '/view_posts'
+    for _ in range(10):
+        page = client.get(url).get_data(as_text=True)
+        seen += [message for message in ['Hello from user1', 'Hello from user2', 'Legacy 0', 'Legacy 1', 'Legacy 2'] if message in page]
+        if 'Older posts' not in page:
+            break
+        url = '/view_posts?cursor=' + page.split('/view_posts?cursor=')[1].split('"')[0]
+
+    assert sorted(seen) == ['Hello from user1', 'Hello from user2', 'Legacy 0', 'Legacy 1', 'Legacy 2']
+
+def test_like_and_report_counters(client, setup_users_and_posts):
+    """Test that liking, unliking and reporting keep the denormalized counters in step."""
+    user1, user2, posts = setup_users_and_posts
+    post_id = posts[1].id
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user1.id)  # Mock the user session
+
+        client.post(f'/like_post/{post_id}')
+        assert db.session.get(Post, post_id).like_count == 1
+
+        client.post(f'/like_post/{post_id}')  # Toggling removes the like
+        db.session.expire_all()
+        assert db.session.get(Post, post_id).like_count == 0
+
+        client.post(f'/report_post/{post_id}')
+        client.post(f'/report_post/{post_id}')  # A second report by the same user is ignored
+        db.session.expire_all()
+        assert db.session.get(Post, post_id).reports == 1
+
+def test_reconcile_post_counters(app, setup_users_and_posts):
+    """Test that the reconciliation command recomputes counters from the like and report rows."""
+    user1, user2, posts = setup_users_and_posts
+
+    # Rows written without touching the counters, e.g. by an older version of the app
+    db.session.add(PostLike(post_id=posts[0].id, user_id=user2.id))
+    posts[0].reported_by.append(user2)
+    posts[1].like_count = 5
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['reconcile-post-counters'])
+    assert 'Reconciled counters on 2 post(s).' in result.output
+
+    db.session.expire_all()
+    assert (posts[0].like_count, posts[0].reports) == (1, 1)
+    assert (posts[1].like_count, posts[1].reports) == (0, 0)
+
+def test_block_prunes_timeline(client, setup_users_and_posts):
+    """Test that blocking a friend removes their posts from the feed."""
+    user1, user2, posts = setup_users_and_posts
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user1.id)  # Mock the user session
+
+        client.post(f'/block_friend/{user2.id}')
+        response = client.get('/view_posts')
+        assert b'Hello from user1' in response.data
+        assert b'Hello from user2' not in response.data
+        assert TimelineEntry.query.filter_by(user_id=user2.id, author_id=user1.id).count() == 0
+
+def test_accepting_request_backfills_timeline(client, app):
+    """Test that accepting a friend request brings the new friend's existing posts into the feed."""
+    user1 = User(username='user1', email='user1@example.com', password='hashed_password')
+    user2 = User(username='user2', email='user2@example.com', password='hashed_password')
+    db.session.add_all([user1, user2])
+    db.session.commit()
+    db.session.add(Post(message='Older post from user1', user_id=user1.id, image_file='default.jpg'))
+    friend_request = Friendship(user_id=user1.id, friend_id=user2.id, status='pending')
+    db.session.add(friend_request)
+    db.session.commit()
+
+    with client:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user2.id)  # Mock the user session
+
+        assert b'Older post from user1' not in client.get('/view_posts').data
+        client.post(f'/approve_friend_request/{friend_request.id}')
+        assert b'Older post from user1' in client.get('/view_posts').data
+
+def test_fan_out_post(app, setup_users_and_posts):
+    """Test that a new post is pushed into the author's and each accepted friend's timeline."""
+    user1, user2, posts = setup_users_and_posts
+    outsider = User(username='user3', email='user3@example.com', password='hashed_password')
+    db.session.add(outsider)
+    db.session.commit()
+
+    post = Post(message='Fresh post', user_id=user2.id, image_file='default.jpg')
+    db.session.add(post)
+    db.session.flush()
+    fan_out_post(post)
+    db.session.commit()
+
+    readers = {entry.user_id for entry in TimelineEntry.query.filter_by(post_id=post.id)}
+    assert readers == {user1.id, user2.id}